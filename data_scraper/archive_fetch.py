@@ -0,0 +1,85 @@
+import io
+import tarfile
+import zipfile
+from typing import BinaryIO, Callable, Iterator, Optional, Tuple
+
+from github_pages import IGNORED_ROOT_FOLDERS
+
+GITHUB_ARCHIVE_URL = "https://codeload.github.com/"
+
+TAR_FORMAT = "tar"
+ZIP_FORMAT = "zip"
+ARCHIVE_FORMATS = (TAR_FORMAT, ZIP_FORMAT)
+
+
+def archive_url(
+    repo_path: str,
+    branch_name: str,
+    archive_format: str = TAR_FORMAT,
+    base_url: str = GITHUB_ARCHIVE_URL,
+) -> str:
+    """
+    Builds the url of the archive (tarball or zipball) of a branch of a repository.
+    :param repo_path: the path to the repository (i.e. {user}/{repository})
+    :param branch_name: the name of its branch
+    :param archive_format: either 'tar' or 'zip'
+    :param base_url: the base url serving repository archives
+    :return: the url of the archive
+    """
+    extension = "tar.gz" if archive_format == TAR_FORMAT else "zip"
+    return base_url + repo_path + "/" + extension + "/refs/heads/" + branch_name
+
+
+def _strip_root_folder(member_name: str) -> Optional[str]:
+    """
+    GitHub puts all files of an archive in a single {repository}-{branch} folder, which we leave out of the path.
+    :param member_name: the name of the file in the archive
+    :return: the path of the file in the repository, or None if it should be skipped
+    """
+    parts = member_name.split("/", 1)
+    if len(parts) < 2 or parts[1] == "":
+        return None
+
+    path = parts[1]
+    if path.split("/", 1)[0] in IGNORED_ROOT_FOLDERS:
+        return None
+    return path
+
+
+def iter_archive_files(
+    stream: BinaryIO,
+    archive_format: str = TAR_FORMAT,
+    keep: Callable[[str, int], bool] = lambda path, size: True,
+) -> Iterator[Tuple[str, bytes]]:
+    """
+    Goes through the files of a repository archive without unpacking it to disk.
+    A tarball is read front to back straight from the stream, so only one file is held in memory at a time.
+    A zipball keeps its index at the end, so it has to be buffered in memory first.
+    :param stream: the (response) stream the archive is read from
+    :param archive_format: either 'tar' or 'zip'
+    :param keep: called with the path and size in bytes of every file, only the files for which it returns True
+        are read
+    :return: an iterator of (path, content) tuples
+    """
+    if archive_format == TAR_FORMAT:
+        with tarfile.open(fileobj=stream, mode="r|gz") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                path = _strip_root_folder(member.name)
+                if path is None or not keep(path, member.size):
+                    continue
+                yield path, archive.extractfile(member).read()
+
+    elif archive_format == ZIP_FORMAT:
+        with zipfile.ZipFile(io.BytesIO(stream.read())) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                path = _strip_root_folder(info.filename)
+                if path is None or not keep(path, info.file_size):
+                    continue
+                yield path, archive.read(info)
+
+    else:
+        raise ValueError(f"Unknown archive format: {archive_format}")
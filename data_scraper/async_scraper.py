@@ -0,0 +1,408 @@
+import asyncio
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Mapping, Optional, Tuple, Union
+
+import file_prefilter
+import metrics
+from content_decode import decode_content
+from crawl_frontier import CrawlFrontier
+from file_prefilter import is_excluded_folder, should_fetch
+from github_pages import (
+    GITHUB_BASE_URL,
+    GITHUB_RAW_URL,
+    IGNORED_ROOT_FOLDERS,
+    parse_latest_commit,
+    parse_repository_root,
+    parse_tree_listing,
+    raw_file_url,
+    repository_url,
+    tree_url,
+)
+from http_session import (
+    DEFAULT_BACKOFF_FACTOR,
+    DEFAULT_BACKOFF_JITTER,
+    DEFAULT_RETRIES,
+    BinaryResponse,
+    ResponseTooLarge,
+    async_get_text,
+    create_async_session,
+)
+from incremental import IncrementalState
+from language_classifier import classify, find_file_type
+from rate_limiter import DEFAULT_MAX_RATE, DEFAULT_RATE, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# The kinds of jobs that are put on the crawl queue
+REPOSITORY_JOB = "repository"
+TREE_JOB = "tree"
+FILE_JOB = "file"
+
+
+class AsyncScraper:
+    """
+    Asynchronous crawl engine used as an alternative to the sequential scrape functions in scraper.py.
+    The repositories are walked breadth-first: every page or raw file is a job on one shared queue,
+    which is drained by a bounded pool of workers. Each host gets its own limit on concurrent requests
+    so that github.com and raw.githubusercontent.com are not hammered beyond what they tolerate.
+
+    Attributes:
+    write -> Callable: called as write(repo_path, branch_name, file_path, language, data) for every file.
+    on_failure -> Callable: called as on_failure(url, status, exception, job) for every page that could not be
+        scraped, where job is the (kind, repo_path, branch_name, path) tuple that can be used to retry it.
+    workers -> int: the number of concurrent workers draining the queue.
+    per_host -> int: the maximum number of requests in flight per host. The actual limit adapts to the responses
+        of the host (see rate_limiter.py), together with the amount of requests per second (starting at rate, at
+        most max_rate).
+    base_url -> str: the base url of the GitHub web interface (can be pointed at a local fixture server).
+    raw_url -> str: the base url serving raw file contents.
+    retries -> int: the amount of times a failed request is retried (with jittered exponential backoff).
+    frontier -> CrawlFrontier: if given, the progress of the crawl is persisted so that it can be resumed.
+    incremental -> IncrementalState: if given, only repositories and files that changed since the last run are fetched.
+    """
+
+    def __init__(
+        self,
+        write: Callable,
+        on_failure: Optional[Callable] = None,
+        workers: int = 32,
+        per_host: int = 8,
+        max_rate: float = DEFAULT_MAX_RATE,
+        rate: float = DEFAULT_RATE,
+        base_url: str = GITHUB_BASE_URL,
+        raw_url: str = GITHUB_RAW_URL,
+        timeout: float = 60,
+        retries: int = DEFAULT_RETRIES,
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+        backoff_jitter: float = DEFAULT_BACKOFF_JITTER,
+        frontier: Optional[CrawlFrontier] = None,
+        incremental: Optional[IncrementalState] = None,
+    ):
+        self.write = write
+        self.on_failure = on_failure
+        self.workers = workers
+        self.per_host = per_host
+        self.max_rate = max_rate
+        self.rate = rate
+        self.base_url = base_url
+        self.raw_url = raw_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        self.frontier = frontier
+        self.incremental = incremental
+
+        self._queue = None
+        self._session = None
+        self._rate_limiter = None
+        self._pending = defaultdict(int)
+        self._branches = {}
+        # Repositories with a job that failed in this run, they are not marked as done
+        self._failed = set()
+        # The (kind, path) of the jobs that were done before, per resumed repository
+        self._done = {}
+        # Repositories that are scraped as a whole (or resumed), only those can be marked as done in the frontier
+        self._whole = set()
+        # All database writes go through a single thread, so the event loop never blocks on disk
+        self._write_executor = None
+
+    def _enqueue(self, job: tuple, record: bool = True) -> None:
+        # A resumed page finds its files and folders again, the ones that were done before are not fetched twice
+        done = self._done.get(job[1])
+        if done is not None and (job[0], job[3]) in done:
+            return
+        if record and self.frontier is not None:
+            self.frontier.add(job, self._job_url(job))
+        self._pending[job[1]] += 1
+        self._queue.put_nowait(job)
+
+    def _enqueue_repository(self, repo_path: str) -> None:
+        self._whole.add(repo_path)
+        if self.frontier is None:
+            self._enqueue((REPOSITORY_JOB, repo_path, None, None))
+            return
+
+        unfinished_jobs = self.frontier.resume(repo_path)
+        if unfinished_jobs is None:
+            self.frontier.start_repository(repo_path)
+            self._enqueue((REPOSITORY_JOB, repo_path, None, None))
+        elif len(unfinished_jobs) == 0:
+            # Everything was handled, we just did not get to mark the repository as done
+            self.frontier.finish_repository(repo_path)
+        else:
+            logger.info(f"Resuming {repo_path} with {len(unfinished_jobs)} unfinished jobs")
+            self._done[repo_path] = self.frontier.done_jobs(repo_path)
+            for job in unfinished_jobs:
+                self._enqueue(job, record=False)
+
+    def _fail(
+        self,
+        url: str,
+        status: Optional[int] = None,
+        exception: Optional[BaseException] = None,
+        job: Optional[tuple] = None,
+    ) -> None:
+        if self.on_failure is not None:
+            self.on_failure(url, status, exception, job)
+
+    def _job_url(self, job: tuple) -> str:
+        job_type, repo_path, branch_name, path = job
+        if job_type == REPOSITORY_JOB:
+            return repository_url(repo_path, self.base_url)
+        elif job_type == TREE_JOB:
+            return tree_url(repo_path, branch_name, path, self.base_url)
+        return raw_file_url(repo_path, branch_name, path, self.raw_url)
+
+    async def _fetch(
+        self,
+        job: tuple,
+        headers: Optional[Mapping[str, str]] = None,
+        max_size: Optional[int] = None,
+        raw: bool = False,
+    ) -> Tuple[int, Optional[Union[str, bytes]], Mapping[str, str]]:
+        """
+        Fetches the page of a job, respecting the rate limit of its host.
+        :param job: the job to fetch the page of
+        :param headers: extra headers to send with the request
+        :param max_size: the maximum size of the response (see async_get_text)
+        :param raw: toggle whether to return the body as bytes (see async_get_text)
+        :return: the status code, the body (None if the request did not succeed) and the headers of the response
+        """
+        url = self._job_url(job)
+        status, text, response_headers = await async_get_text(
+            self._session,
+            url,
+            retries=self.retries,
+            backoff_factor=self.backoff_factor,
+            backoff_jitter=self.backoff_jitter,
+            rate_limiter=self._rate_limiter,
+            headers=headers,
+            max_size=max_size,
+            raw=raw,
+        )
+        if text is None:
+            self._fail(url, status, job=job)
+        return status, text, response_headers
+
+    async def _fetch_text(self, job: tuple) -> Optional[str]:
+        return (await self._fetch(job))[1]
+
+    async def _scrape_repository(self, repo_path: str) -> bool:
+        html = await self._fetch_text((REPOSITORY_JOB, repo_path, None, None))
+        if html is None:
+            return False
+
+        main_branch, entries = parse_repository_root(html)
+        self._branches[repo_path] = main_branch
+
+        if self.incremental is not None:
+            commit_id = parse_latest_commit(html)
+            if not self.incremental.start_repository(repo_path, main_branch, commit_id):
+                logger.info(f"{repo_path} did not change since it was last scraped")
+                return True
+
+        languages = classify(name for name, is_folder in entries)
+        for (name, is_folder), language in zip(entries, languages):
+            if is_folder:
+                if name not in IGNORED_ROOT_FOLDERS and not is_excluded_folder(name):
+                    self._enqueue((TREE_JOB, repo_path, main_branch, name))
+            elif language is not None and should_fetch(name, repo_path):
+                self._enqueue((FILE_JOB, repo_path, main_branch, name))
+        return True
+
+    async def _scrape_tree(self, repo_path: str, branch_name: str, tree_path: str) -> bool:
+        html = await self._fetch_text((TREE_JOB, repo_path, branch_name, tree_path))
+        if html is None:
+            return False
+
+        entries = parse_tree_listing(html)
+        # Files we do not scrape are left out here, so they never take up a place in the queue or the frontier
+        languages = classify(name for name, is_folder in entries)
+        for (name, is_folder), language in zip(entries, languages):
+            path = tree_path + "/" + name
+            if is_folder:
+                if not is_excluded_folder(name):
+                    self._enqueue((TREE_JOB, repo_path, branch_name, path))
+            elif language is not None and should_fetch(path, repo_path):
+                self._enqueue((FILE_JOB, repo_path, branch_name, path))
+        return True
+
+    async def _scrape_file(self, repo_path: str, branch_name: str, file_path: str) -> bool:
+        valid_file_type, file_type = find_file_type(file_path)
+
+        # Checked again, as the byte budget of the repository may have run out since the file was queued
+        if not valid_file_type or not should_fetch(file_path, repo_path):
+            return True
+
+        headers = None
+        if self.incremental is not None:
+            headers = self.incremental.conditional_headers(repo_path, file_path)
+
+        try:
+            status, content, response_headers = await self._fetch(
+                (FILE_JOB, repo_path, branch_name, file_path),
+                headers,
+                file_prefilter.fetch_limit(repo_path),
+                raw=True,
+            )
+        except (ResponseTooLarge, BinaryResponse) as e:
+            logger.debug(f"Skipping {e}")
+            metrics.count(metrics.SKIPPED_COUNTER)
+            return True
+        if content is None:
+            return False
+        # A 304 means the file did not change since we last fetched it
+        if status == 304:
+            return True
+        if not file_prefilter.accept_content(repo_path, len(content)):
+            return True
+        data, encoded = decode_content(content)
+
+        await asyncio.get_running_loop().run_in_executor(
+            self._write_executor,
+            self.write,
+            repo_path,
+            branch_name,
+            file_path,
+            file_type,
+            data,
+            encoded,
+        )
+        if self.incremental is not None:
+            self.incremental.record_file(
+                repo_path, branch_name, file_path, response_headers
+            )
+        return True
+
+    async def _run_job(self, job: tuple) -> bool:
+        """
+        :param job: the job to run
+        :return: False if the page of the job could not be fetched (it was already reported to on_failure)
+        """
+        job_type, repo_path, branch_name, path = job
+        if job_type == REPOSITORY_JOB:
+            return await self._scrape_repository(repo_path)
+        elif job_type == TREE_JOB:
+            return await self._scrape_tree(repo_path, branch_name, path)
+        return await self._scrape_file(repo_path, branch_name, path)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            repo_path = job[1]
+            if self.frontier is not None:
+                self.frontier.start(job)
+            try:
+                succeeded = await self._run_job(job)
+            except Exception as e:
+                url = self._job_url(job)
+                logger.warning(f"{url} failed search: {e}")
+                self._fail(url, exception=e, job=job)
+                succeeded = False
+            try:
+                if not succeeded:
+                    self._failed.add(repo_path)
+                if self.frontier is not None:
+                    if succeeded:
+                        self.frontier.finish(job)
+                    else:
+                        self.frontier.fail(job)
+            finally:
+                self._pending[repo_path] -= 1
+                if self._pending[repo_path] == 0:
+                    del self._pending[repo_path]
+                    self._done.pop(repo_path, None)
+                    file_prefilter.finish_repository(repo_path)
+                    completed = repo_path not in self._failed
+                    self._failed.discard(repo_path)
+                    whole = repo_path in self._whole
+                    self._whole.discard(repo_path)
+                    if completed:
+                        # Single retried jobs say nothing about the rest of the repository, a later resume finds
+                        # out whether anything of it is left
+                        if self.frontier is not None and whole:
+                            self.frontier.finish_repository(repo_path)
+                        logger.info(f"{repo_path} complete")
+                    else:
+                        # Not marked as done, so a resumed crawl hands out its failed jobs again
+                        logger.warning(f"{repo_path} incomplete, some of its pages or files failed")
+                    if self.incremental is not None:
+                        self.incremental.finish_repository(
+                            repo_path, self._branches.get(repo_path), completed
+                        )
+                self._queue.task_done()
+
+    async def scrape(
+        self, repo_paths: Iterable[str], jobs: Iterable[tuple] = ()
+    ) -> None:
+        """
+        Scrapes all the given repositories concurrently and returns once every job has been handled.
+        With a frontier, repositories that were completed before are skipped and unfinished ones are resumed.
+        :param repo_paths: the paths to the repositories (i.e. {user}/{repository})
+        :param jobs: single pages or raw files to scrape as well, i.e. to retry the ones that failed before
+        :return: None
+        """
+        self._queue = asyncio.Queue()
+        self._rate_limiter = RateLimiter(
+            max_concurrency=self.per_host,
+            rate=min(self.rate, self.max_rate),
+            max_rate=self.max_rate,
+        )
+        self._pending = defaultdict(int)
+        self._branches = {}
+        self._failed = set()
+        self._done = {}
+        self._whole = set()
+
+        completed = set()
+        if self.frontier is not None:
+            completed = self.frontier.completed_repositories()
+
+        for repo_path in repo_paths:
+            if repo_path in completed:
+                logger.info(f"Skipping {repo_path}, it was already scraped")
+                continue
+            self._enqueue_repository(repo_path)
+        for job in jobs:
+            if job[0] == REPOSITORY_JOB:
+                self._whole.add(job[1])
+            self._enqueue(job)
+
+        self._write_executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            # Connections are kept alive and reused, so one pooled connection per in-flight request is enough
+            session = create_async_session(
+                pool_maxsize=self.workers, per_host=self.per_host, timeout=self.timeout
+            )
+            async with session:
+                self._session = session
+                workers = [
+                    asyncio.create_task(self._worker()) for _ in range(self.workers)
+                ]
+                try:
+                    await self._queue.join()
+                finally:
+                    for worker in workers:
+                        worker.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
+        finally:
+            self._session = None
+            self._write_executor.shutdown(wait=True)
+
+
+def scrape_repositories_async(
+    repo_paths: Iterable[str], write: Callable, jobs: Iterable[tuple] = (), **kwargs
+):
+    """
+    Runs the asynchronous crawl engine over the given repositories until all of them are scraped.
+    :param repo_paths: the paths to the repositories (i.e. {user}/{repository})
+    :param write: the function used to save every scraped file
+    :param jobs: single pages or raw files to scrape as well (see AsyncScraper.scrape)
+    :param kwargs: any other settings of the AsyncScraper (workers, per_host, base_url, ...)
+    :return: None
+    """
+    scraper = AsyncScraper(write=write, **kwargs)
+    asyncio.run(scraper.scrape(list(repo_paths), list(jobs)))
@@ -0,0 +1,121 @@
+import argparse
+import gc
+import logging
+import random
+import tracemalloc
+from datetime import datetime
+
+from scraped_repo import Language, RepoFile, ScrapedRepo
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(filename)s:%(lineno)d]:  %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+
+class DictRepoFile:
+    """
+    The file representation before the compact one: a dict-backed object holding its own content string.
+    """
+
+    def __init__(self, path, branch, raw_content, last_commit_date, language):
+        self.path = path
+        self.branch = branch
+        self.raw_content = raw_content
+        self.last_commit_date = last_commit_date
+        self.language = language
+
+
+def generate_files(num_files: int, mean_size: int, seed: int = 0):
+    """
+    Generates synthetic files, with sizes drawn around the mean size.
+    Every file gets its own copy of the branch name, as it would when parsed from a page.
+    :param num_files: the amount of files to generate
+    :param mean_size: the mean size of a file, in characters
+    :param seed: the seed of the random generator
+    :return: an iterator of (path, branch, content) tuples
+    """
+    rng = random.Random(seed)
+    line = "    value = compute(value, index)  # some code\n"
+    for i in range(num_files):
+        size = max(1, int(rng.expovariate(1 / mean_size)))
+        content = (line * (size // len(line) + 1))[:size]
+        yield f"src/module_{i // 100}/file_{i}.py", "".join(["ma", "in"]), content
+
+
+def measure(build) -> int:
+    """
+    :param build: function that builds the model and returns it
+    :return: the amount of memory held by the model, in bytes
+    """
+    gc.collect()
+    tracemalloc.start()
+    model = build()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del model
+    gc.collect()
+    return used
+
+
+def benchmark_memory(num_files: int, mean_size: int) -> None:
+    """
+    Compares the memory used by the dict-backed file model with the compact ScrapedRepo model.
+    :param num_files: the amount of files in the synthetic repository
+    :param mean_size: the mean size of a file, in characters
+    :return: None
+    """
+    now = datetime.now()
+    content_size = sum(len(content) for _, _, content in generate_files(num_files, mean_size))
+
+    def build_dict_model():
+        files = {}
+        for path, branch, content in generate_files(num_files, mean_size):
+            files[path] = DictRepoFile(path, branch, content, now, Language.Python)
+        return files
+
+    def build_compact_model():
+        repo = ScrapedRepo("monorepo", now, "user/monorepo", 0)
+        for path, branch, content in generate_files(num_files, mean_size):
+            repo.add_file(RepoFile(path, branch, content, now, Language.Python), path)
+        return repo
+
+    logger.info(f"{num_files} files, {content_size / (1024 * 1024):.1f} MB of content")
+    results = [("dict", measure(build_dict_model)), ("compact", measure(build_compact_model))]
+    for name, used in results:
+        overhead = (used - content_size) / num_files
+        logger.info(
+            f"{name:>7}: {used / (1024 * 1024):8.1f} MB ({overhead:6.1f} bytes per file on top of the content)"
+        )
+    logger.info(f"The compact model uses {1 - results[1][1] / results[0][1]:.1%} less memory")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the memory used by the in-memory repository model."
+    )
+
+    parser.add_argument(
+        "--files",
+        "-n",
+        type=int,
+        required=False,
+        default=100000,
+        help="The number of files in the synthetic repository.",
+    )
+
+    parser.add_argument(
+        "--mean-size",
+        type=int,
+        required=False,
+        default=1000,
+        help="The mean size of a file, in characters.",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    benchmark_memory(args.files, args.mean_size)
@@ -0,0 +1,109 @@
+import argparse
+import glob
+import logging
+import os
+import time
+
+from github_pages import (
+    AUTO_BACKEND,
+    JSON_BACKEND,
+    LXML_BACKEND,
+    SOUP_BACKEND,
+    PageFormatError,
+    lxml,
+    parse_repository_root,
+    parse_tree_listing,
+)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(filename)s:%(lineno)d]:  %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+
+def parse_page(html: str, is_tree_page: bool, backend: str):
+    if is_tree_page:
+        return parse_tree_listing(html, backend)
+    return parse_repository_root(html, backend)[1]
+
+
+def benchmark_parsers(page_paths: list, repeat: int) -> None:
+    """
+    Measures the CPU time every parser backend spends per page on the saved pages.
+    Pages with 'tree' in their file name are parsed as folder pages, the others as landing pages.
+    :param page_paths: the paths to the saved pages (see save_page in scraper.py)
+    :param repeat: the amount of times every page is parsed per backend
+    :return: None
+    """
+    pages = []
+    for page_path in page_paths:
+        with open(page_path, encoding="utf8") as f:
+            pages.append((page_path, f.read(), "tree" in os.path.basename(page_path)))
+
+    backends = [JSON_BACKEND, SOUP_BACKEND, AUTO_BACKEND]
+    if lxml is not None:
+        backends.insert(1, LXML_BACKEND)
+
+    reference = {}
+    for backend in backends:
+        parsed = 0
+        cpu_time = 0.0
+        for page_path, html, is_tree_page in pages:
+            try:
+                start_time = time.process_time()
+                for _ in range(repeat):
+                    entries = parse_page(html, is_tree_page, backend)
+                cpu_time += time.process_time() - start_time
+            except PageFormatError:
+                logger.warning(f"{backend}: {page_path} has no embedded listing, skipped")
+                continue
+
+            parsed += 1
+            # Every backend should find the same listing as the one before it
+            if page_path not in reference:
+                reference[page_path] = entries
+            elif reference[page_path] != entries:
+                logger.warning(f"{backend}: listing of {page_path} differs")
+
+        if parsed == 0:
+            continue
+        per_page_ms = 1000 * cpu_time / (parsed * repeat)
+        logger.info(f"{backend:>5}: {per_page_ms:8.3f} ms CPU per page ({parsed} pages)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the parser backends on saved GitHub pages."
+    )
+
+    parser.add_argument(
+        "--pages",
+        type=str,
+        required=False,
+        default="env/raw_page_data/*.txt",
+        help="Glob pattern of the saved pages to parse.",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        "-n",
+        type=int,
+        required=False,
+        default=20,
+        help="The number of times every page is parsed per backend.",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+    saved_pages = sorted(glob.glob(args.pages))
+
+    # Input Validation
+    if len(saved_pages) == 0:
+        raise ValueError(
+            "No saved pages found, use save_page in scraper.py to save some first."
+        )
+
+    benchmark_parsers(saved_pages, args.repeat)
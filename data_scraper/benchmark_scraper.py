@@ -0,0 +1,237 @@
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+import file_prefilter
+import http_session
+import metrics
+import scraper
+from db_writer import DatabaseWriter, set_writer
+from replay_fixtures import ReplayServer
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(filename)s:%(lineno)d]:  %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+SEQUENTIAL_MODE = "sequential"
+CONCURRENT_MODE = "concurrent"
+PROCESSES_MODE = "processes"
+
+# Used as the request rate when rate limiting is off, high enough that the limiter never waits
+UNLIMITED_RATE = 1e9
+
+
+def benchmark_scraper(
+    fixtures: str,
+    mode: str = CONCURRENT_MODE,
+    workers: int = 32,
+    per_host: int = 8,
+    processes: int = 4,
+    latency_ms: float = 0,
+    jitter_ms: float = 0,
+    error_rate: float = 0,
+    rate_limit: bool = False,
+    seed: int = 0,
+) -> dict:
+    """
+    Scrapes the repositories of a fixture archive from a local replay server into a temporary database, and
+    measures how fast that goes.
+    :param fixtures: the path of the fixture archive (see replay_fixtures.py)
+    :param mode: 'sequential', 'concurrent' (the asynchronous crawl engine) or 'processes'
+    :param workers: the number of concurrent workers of the asynchronous crawl engine
+    :param per_host: the maximum number of concurrent requests per host of the asynchronous crawl engine
+    :param processes: the number of worker processes in 'processes' mode
+    :param latency_ms: the delay of every response of the replay server in milliseconds
+    :param jitter_ms: the maximum random delay in milliseconds added to every response
+    :param error_rate: the fraction of the requests the replay server answers with a 503
+    :param rate_limit: toggle whether to keep the rate limiter on (off by default, it would dominate the result)
+    :param seed: the seed of the latency jitter and injected errors
+    :return: the results of the run
+    """
+    async_settings = {"workers": workers, "per_host": per_host}
+    if not rate_limit:
+        async_settings.update(rate=UNLIMITED_RATE, max_rate=UNLIMITED_RATE)
+    http_session.configure_rate_limiter(enabled=rate_limit)
+
+    server = ReplayServer(
+        fixtures, latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate, seed=seed
+    )
+    with server, tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, "benchmark.db")
+        scraper.setup_database(db_path)
+        writer = DatabaseWriter(db_path)
+        set_writer(writer)
+        http_session.set_redirects(server.redirects())
+        metrics.reset_metrics()
+
+        start = time.perf_counter()
+        try:
+            scraper.scrape_repositories(
+                server.repositories,
+                concurrent=mode == CONCURRENT_MODE,
+                processes=processes if mode == PROCESSES_MODE else 0,
+                **async_settings,
+            )
+        finally:
+            # The files only count once they are in the database
+            writer.close()
+            elapsed = time.perf_counter() - start
+            set_writer(None)
+            http_session.set_redirects(None)
+
+        connection = sqlite3.connect(db_path)
+        files, size = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(b.Size), 0) "
+            "FROM SCRAPED_PAGE p LEFT JOIN PAGE_BLOB b ON b.Hash = p.Blob_Hash;"
+        ).fetchone()
+        failures = connection.execute("SELECT COUNT(*) FROM FAILED_SCRAPE;").fetchone()[0]
+        connection.close()
+
+    return {
+        "mode": mode,
+        "repositories": len(server.repositories),
+        "files": files,
+        "bytes": size,
+        "requests": server.requests,
+        "injected_errors": server.errors,
+        "failures": failures,
+        "seconds": elapsed,
+        "files_per_second": files / elapsed,
+        "requests_per_second": server.requests / elapsed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the scraper against a local replay of recorded GitHub responses."
+    )
+
+    parser.add_argument(
+        "--fixtures",
+        "-f",
+        type=str,
+        required=False,
+        default="fixtures.zip",
+        help="The fixture archive recorded with replay_fixtures.py.",
+    )
+
+    parser.add_argument(
+        "--mode",
+        "-m",
+        type=str,
+        required=False,
+        default=CONCURRENT_MODE,
+        choices=[SEQUENTIAL_MODE, CONCURRENT_MODE, PROCESSES_MODE],
+        help="Which scraper to benchmark.",
+    )
+
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        required=False,
+        default=32,
+        help="The number of concurrent workers (concurrent mode).",
+    )
+
+    parser.add_argument(
+        "--per-host",
+        type=int,
+        required=False,
+        default=8,
+        help="The maximum number of concurrent requests per host (concurrent mode).",
+    )
+
+    parser.add_argument(
+        "--processes",
+        "-P",
+        type=int,
+        required=False,
+        default=4,
+        help="The number of worker processes (processes mode).",
+    )
+
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        required=False,
+        default=50,
+        help="The delay of every response in milliseconds.",
+    )
+
+    parser.add_argument(
+        "--jitter-ms",
+        type=float,
+        required=False,
+        default=20,
+        help="The maximum random delay in milliseconds added to every response.",
+    )
+
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        required=False,
+        default=0,
+        help="The fraction of the requests that is answered with a 503.",
+    )
+
+    parser.add_argument(
+        "--max-file-size",
+        type=int,
+        required=False,
+        default=file_prefilter.DEFAULT_MAX_FILE_SIZE,
+        help="Files of this many bytes or more are not downloaded (0 for no limit, the default).",
+    )
+
+    parser.add_argument(
+        "--rate-limit",
+        action="store_true",
+        help="Toggle whether to keep the rate limiter on.",
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        required=False,
+        default=0,
+        help="The seed of the latency jitter and injected errors.",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Input Validation
+    if not os.path.exists(args.fixtures):
+        raise ValueError("The fixture archive provided does not exist.")
+
+    file_prefilter.configure_prefilter(max_file_size=args.max_file_size)
+    results = benchmark_scraper(
+        args.fixtures,
+        mode=args.mode,
+        workers=args.workers,
+        per_host=args.per_host,
+        processes=args.processes,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        seed=args.seed,
+    )
+
+    logger.info(
+        f"{results['mode']}: {results['files']} files ({results['bytes'] / (1024 * 1024):.1f} MB) "
+        f"from {results['repositories']} repositories in {results['seconds']:.2f} seconds"
+    )
+    logger.info(
+        f"{results['files_per_second']:.1f} files/s, {results['requests_per_second']:.1f} requests/s, "
+        f"{results['injected_errors']} injected errors, {results['failures']} failed pages"
+    )
+    if args.mode != PROCESSES_MODE:
+        logger.info(metrics.format_snapshot(metrics.get_metrics().snapshot()))
@@ -0,0 +1,126 @@
+import argparse
+import logging
+import os
+import sqlite3
+from typing import Optional, Tuple
+
+import xxhash
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(filename)s:%(lineno)d]:  %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+INSERT_BLOB = "INSERT OR IGNORE INTO PAGE_BLOB (Hash, Size, Data) VALUES (?, ?, ?);"
+
+# Every page with its content, whether it is stored in a blob or still inline (rows from before the blob store)
+PAGES_WITH_DATA_QUERY = (
+    "SELECT p.ID, p.Repo_Name, p.Branch, p.Path, p.Date_Scraped, p.Language_ID, p.Blob_Hash, "
+    "COALESCE(b.Data, p.Data) AS Data "
+    "FROM SCRAPED_PAGE p LEFT JOIN PAGE_BLOB b ON b.Hash = p.Blob_Hash"
+)
+
+
+def hash_content(data: str, encoded: Optional[bytes] = None) -> Tuple[str, bytes]:
+    """
+    Computes the key a file is stored under in the blob table.
+    :param data: the content of the file
+    :param encoded: the content encoded as utf-8, if the caller already has it (i.e. the body it was decoded from)
+    :return: the xxh3-128 hex digest of the content, and the content encoded as utf-8
+    """
+    if encoded is None:
+        encoded = data.encode("utf-8", errors="surrogatepass")
+    return xxhash.xxh3_128_hexdigest(encoded), encoded
+
+
+def setup_blob_tables(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the blob table if it does not exist yet, and adds the Blob_Hash column to databases set up before it.
+    :param cursor: a cursor on the scraper database
+    :return: None
+    """
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS PAGE_BLOB("
+        "Hash           TEXT    PRIMARY KEY NOT NULL,"
+        "Size           INTEGER NOT NULL,"
+        "Data           LONGTEXT"
+        ");"
+    )
+
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(SCRAPED_PAGE);")]
+    if "Blob_Hash" not in columns:
+        cursor.execute("ALTER TABLE SCRAPED_PAGE ADD COLUMN Blob_Hash TEXT;")
+
+
+def migrate_to_blobs(db_path: str, batch_size: int = 1000) -> None:
+    """
+    Moves the content of pages that were stored inline into the blob table, and removes blobs no page refers to.
+    :param db_path: the path to the scraper database
+    :param batch_size: the amount of pages moved per commit
+    :return: None
+    """
+    connection = sqlite3.connect(db_path)
+    cursor = connection.cursor()
+    setup_blob_tables(cursor)
+
+    moved = 0
+    while True:
+        rows = cursor.execute(
+            "SELECT ID, Data FROM SCRAPED_PAGE WHERE Blob_Hash IS NULL AND Data IS NOT NULL LIMIT ?;",
+            (batch_size,),
+        ).fetchall()
+        if len(rows) == 0:
+            break
+
+        for page_id, data in rows:
+            blob_hash, encoded = hash_content(data)
+            cursor.execute(INSERT_BLOB, (blob_hash, len(encoded), data))
+            cursor.execute(
+                "UPDATE SCRAPED_PAGE SET Blob_Hash = ?, Data = NULL WHERE ID = ?;",
+                (blob_hash, page_id),
+            )
+        connection.commit()
+        moved += len(rows)
+        logger.info(f"Moved {moved} pages into the blob table")
+
+    cursor.execute(
+        "DELETE FROM PAGE_BLOB WHERE Hash NOT IN "
+        "(SELECT Blob_Hash FROM SCRAPED_PAGE WHERE Blob_Hash IS NOT NULL);"
+    )
+    logger.info(f"Removed {cursor.rowcount} blobs that were no longer used")
+    connection.commit()
+
+    pages, blobs = cursor.execute(
+        "SELECT (SELECT COUNT(*) FROM SCRAPED_PAGE), (SELECT COUNT(*) FROM PAGE_BLOB);"
+    ).fetchone()
+    logger.info(f"{pages} pages are stored in {blobs} unique blobs")
+
+    cursor.close()
+    connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Move the content of scraped pages into the content-addressed blob table."
+    )
+
+    parser.add_argument(
+        "--dataset",
+        "-d",
+        type=str,
+        required=False,
+        default="scraped_repos.db",
+        help="The path to the scraper database.",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Input Validation
+    if not os.path.exists(args.dataset):
+        raise ValueError("The dataset path provided does not exist.")
+
+    migrate_to_blobs(args.dataset)
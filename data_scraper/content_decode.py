@@ -0,0 +1,29 @@
+from typing import Tuple
+
+# Like git, a file with a NUL byte in its first 8000 bytes is treated as binary
+BINARY_SNIFF_SIZE = 8000
+# The size of the chunks a response body is read in
+CHUNK_SIZE = 64 * 1024
+
+
+def is_binary(head: bytes) -> bool:
+    """
+    :param head: the start of a file (only its first BINARY_SNIFF_SIZE bytes are looked at)
+    :return: whether the file is binary, even though its name says it is source code
+    """
+    return b"\0" in head[:BINARY_SNIFF_SIZE]
+
+
+def decode_content(content: bytes) -> Tuple[str, bytes]:
+    """
+    Decodes the content of a file as utf-8, without guessing its encoding. Nearly every source file is valid
+    utf-8 (or plain ascii), those are decoded by the strict decoder in one go. Invalid bytes in the others are
+    replaced, like GitHub does when it shows them.
+    :param content: the content of the file
+    :return: the content as text, and its utf-8 encoding (the content itself, unless it had to be repaired)
+    """
+    try:
+        return content.decode("utf-8"), content
+    except UnicodeDecodeError:
+        data = content.decode("utf-8", errors="replace")
+        return data, data.encode("utf-8", errors="surrogatepass")
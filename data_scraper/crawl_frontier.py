@@ -0,0 +1,162 @@
+import sqlite3
+from typing import List, Optional, Set
+
+from db_writer import DatabaseWriter
+
+# States of a single page or raw file in the frontier
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+
+# States of a repository as a whole
+REPO_IN_PROGRESS = "in_progress"
+REPO_DONE = "done"
+
+
+def setup_frontier_tables(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the tables of the crawl frontier if they do not exist yet.
+    :param cursor: a cursor on the scraper database
+    :return: None
+    """
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS CRAWL_FRONTIER("
+        "Repo_Name      TEXT    NOT NULL,"
+        "Kind           TEXT    NOT NULL,"
+        "Branch         TEXT,"
+        "Path           TEXT    NOT NULL,"  # Empty for the landing page of the repository
+        "Url            TEXT    NOT NULL,"
+        "State          TEXT    NOT NULL,"
+        "Updated        TIMESTAMP DEFAULT CURRENT_TIMESTAMP,"
+        "PRIMARY KEY (Repo_Name, Kind, Path)"
+        ");"
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS CRAWL_REPO("
+        "Repo_Name      TEXT    PRIMARY KEY NOT NULL,"
+        "State          TEXT    NOT NULL,"
+        "Updated        TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+        ");"
+    )
+
+
+class CrawlFrontier:
+    """
+    Class used to persist the progress of a crawl in the scraper database, so an interrupted run can be resumed.
+    Every page or raw file that is queued is recorded as pending, moves to in flight once a worker picks it up,
+    and ends up done (or failed, in which case it is handed out again when the crawl is resumed). All updates go
+    through the database writer, in the same order as the scraped files themselves, so a committed 'done' is never
+    ahead of the data it stands for. A repository is only marked as done once all of its jobs are.
+
+    A job is a (kind, repo_path, branch_name, path) tuple, where path is None for the landing page of a repository.
+    """
+
+    def __init__(self, db_path: str, writer: DatabaseWriter):
+        """
+        Constructor for the CrawlFrontier class.
+        :param db_path: the path to the scraper database (its tables should already be set up)
+        :param writer: the writer used for all updates to the frontier
+        """
+        self.db_path = db_path
+        self.writer = writer
+
+    def _read(self, query: str, params: tuple = ()) -> list:
+        connection = sqlite3.connect(self.db_path)
+        try:
+            return connection.execute(query, params).fetchall()
+        finally:
+            connection.close()
+
+    def completed_repositories(self) -> Set[str]:
+        """
+        :return: the paths of all repositories that were scraped completely
+        """
+        rows = self._read(
+            "SELECT Repo_Name FROM CRAWL_REPO WHERE State = ?;", (REPO_DONE,)
+        )
+        return {row[0] for row in rows}
+
+    def resume(self, repo_path: str) -> Optional[List[tuple]]:
+        """
+        Finds the jobs of a repository that were queued, in flight or failed when a previous run stopped.
+        Jobs that were in flight are handed out again, as we can not know whether they got to finish, and failed
+        jobs are tried again, as the repository is only done once all of its jobs are.
+        :param repo_path: the path to the repository
+        :return: the unfinished jobs, or None if the repository was never seen before
+        """
+        rows = self._read(
+            "SELECT Kind, Branch, Path, State FROM CRAWL_FRONTIER WHERE Repo_Name = ?;",
+            (repo_path,),
+        )
+        if len(rows) == 0:
+            return None
+
+        return [
+            (kind, repo_path, branch_name, path if path != "" else None)
+            for kind, branch_name, path, state in rows
+            if state in (PENDING, IN_FLIGHT, FAILED)
+        ]
+
+    def done_jobs(self, repo_path: str) -> Set[tuple]:
+        """
+        :param repo_path: the path to the repository
+        :return: the (kind, path) of every job of the repository that is done, path being None for its landing page
+        """
+        rows = self._read(
+            "SELECT Kind, Path FROM CRAWL_FRONTIER WHERE Repo_Name = ? AND State = ?;",
+            (repo_path, DONE),
+        )
+        return {(kind, path if path != "" else None) for kind, path in rows}
+
+    def add(self, job: tuple, url: str) -> None:
+        """
+        Records a newly queued job as pending (jobs that are already known keep their state).
+        :param job: the job
+        :param url: the url the job is going to fetch
+        :return: None
+        """
+        kind, repo_path, branch_name, path = job
+        self.writer.execute(
+            "INSERT OR IGNORE INTO CRAWL_FRONTIER (Repo_Name, Kind, Branch, Path, Url, State) "
+            "VALUES (?, ?, ?, ?, ?, ?);",
+            (repo_path, kind, branch_name, path or "", url, PENDING),
+        )
+
+    def _set_state(self, job: tuple, state: str) -> None:
+        kind, repo_path, branch_name, path = job
+        self.writer.execute(
+            "UPDATE CRAWL_FRONTIER SET State = ?, Updated = CURRENT_TIMESTAMP "
+            "WHERE Repo_Name = ? AND Kind = ? AND Path = ?;",
+            (state, repo_path, kind, path or ""),
+        )
+
+    def start(self, job: tuple) -> None:
+        self._set_state(job, IN_FLIGHT)
+
+    def finish(self, job: tuple) -> None:
+        self._set_state(job, DONE)
+
+    def fail(self, job: tuple) -> None:
+        self._set_state(job, FAILED)
+
+    def start_repository(self, repo_path: str) -> None:
+        self.writer.execute(
+            "INSERT OR IGNORE INTO CRAWL_REPO (Repo_Name, State) VALUES (?, ?);",
+            (repo_path, REPO_IN_PROGRESS),
+        )
+
+    def finish_repository(self, repo_path: str) -> None:
+        self.writer.execute(
+            "INSERT OR REPLACE INTO CRAWL_REPO (Repo_Name, State) VALUES (?, ?);",
+            (repo_path, REPO_DONE),
+        )
+
+    def reset(self) -> None:
+        """
+        Forgets all progress, so the next run starts from scratch.
+        :return: None
+        """
+        self.writer.execute("DELETE FROM CRAWL_FRONTIER;")
+        self.writer.execute("DELETE FROM CRAWL_REPO;")
+        self.writer.flush()
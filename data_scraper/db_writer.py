@@ -0,0 +1,188 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = "scraped_repos.db"
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL_MS = 500
+DEFAULT_QUEUE_SIZE = 10000
+
+# WAL lets readers continue while we write, and with it synchronous=NORMAL only syncs at checkpoints
+WRITER_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-65536;",  # 64 MiB
+    "PRAGMA busy_timeout=5000;",
+)
+
+# Marker put on the queue to stop the writer thread
+_STOP = object()
+
+
+class DatabaseWriter:
+    """
+    Class that owns the single connection used to write to the scraper database.
+    Statements are put on a queue and executed by a background thread, which commits them in batches
+    of batch_size statements or every flush_interval_ms milliseconds, whichever comes first.
+    Statements are always executed in the order in which they were queued.
+    """
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval_ms: int = DEFAULT_FLUSH_INTERVAL_MS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+    ):
+        """
+        Constructor for the DatabaseWriter class, which immediately starts the writer thread.
+        :param db_path: the path to the database
+        :param batch_size: the maximum amount of statements per commit
+        :param flush_interval_ms: the maximum time in milliseconds a statement waits before it is committed
+        :param queue_size: the maximum amount of statements waiting to be written
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.rows_written = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="DatabaseWriter", daemon=True
+        )
+        self._thread.start()
+
+    def execute(self, statement: str, params: tuple = ()) -> None:
+        """
+        Queues a statement to be executed by the writer thread.
+        :param statement: the sql statement
+        :param params: the parameters of the statement
+        :return: None
+        """
+        if self._closed:
+            raise RuntimeError("The database writer has already been closed")
+        self._queue.put((statement, params))
+
+    def flush(self) -> None:
+        """
+        Blocks until every statement queued so far has been committed.
+        :return: None
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self) -> None:
+        """
+        Commits every statement that is still queued and closes the connection.
+        :return: None
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path)
+        for pragma in WRITER_PRAGMAS:
+            connection.execute(pragma)
+        return connection
+
+    def _commit(self, connection: sqlite3.Connection, batch: list) -> None:
+        with metrics.timer(metrics.WRITE_STAGE):
+            cursor = connection.cursor()
+            for statement, params in batch:
+                try:
+                    cursor.execute(statement, params)
+                except sqlite3.Error as e:
+                    # A single bad row should not cost us the rest of the batch
+                    logger.error(f"Failed to write to the database: {e}")
+            connection.commit()
+            cursor.close()
+        self.rows_written += len(batch)
+
+    def _run(self) -> None:
+        connection = self._connect()
+        batch = []
+        waiters = []
+        deadline = None
+        stopping = False
+
+        while not stopping:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                stopping = True
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            # Commit once the batch is full, the oldest row has waited long enough, or someone is waiting for it
+            if (
+                stopping
+                or waiters
+                or len(batch) >= self.batch_size
+                or (deadline is not None and time.monotonic() >= deadline)
+            ):
+                if batch:
+                    self._commit(connection, batch)
+                batch = []
+                deadline = None
+                for waiter in waiters:
+                    waiter.set()
+                waiters = []
+
+        connection.close()
+        logger.info(
+            f"Database writer closed after writing {self.rows_written} statements"
+        )
+
+
+_writer = None
+
+
+def set_writer(writer: Optional[DatabaseWriter]) -> None:
+    """
+    Sets the writer used by all scrape functions.
+    :param writer: the writer, or None to unset it
+    :return: None
+    """
+    global _writer
+    _writer = writer
+
+
+def get_writer() -> DatabaseWriter:
+    """
+    Returns the writer used by all scrape functions.
+    If none was set, a writer for the default database is opened, which is closed when the program exits.
+    :return: the writer
+    """
+    global _writer
+    if _writer is None:
+        _writer = DatabaseWriter(DEFAULT_DB_PATH)
+        atexit.register(_writer.close)
+    return _writer
@@ -0,0 +1,123 @@
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+from db_writer import DatabaseWriter
+
+
+def setup_failure_tables(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the failure journal if it does not exist yet.
+    :param cursor: a cursor on the scraper database
+    :return: None
+    """
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS FAILED_SCRAPE("
+        "ID INTEGER PRIMARY KEY     AUTOINCREMENT,"
+        "Url            TEXT    NOT NULL,"
+        "Status         INTEGER,"  # Empty if no response was received
+        "Exception      TEXT,"
+        "Attempt        INTEGER NOT NULL,"
+        "Failed         TIMESTAMP DEFAULT CURRENT_TIMESTAMP,"
+        "Repo_Name      TEXT,"
+        "Kind           TEXT,"
+        "Branch         TEXT,"
+        "Path           TEXT,"
+        "Resolved       INTEGER NOT NULL DEFAULT 0"
+        ");"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS FAILED_SCRAPE_UNRESOLVED ON FAILED_SCRAPE (Resolved, Url);"
+    )
+
+
+class FailureJournal:
+    """
+    Class used to keep a journal of every page or raw file that could not be scraped.
+    Every failure is appended as a new row through the database writer, so recording one never waits for the disk.
+    Next to the url, the job that failed is stored (see async_scraper.py), so that the failures can be re-driven
+    later on without crawling everything again (see scraper.retry_failed). The attempt of a failure is 1 for the
+    first crawl, and one more than the attempt it was retried for after that.
+    """
+
+    def __init__(self, writer: DatabaseWriter, attempts: Optional[Dict[str, int]] = None):
+        """
+        Constructor for the FailureJournal class.
+        :param writer: the writer the failures are written with
+        :param attempts: the attempt of the last failure of every url that is being retried
+        """
+        self.writer = writer
+        self.attempts = attempts or {}
+
+    def record(
+        self,
+        url: str,
+        status: Optional[int] = None,
+        exception: Optional[BaseException] = None,
+        job: Optional[tuple] = None,
+    ) -> None:
+        """
+        Appends a failure to the journal.
+        :param url: the url that could not be scraped
+        :param status: the status code of the response (None if no response was received)
+        :param exception: the exception that was raised (if any)
+        :param job: the (kind, repo_path, branch_name, path) tuple of the failed job (if known)
+        :return: None
+        """
+        metrics.count(metrics.FAILURES_COUNTER)
+        kind, repo_path, branch_name, path = job if job is not None else (None,) * 4
+        self.writer.execute(
+            "INSERT INTO FAILED_SCRAPE (Url, Status, Exception, Attempt, Repo_Name, Kind, Branch, Path) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?);",
+            (
+                url,
+                status,
+                None if exception is None else type(exception).__name__,
+                self.attempts.get(url, 0) + 1,
+                repo_path,
+                kind,
+                branch_name,
+                path,
+            ),
+        )
+
+
+def load_failures(db_path: str) -> Tuple[List[tuple], Dict[str, int], int]:
+    """
+    Loads the failures that have not been resolved yet.
+    :param db_path: the path to the scraper database
+    :return: the jobs that failed (without duplicates), the attempt of the last failure of every url,
+        and the ID of the last failure that was loaded
+    """
+    connection = sqlite3.connect(db_path)
+    try:
+        rows = connection.execute(
+            "SELECT Url, Kind, Repo_Name, Branch, Path, MAX(Attempt), MAX(ID) FROM FAILED_SCRAPE "
+            "WHERE Resolved = 0 GROUP BY Url ORDER BY MIN(ID);"
+        ).fetchall()
+    finally:
+        connection.close()
+
+    jobs = []
+    attempts = {}
+    last_id = 0
+    for url, kind, repo_path, branch_name, path, attempt, failure_id in rows:
+        attempts[url] = attempt
+        last_id = max(last_id, failure_id)
+        # Failures recorded without their job can not be re-driven
+        if kind is not None:
+            jobs.append((kind, repo_path, branch_name, path))
+    return list(dict.fromkeys(jobs)), attempts, last_id
+
+
+def resolve_failures(writer: DatabaseWriter, last_id: int) -> None:
+    """
+    Marks the failures up to the given ID as resolved, i.e. once they were retried.
+    Failures of the retry itself were added after them, so they stay unresolved.
+    :param writer: the writer used for the update
+    :param last_id: the ID of the last failure that was retried
+    :return: None
+    """
+    writer.execute(
+        "UPDATE FAILED_SCRAPE SET Resolved = 1 WHERE Resolved = 0 AND ID <= ?;", (last_id,)
+    )
@@ -0,0 +1,151 @@
+import threading
+from typing import Iterable, Optional
+
+import metrics
+
+# The dedup scripts drop every file with len(content) >= 30000, so with this limit such files are not fetched at all.
+# The size is counted in bytes, which for non-ASCII files is slightly stricter than the dedup cutoff
+DEDUP_MAX_FILE_SIZE = 30000
+# Files of every size are scraped unless a limit is given (0 for no limit)
+DEFAULT_MAX_FILE_SIZE = 0
+# The maximum amount of bytes scraped per repository (0 for no limit)
+DEFAULT_REPO_BYTE_BUDGET = 0
+
+# Folders of code that is vendored or generated by a build, at any depth of the repository
+EXCLUDED_FOLDERS = frozenset(
+    {"vendor", "node_modules", "dist", "third_party", "bower_components"}
+)
+# File names of generated code (protobuf/gRPC stubs) and minified bundles
+EXCLUDED_SUFFIXES = (
+    "_pb2.py",
+    "_pb2_grpc.py",
+    ".pb.go",
+    ".pb.cc",
+    ".pb.h",
+    ".min.js",
+    ".bundle.js",
+)
+
+_settings = {
+    "max_file_size": DEFAULT_MAX_FILE_SIZE,
+    "repo_byte_budget": DEFAULT_REPO_BYTE_BUDGET,
+    "excluded_folders": EXCLUDED_FOLDERS,
+    "excluded_suffixes": EXCLUDED_SUFFIXES,
+}
+# The amount of bytes scraped so far for every repository that is being scraped
+_spent = {}
+_lock = threading.Lock()
+
+
+def configure_prefilter(
+    max_file_size: Optional[int] = None,
+    repo_byte_budget: Optional[int] = None,
+    excluded_folders: Optional[Iterable[str]] = None,
+    excluded_suffixes: Optional[Iterable[str]] = None,
+) -> None:
+    """
+    Changes which files are skipped before they are downloaded, settings that are None are left as they are.
+    :param max_file_size: files of this many bytes or more are skipped (0 for no limit)
+    :param repo_byte_budget: the maximum amount of bytes scraped per repository (0 for no limit)
+    :param excluded_folders: the names of folders that are not scraped
+    :param excluded_suffixes: the endings of file names that are not scraped
+    :return: None
+    """
+    if max_file_size is not None:
+        _settings["max_file_size"] = max_file_size
+    if repo_byte_budget is not None:
+        _settings["repo_byte_budget"] = repo_byte_budget
+    if excluded_folders is not None:
+        _settings["excluded_folders"] = frozenset(excluded_folders)
+    if excluded_suffixes is not None:
+        _settings["excluded_suffixes"] = tuple(excluded_suffixes)
+
+
+def get_prefilter_settings() -> dict:
+    """
+    :return: a copy of the settings, i.e. to configure the prefilter of another process with
+    """
+    return dict(_settings)
+
+
+def is_excluded_folder(name: str) -> bool:
+    """
+    :param name: the name of a folder (not its path)
+    :return: whether nothing in the folder should be scraped
+    """
+    return name in _settings["excluded_folders"]
+
+
+def is_excluded(file_path: str) -> bool:
+    """
+    :param file_path: the path of a file within the repository
+    :return: whether the file is generated or vendored code that should not be scraped
+    """
+    folders, _, name = file_path.rpartition("/")
+    if name.endswith(_settings["excluded_suffixes"]):
+        return True
+    return folders != "" and not _settings["excluded_folders"].isdisjoint(
+        folders.split("/")
+    )
+
+
+def fetch_limit(repo_path: str) -> Optional[int]:
+    """
+    :param repo_path: the path to the repository a file is about to be fetched from
+    :return: the maximum size in bytes of the next file of the repository (None if there is no limit, 0 if its
+        byte budget is used up)
+    """
+    limits = []
+    if _settings["max_file_size"] > 0:
+        limits.append(_settings["max_file_size"] - 1)
+    if _settings["repo_byte_budget"] > 0:
+        with _lock:
+            spent = _spent.get(repo_path, 0)
+        limits.append(max(_settings["repo_byte_budget"] - spent, 0))
+    return min(limits) if limits else None
+
+
+def should_fetch(file_path: str, repo_path: str, size: Optional[int] = None) -> bool:
+    """
+    Decides whether a file is worth downloading, based on its path, its size (if it is known up front) and the
+    byte budget of its repository. Skipped files are counted in the metrics.
+    :param file_path: the path of the file within the repository
+    :param repo_path: the path to the repository
+    :param size: the size of the file in bytes, if known
+    :return: whether the file should be downloaded
+    """
+    limit = fetch_limit(repo_path)
+    if is_excluded(file_path) or limit == 0 or (
+        limit is not None and size is not None and size > limit
+    ):
+        metrics.count(metrics.SKIPPED_COUNTER)
+        return False
+    return True
+
+
+def accept_content(repo_path: str, size: int) -> bool:
+    """
+    Checks the size of a file that was downloaded (i.e. when its size was not known up front), and adds it to the
+    byte budget of its repository if it is kept.
+    :param repo_path: the path to the repository
+    :param size: the size of the file in bytes
+    :return: whether the file should be saved
+    """
+    limit = fetch_limit(repo_path)
+    if limit is not None and size > limit:
+        metrics.count(metrics.SKIPPED_COUNTER)
+        return False
+    if _settings["repo_byte_budget"] > 0:
+        with _lock:
+            _spent[repo_path] = _spent.get(repo_path, 0) + size
+    return True
+
+
+def finish_repository(repo_path: str) -> None:
+    """
+    Forgets how much of the byte budget of a repository was used, once it has been scraped.
+    :param repo_path: the path to the repository
+    :return: None
+    """
+    with _lock:
+        _spent.pop(repo_path, None)
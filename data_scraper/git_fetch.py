@@ -0,0 +1,180 @@
+import os
+import subprocess
+import tempfile
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import metrics
+from github_pages import IGNORED_ROOT_FOLDERS
+
+GITHUB_GIT_URL = "https://github.com/"
+
+# Never ask for credentials, a repository that is private or gone should just fail
+GIT_ENVIRONMENT = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+
+SYMLINK_MODE = "120000"
+
+
+class GitFetchError(Exception):
+    """
+    Raised when a git command fails, with what git wrote to stderr.
+    """
+
+    def __init__(self, command: str, stderr: str):
+        super().__init__(f"git {command} failed: {stderr.strip()}")
+        self.command = command
+        self.stderr = stderr
+
+
+def clone_url(repo_path: str, base_url: str = GITHUB_GIT_URL) -> str:
+    """
+    :param repo_path: the path to the repository (i.e. {user}/{repository})
+    :param base_url: the base url serving git repositories (i.e. file:///path/to/repos/ for local bare repositories)
+    :return: the url to fetch the repository from
+    """
+    return base_url + repo_path + ".git"
+
+
+def _git(args: List[str], git_dir: Optional[str] = None, stdin: bytes = None) -> bytes:
+    """
+    Runs a git command and waits for it to finish.
+    :param args: the arguments of the command (i.e. ['ls-remote', url])
+    :param git_dir: the repository to run the command in
+    :param stdin: what to write to the standard input of the command
+    :return: the standard output of the command
+    """
+    command = ["git"] if git_dir is None else ["git", "--git-dir", git_dir]
+    result = subprocess.run(
+        command + args, input=stdin, capture_output=True, env=GIT_ENVIRONMENT
+    )
+    if result.returncode != 0:
+        raise GitFetchError(args[0], result.stderr.decode("utf-8", errors="replace"))
+    return result.stdout
+
+
+def _git_remote(args: List[str], git_dir: Optional[str] = None, stdin: bytes = None) -> bytes:
+    """
+    Runs a git command that talks to the remote, which is timed and counted as a request in the metrics.
+    """
+    with metrics.timer(metrics.FETCH_STAGE):
+        output = _git(args, git_dir, stdin)
+    metrics.count(metrics.REQUESTS_COUNTER)
+    return output
+
+
+def default_branch(url: str) -> Tuple[str, str]:
+    """
+    Asks the remote which branch its HEAD points at, without fetching anything.
+    :param url: the url of the repository
+    :return: the name of the default branch, and the id of its latest commit
+    """
+    branch_name = commit_id = None
+    for line in _git_remote(["ls-remote", "--symref", url, "HEAD"]).decode().splitlines():
+        target, _, name = line.partition("\t")
+        if target.startswith("ref: refs/heads/"):
+            branch_name = target[len("ref: refs/heads/"):]
+        elif name == "HEAD":
+            commit_id = target
+    if branch_name is None or commit_id is None:
+        raise GitFetchError("ls-remote", f"{url} has no default branch")
+    return branch_name, commit_id
+
+
+def _list_files(git_dir: str, commit_id: str) -> Iterator[Tuple[str, str]]:
+    """
+    :param git_dir: the repository the trees of the commit were fetched into
+    :param commit_id: the commit to list the files of
+    :return: an iterator of (path, blob id) tuples, without symlinks and submodules
+    """
+    listing = _git(["ls-tree", "-r", "-z", commit_id], git_dir)
+    for entry in listing.split(b"\0"):
+        if not entry:
+            continue
+        info, _, path = entry.partition(b"\t")
+        mode, object_type, object_id = info.decode().split(" ")
+        if object_type != "blob" or mode == SYMLINK_MODE:
+            continue
+        yield path.decode("utf-8", errors="surrogateescape"), object_id
+
+
+def iter_git_files(
+    url: str,
+    branch_name: str,
+    keep: Callable[[str], bool] = lambda path: True,
+) -> Iterator[Tuple[str, bytes]]:
+    """
+    Goes through the files of the latest commit of a branch, with a shallow partial fetch into a temporary bare
+    repository. The commit and its trees are fetched first without any blobs, then the blobs of the files that are
+    kept are fetched in a single pack. The blobs are read straight from the pack, nothing is checked out.
+    :param url: the url of the repository
+    :param branch_name: the name of its branch
+    :param keep: called with the path of every file, only the blobs of the files for which it returns True are
+        fetched. Trees do not store the size of a file, so a size limit can only be applied to the content
+    :return: an iterator of (path, content) tuples
+    """
+    with tempfile.TemporaryDirectory(prefix="git_fetch_") as git_dir:
+        _git(["init", "--quiet", "--bare", git_dir])
+        # A partial clone needs the remote to be marked as the promisor of the objects that were left out
+        _git(["remote", "add", "origin", url], git_dir)
+        _git(["config", "remote.origin.promisor", "true"], git_dir)
+        _git(["config", "extensions.partialClone", "origin"], git_dir)
+
+        _git_remote(
+            [
+                "fetch",
+                "--quiet",
+                "--depth=1",
+                "--filter=blob:none",
+                "--no-tags",
+                "origin",
+                "refs/heads/" + branch_name,
+            ],
+            git_dir,
+        )
+        commit_id = _git(["rev-parse", "FETCH_HEAD"], git_dir).decode().strip()
+
+        files = [
+            (path, object_id)
+            for path, object_id in _list_files(git_dir, commit_id)
+            if path.split("/", 1)[0] not in IGNORED_ROOT_FOLDERS and keep(path)
+        ]
+        if not files:
+            return
+
+        # Wanting the blobs by id is how git itself fills in a partial clone. Copies of a file share their blob
+        wanted = "\n".join(sorted({object_id for _, object_id in files})) + "\n"
+        _git_remote(
+            [
+                "-c",
+                "fetch.negotiationAlgorithm=noop",
+                "fetch",
+                "--quiet",
+                "--no-tags",
+                "--no-write-fetch-head",
+                "--filter=blob:none",
+                "--stdin",
+                "origin",
+            ],
+            git_dir,
+            stdin=wanted.encode(),
+        )
+
+        # One blob is requested at a time, so only one file is held in memory
+        with subprocess.Popen(
+            ["git", "--git-dir", git_dir, "cat-file", "--batch"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=GIT_ENVIRONMENT,
+        ) as cat_file:
+            try:
+                for path, object_id in files:
+                    cat_file.stdin.write(object_id.encode() + b"\n")
+                    cat_file.stdin.flush()
+                    header = cat_file.stdout.readline().split()
+                    if len(header) != 3:
+                        raise GitFetchError("cat-file", f"{object_id} is missing")
+                    size = int(header[2])
+                    content = cat_file.stdout.read(size)
+                    cat_file.stdout.read(1)
+                    yield path, content
+            finally:
+                cat_file.stdin.close()
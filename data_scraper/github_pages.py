@@ -0,0 +1,318 @@
+import json
+import re
+from math import floor
+from typing import List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+try:
+    # pip install lxml (optional, only needed for the lxml parser backend)
+    import lxml.html
+except ImportError:
+    lxml = None
+
+import metrics
+
+GITHUB_BASE_URL = "https://github.com/"
+GITHUB_RAW_URL = "https://raw.githubusercontent.com/"
+GITHUB_RAW_CONNECTOR = "/refs/heads/"
+
+# We can just ignore the builds, git and all those standard folders at the root of a repository
+IGNORED_ROOT_FOLDERS = {".builds", ".git", ".github", ".vscode"}
+
+# The landing page embeds the commit its branch currently points at in its json payload
+CURRENT_COMMIT_PATTERN = re.compile(r'"currentOid":"([0-9a-f]{40})"')
+
+# The react app of GitHub gets the directory listing as a json payload embedded in the page
+EMBEDDED_DATA_PATTERN = re.compile(
+    r'<script type="application/json" data-target="[\w.-]*embeddedData">(.*?)</script>',
+    re.DOTALL,
+)
+
+# Backends that can be used to extract the directory listing from a page
+AUTO_BACKEND = "auto"
+JSON_BACKEND = "json"
+LXML_BACKEND = "lxml"
+SOUP_BACKEND = "soup"
+PARSER_BACKENDS = (AUTO_BACKEND, JSON_BACKEND, LXML_BACKEND, SOUP_BACKEND)
+
+_parser_backend = AUTO_BACKEND
+
+
+class PageFormatError(ValueError):
+    """
+    Raised when a page does not have the layout a parser backend expects.
+    """
+
+
+def repository_url(repo_path: str, base_url: str = GITHUB_BASE_URL) -> str:
+    """
+    Builds the url of the landing page of a repository.
+    :param repo_path: the path to the repository (i.e. {user}/{repository})
+    :param base_url: the base url of the GitHub web interface
+    :return: the url of the repository page
+    """
+    return base_url + repo_path
+
+
+def tree_url(
+    repo_path: str, branch_name: str, tree_path: str, base_url: str = GITHUB_BASE_URL
+) -> str:
+    """
+    Builds the url of a folder in the navigation window of a repository.
+    :param repo_path: the path to the repository
+    :param branch_name: the name of its branch
+    :param tree_path: the path of the folder within the repository
+    :param base_url: the base url of the GitHub web interface
+    :return: the url of the tree page
+    """
+    return base_url + repo_path + "/tree/" + branch_name + "/" + tree_path
+
+
+def raw_file_url(
+    repo_path: str, branch_name: str, file_path: str, raw_url: str = GITHUB_RAW_URL
+) -> str:
+    """
+    Builds the url of the raw content of a file.
+    :param repo_path: the path to the repository
+    :param branch_name: the name of its branch
+    :param file_path: the path of the file within the repository
+    :param raw_url: the base url serving raw file contents
+    :return: the url of the raw file
+    """
+    return raw_url + repo_path + GITHUB_RAW_CONNECTOR + branch_name + "/" + file_path
+
+
+def parse_main_branch(soup: BeautifulSoup) -> Optional[str]:
+    """
+    Finds the name of the branch that is shown on the landing page of a repository.
+    :param soup: the parsed landing page
+    :return: the name of the branch, or None if it could not be found
+    """
+    # This is used to get the name of the main branch
+    git_branch_icon_html_element = soup.select(".octicon-git-branch")
+
+    for branch_elem in git_branch_icon_html_element:
+        parent = branch_elem.parent.find_next_sibling("div")
+        if parent:
+            main_branch_html_element = parent.find("span")
+            if main_branch_html_element:
+                return main_branch_html_element.get_text().strip()
+
+    return None
+
+
+def parse_latest_commit(html: str) -> Optional[str]:
+    """
+    Finds the id of the latest commit on the branch shown on the landing page of a repository.
+    :param html: the html of the landing page
+    :return: the commit id, or None if it could not be found
+    """
+    match = CURRENT_COMMIT_PATTERN.search(html)
+    if match is None:
+        return None
+    return match.group(1)
+
+
+def _find_key(obj, key: str):
+    """
+    Searches a decoded json payload depth-first for the first value stored under the given key.
+    """
+    if isinstance(obj, dict):
+        if key in obj:
+            return obj[key]
+        children = obj.values()
+    elif isinstance(obj, list):
+        children = obj
+    else:
+        return None
+
+    for child in children:
+        found = _find_key(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _parse_json_payload(html: str) -> Tuple[Optional[str], List[Tuple[str, bool]]]:
+    """
+    Extracts the directory listing from the json payload embedded in the page, without parsing the html at all.
+    """
+    for match in EMBEDDED_DATA_PATTERN.finditer(html):
+        payload = json.loads(match.group(1))
+        tree = _find_key(payload, "tree")
+        if not isinstance(tree, dict) or "items" not in tree:
+            continue
+
+        ref_info = _find_key(payload, "refInfo")
+        main_branch = ref_info.get("name") if isinstance(ref_info, dict) else None
+
+        # Submodules can not be fetched from the repository itself, so they are left out
+        entries = [
+            (item["name"], item["contentType"] == "directory")
+            for item in tree["items"]
+            if item["contentType"] in ("directory", "file")
+        ]
+        return main_branch, entries
+
+    raise PageFormatError("The page does not contain an embedded directory listing")
+
+
+def _parse_root_soup(html: str) -> Tuple[Optional[str], List[Tuple[str, bool]]]:
+    soup = BeautifulSoup(html, "html.parser")
+    main_branch = parse_main_branch(soup)
+
+    file_directories = soup.findAll("div", attrs={"class": "react-directory-truncate"})
+
+    # Every entry is rendered twice (for the wide and narrow layout), so we only look at every other one
+    entries = []
+    for i in range(0, floor(len(file_directories) / 2)):
+        # If the icon is icon-directory that means it is a folder system and we deal with it like a tree.
+        is_folder = (
+            file_directories[i * 2].parent.parent.previous_sibling["class"][0]
+            == "icon-directory"
+        )
+        entries.append((file_directories[2 * i].text, is_folder))
+
+    return main_branch, entries
+
+
+def _parse_tree_soup(html: str) -> List[Tuple[str, bool]]:
+    soup = BeautifulSoup(html, "html.parser")
+    file_directories = soup.findAll(
+        "div", attrs={"class", "react-directory-filename-column"}
+    )
+
+    entries = []
+    for i in range(0, floor(len(file_directories) / 2)):
+        # If the icon is icon-directory that means it is a folder system and we deal with it like a tree.
+        is_folder = file_directories[i * 2].svg["class"][0] == "icon-directory"
+        entries.append((file_directories[2 * i].text, is_folder))
+
+    return entries
+
+
+def _has_class_xpath(class_name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+def _parse_root_lxml(html: str) -> Tuple[Optional[str], List[Tuple[str, bool]]]:
+    if lxml is None:
+        raise ImportError("The lxml parser backend requires lxml to be installed")
+    document = lxml.html.fromstring(html)
+
+    main_branch = None
+    for branch_elem in document.xpath(f"//*[{_has_class_xpath('octicon-git-branch')}]"):
+        parent = branch_elem.getparent().getnext()
+        while parent is not None and parent.tag != "div":
+            parent = parent.getnext()
+        if parent is not None:
+            spans = parent.xpath(".//span")
+            if spans:
+                main_branch = spans[0].text_content().strip()
+                break
+
+    file_directories = document.xpath(
+        f"//div[{_has_class_xpath('react-directory-truncate')}]"
+    )
+
+    entries = []
+    for i in range(0, floor(len(file_directories) / 2)):
+        icon = file_directories[i * 2].getparent().getparent().getprevious()
+        is_folder = icon.get("class", "").split()[0] == "icon-directory"
+        entries.append((file_directories[2 * i].text_content(), is_folder))
+
+    return main_branch, entries
+
+
+def _parse_tree_lxml(html: str) -> List[Tuple[str, bool]]:
+    if lxml is None:
+        raise ImportError("The lxml parser backend requires lxml to be installed")
+    document = lxml.html.fromstring(html)
+
+    file_directories = document.xpath(
+        f"//div[{_has_class_xpath('react-directory-filename-column')}]"
+    )
+
+    entries = []
+    for i in range(0, floor(len(file_directories) / 2)):
+        icon = file_directories[i * 2].xpath(".//svg")[0]
+        is_folder = icon.get("class", "").split()[0] == "icon-directory"
+        entries.append((file_directories[2 * i].text_content(), is_folder))
+
+    return entries
+
+
+def set_parser_backend(backend: str) -> None:
+    """
+    Sets the backend used to extract the directory listings from GitHub pages:
+    json -> reads the json payload the page embeds for GitHub's react app, without parsing the html (fastest).
+    lxml -> selects the listing from the html with lxml (requires lxml).
+    soup -> selects the listing from a full BeautifulSoup tree built with html.parser (the original behaviour).
+    auto -> uses the json payload, and falls back to lxml (or soup if lxml is missing) for pages without one.
+    :param backend: the name of the backend
+    :return: None
+    """
+    global _parser_backend
+
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend: {backend}")
+    if backend == LXML_BACKEND and lxml is None:
+        raise ImportError("The lxml parser backend requires lxml to be installed")
+    _parser_backend = backend
+
+
+def get_parser_backend() -> str:
+    return _parser_backend
+
+
+def _html_backend(backend: str) -> str:
+    if backend != AUTO_BACKEND:
+        return backend
+    return SOUP_BACKEND if lxml is None else LXML_BACKEND
+
+
+@metrics.timed(metrics.PARSE_STAGE)
+def parse_repository_root(
+    html: str, backend: Optional[str] = None
+) -> Tuple[Optional[str], List[Tuple[str, bool]]]:
+    """
+    Parses the landing page of a repository.
+    :param html: the html of the landing page
+    :param backend: the parser backend to use (defaults to the one set with set_parser_backend)
+    :return: the name of the main branch and a list of (name, is_folder) tuples for the root of the repository
+    """
+    backend = backend or _parser_backend
+    if backend in (AUTO_BACKEND, JSON_BACKEND):
+        try:
+            return _parse_json_payload(html)
+        except PageFormatError:
+            if backend == JSON_BACKEND:
+                raise
+
+    if _html_backend(backend) == LXML_BACKEND:
+        return _parse_root_lxml(html)
+    return _parse_root_soup(html)
+
+
+@metrics.timed(metrics.PARSE_STAGE)
+def parse_tree_listing(
+    html: str, backend: Optional[str] = None
+) -> List[Tuple[str, bool]]:
+    """
+    Parses a folder page in the navigation window of a repository.
+    :param html: the html of the tree page
+    :param backend: the parser backend to use (defaults to the one set with set_parser_backend)
+    :return: a list of (name, is_folder) tuples for the contents of the folder
+    """
+    backend = backend or _parser_backend
+    if backend in (AUTO_BACKEND, JSON_BACKEND):
+        try:
+            return _parse_json_payload(html)[1]
+        except PageFormatError:
+            if backend == JSON_BACKEND:
+                raise
+
+    if _html_backend(backend) == LXML_BACKEND:
+        return _parse_tree_lxml(html)
+    return _parse_tree_soup(html)
@@ -0,0 +1,519 @@
+import asyncio
+import os
+import random
+import socket
+import time
+from typing import AsyncIterable, Callable, Mapping, Optional, Tuple, Union
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util import make_headers
+from urllib3.util.connection import allowed_gai_family, create_connection
+from urllib3.util.retry import Retry
+
+import metrics
+from content_decode import BINARY_SNIFF_SIZE, CHUNK_SIZE, is_binary
+from rate_limiter import THROTTLE_STATUS_CODES, RateLimiter
+
+# Amount of hosts that keep a connection pool (github.com, raw.githubusercontent.com and a few spares)
+DEFAULT_POOL_CONNECTIONS = 10
+# Amount of keep-alive connections that are kept open per host
+DEFAULT_POOL_MAXSIZE = 32
+DEFAULT_RETRIES = 3
+# Retry n waits backoff_factor * 2^(n - 1) seconds plus a random jitter of at most backoff_jitter seconds
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_BACKOFF_JITTER = 0.5
+DEFAULT_TIMEOUT = 60
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# The shared session leaves the throttle responses to get, so the rate limiter sees every one of them
+SESSION_RETRY_STATUS_CODES = tuple(code for code in RETRY_STATUS_CODES if code not in THROTTLE_STATUS_CODES)
+
+_session_settings = {
+    "pool_connections": DEFAULT_POOL_CONNECTIONS,
+    "pool_maxsize": DEFAULT_POOL_MAXSIZE,
+    "retries": DEFAULT_RETRIES,
+    "backoff_factor": DEFAULT_BACKOFF_FACTOR,
+    "backoff_jitter": DEFAULT_BACKOFF_JITTER,
+}
+_session = None
+_session_pid = None
+_rate_limiter = RateLimiter()
+# Url prefixes that are sent to another server instead (i.e. a local replay server, see replay_fixtures.py)
+_redirects = {}
+# Called as record(url, status, headers, body) for every response that is received (see replay_fixtures.py)
+_recorder = None
+
+
+class ResponseTooLarge(Exception):
+    """
+    Raised when the Content-Length of a response is larger than the caller allows, before its body is read.
+    """
+
+    def __init__(self, url: str, size: int):
+        super().__init__(f"{url} is {size} bytes")
+        self.url = url
+        self.size = size
+
+
+class BinaryResponse(Exception):
+    """
+    Raised when the body of a response turns out to be binary, before the rest of it is read.
+    """
+
+    def __init__(self, url: str):
+        super().__init__(f"{url} is binary")
+        self.url = url
+
+
+class _ContentReader:
+    """
+    Collects the chunks of a response body, and stops as soon as it is too large or turns out to be binary.
+    """
+
+    def __init__(self, url: str, max_size: Optional[int]):
+        self.url = url
+        self.max_size = max_size
+        self.size = 0
+        self._chunks = []
+
+    def feed(self, chunk: bytes) -> None:
+        if self.size < BINARY_SNIFF_SIZE and is_binary(chunk[: BINARY_SNIFF_SIZE - self.size]):
+            raise BinaryResponse(self.url)
+        self.size += len(chunk)
+        # The size of the decoded body, which can be far larger than a compressed Content-Length
+        _check_size(self.url, self.size, self.max_size)
+        self._chunks.append(chunk)
+
+    def content(self) -> bytes:
+        if len(self._chunks) == 1:
+            return self._chunks[0]
+        return b"".join(self._chunks)
+
+
+class _TimedConnectionMixin:
+    """
+    Times the DNS lookup and the setup (including the TLS handshake) of every new connection of the shared session,
+    like the trace config of the asynchronous session does (see metrics.aiohttp_trace_config).
+    """
+
+    def connect(self) -> None:
+        with metrics.timer(metrics.CONNECT_STAGE):
+            super().connect()
+
+    def _new_conn(self) -> socket.socket:
+        # The same as urllib3 does, except that the host is looked up (and timed) before its addresses are connected to
+        try:
+            with metrics.timer(metrics.DNS_STAGE):
+                addresses = socket.getaddrinfo(
+                    self._dns_host.strip("[]"), self.port, allowed_gai_family(), socket.SOCK_STREAM
+                )
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+
+        for index, (_, _, _, _, address) in enumerate(addresses):
+            try:
+                return create_connection(
+                    address[:2],
+                    self.timeout,
+                    source_address=self.source_address,
+                    socket_options=self.socket_options,
+                )
+            except socket.timeout as e:
+                if index == len(addresses) - 1:
+                    raise ConnectTimeoutError(
+                        self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})"
+                    ) from e
+            except OSError as e:
+                if index == len(addresses) - 1:
+                    raise NewConnectionError(self, f"Failed to establish a new connection: {e}") from e
+        raise NewConnectionError(self, f"Failed to establish a new connection: no addresses for {self.host}")
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connections time their DNS lookup and setup, next to the fetch time of every request.
+    """
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def read_content(
+    response: requests.Response, url: str, max_size: Optional[int] = None
+) -> bytes:
+    """
+    Reads the body of a (streamed) response in chunks. A body that grows beyond max_size raises ResponseTooLarge,
+    and a body that starts like a binary file raises BinaryResponse, both without reading the rest of it.
+    :param response: the response, from get(url, max_size=...) or get(url, stream=True)
+    :param url: the url that was requested
+    :param max_size: the maximum size of the body in bytes
+    :return: the body
+    """
+    reader = _ContentReader(url, max_size)
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            reader.feed(chunk)
+    except (ResponseTooLarge, BinaryResponse):
+        response.close()
+        raise
+    return reader.content()
+
+
+def create_session(
+    pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+    retries: int = DEFAULT_RETRIES,
+    backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+    backoff_jitter: float = DEFAULT_BACKOFF_JITTER,
+) -> requests.Session:
+    """
+    Creates a session which keeps connections alive and pools them per host.
+    Failed requests (connection errors and the status codes in SESSION_RETRY_STATUS_CODES) are retried with jittered
+    exponential backoff, and responses are requested compressed. Throttle responses (429 and 503) are not retried
+    by the session itself, get retries them through the rate limiter instead. The DNS lookup and setup of every new
+    connection are timed as the dns and connect stages of the shared metrics.
+    :param pool_connections: the amount of hosts to keep a connection pool for
+    :param pool_maxsize: the maximum amount of connections kept open per host
+    :param retries: the amount of times a request is retried
+    :param backoff_factor: the base of the exponential backoff in seconds
+    :param backoff_jitter: the maximum random jitter in seconds added to every backoff
+    :return: the session
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        backoff_jitter=backoff_jitter,
+        status_forcelist=SESSION_RETRY_STATUS_CODES,
+        # urllib3 would otherwise retry any 429 or 503 that carries a Retry-After header itself, get honours it instead
+        respect_retry_after_header=False,
+        # Once we run out of retries we still want the response, the scraper checks the status code itself
+        raise_on_status=False,
+    )
+    adapter = _TimedHTTPAdapter(
+        pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # Every encoding urllib3 is able to decode (gzip and deflate, plus br/zstd if their packages are installed)
+    session.headers.update(make_headers(accept_encoding=True))
+    return session
+
+
+def configure_session(**settings) -> None:
+    """
+    Changes the settings of the shared session, these are the keyword arguments of create_session.
+    The shared session is recreated with the new settings the next time it is used.
+    :param settings: the settings to change
+    :return: None
+    """
+    global _session
+
+    for key, value in settings.items():
+        if key not in _session_settings:
+            raise ValueError(f"Unknown session setting: {key}")
+        if value is not None:
+            _session_settings[key] = value
+
+    if _session is not None:
+        _session.close()
+    _session = None
+
+
+def get_session_settings() -> dict:
+    """
+    :return: a copy of the settings of the shared session, i.e. to configure the session of another process with
+    """
+    return dict(_session_settings)
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the session shared by all scrape functions, which is created on first use.
+    Every process gets its own session, as pooled connections can not be shared between processes.
+    :return: the shared session
+    """
+    global _session, _session_pid
+
+    if _session is None or _session_pid != os.getpid():
+        _session = create_session(**_session_settings)
+        _session_pid = os.getpid()
+    return _session
+
+
+def configure_rate_limiter(enabled: bool = True, **throttle_settings) -> None:
+    """
+    Changes the rate limiter the shared session sends its requests through.
+    :param enabled: toggle whether requests should be rate limited at all
+    :param throttle_settings: the settings of the rate limiter per host (rate, max_rate, max_concurrency, ...)
+    :return: None
+    """
+    global _rate_limiter
+    _rate_limiter = RateLimiter(**throttle_settings) if enabled else None
+
+
+def _check_size(url: str, content_length: Optional[int], max_size: Optional[int]) -> None:
+    # With a compressed response this is the compressed size, so the file itself is at least as large
+    if max_size is not None and content_length is not None and content_length > max_size:
+        raise ResponseTooLarge(url, content_length)
+
+
+def set_redirects(redirects: Optional[Mapping[str, str]]) -> None:
+    """
+    Sends the requests to every url starting with one of the prefixes to the url it is mapped to instead.
+    The scrape functions (and the failures they record) keep using the original urls.
+    :param redirects: a mapping from url prefix (i.e. 'https://github.com/') to its replacement, or None to stop
+        redirecting
+    :return: None
+    """
+    global _redirects
+    _redirects = dict(redirects or {})
+
+
+def get_redirects() -> dict:
+    """
+    :return: a copy of the redirects, i.e. to configure the session of another process with
+    """
+    return dict(_redirects)
+
+
+def set_recorder(recorder: Optional[Callable[[str, int, Mapping[str, str], bytes], None]]) -> None:
+    """
+    Sets the function every received response is passed to, i.e. to record it into a fixture archive.
+    Streamed responses (archives) are not recorded, as their body is read by the caller.
+    :param recorder: called as recorder(url, status, headers, body), or None to stop recording
+    :return: None
+    """
+    global _recorder
+    _recorder = recorder
+
+
+def _redirect(url: str) -> str:
+    for prefix, replacement in _redirects.items():
+        if url.startswith(prefix):
+            return replacement + url[len(prefix) :]
+    return url
+
+
+def _send(url: str, target: str, max_size: Optional[int], kwargs: dict) -> requests.Response:
+    metrics.count(metrics.REQUESTS_COUNTER)
+    rate_limiter = _rate_limiter
+    if rate_limiter is not None:
+        with metrics.timer(metrics.WAIT_STAGE):
+            rate_limiter.acquire(url)
+    status, headers = None, None
+    try:
+        with metrics.timer(metrics.FETCH_STAGE):
+            response = get_session().get(target, **kwargs)
+            status, headers = response.status_code, response.headers
+            if max_size is not None:
+                _read_limited(response, url, max_size)
+    finally:
+        if rate_limiter is not None:
+            rate_limiter.release(url, status, headers)
+    return response
+
+
+def _read_limited(response: requests.Response, url: str, max_size: int) -> None:
+    try:
+        length = response.headers.get("Content-Length", "")
+        _check_size(url, int(length) if length.isdigit() else None, max_size)
+        if response.status_code < 400:
+            # The body is read as part of the fetch, like async_get_text does, so both time the same thing.
+            # It stays available as response.content.
+            response._content = read_content(response, url, max_size)
+    except (ResponseTooLarge, BinaryResponse):
+        response.close()
+        raise
+
+
+def get(url: str, max_size: Optional[int] = None, **kwargs) -> requests.Response:
+    """
+    Sends a GET request through the shared session, after the rate limiter of its host allows it.
+    Throttle responses (429 and 503) are retried the same way as async_get_text does, every attempt passing the
+    rate limiter, so it backs off as soon as the host tells us to slow down.
+    :param url: the url to fetch
+    :param max_size: if given, a response with a larger Content-Length raises ResponseTooLarge before its body
+        is downloaded, and the body of a successful response is read in chunks (see read_content) before get
+        returns, raising ResponseTooLarge or BinaryResponse without reading the rest of it
+    :param kwargs: any other arguments of requests.get
+    :return: the response
+    """
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    streamed = kwargs.get("stream", False)
+    if max_size is not None:
+        # The body is only downloaded after the size was checked
+        kwargs["stream"] = True
+
+    target = _redirect(url) if _redirects else url
+    attempt = 0
+    while True:
+        response = _send(url, target, max_size, kwargs)
+        if response.status_code not in THROTTLE_STATUS_CODES or attempt >= _session_settings["retries"]:
+            break
+        retry_after = response.headers.get("Retry-After")
+        response.close()
+        attempt += 1
+        time.sleep(
+            backoff_delay(
+                attempt,
+                _session_settings["backoff_factor"],
+                _session_settings["backoff_jitter"],
+                retry_after,
+            )
+        )
+
+    if _recorder is not None and not streamed:
+        _recorder(url, response.status_code, response.headers, response.content)
+    return response
+
+
+async def _async_read_content(
+    chunks: AsyncIterable[bytes], url: str, max_size: Optional[int]
+) -> bytes:
+    reader = _ContentReader(url, max_size)
+    async for chunk in chunks:
+        reader.feed(chunk)
+    return reader.content()
+
+
+def create_async_session(
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+    per_host: int = DEFAULT_POOL_MAXSIZE,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> aiohttp.ClientSession:
+    """
+    Creates a session for the asynchronous crawl engine which keeps connections alive and pools them per host.
+    aiohttp requests and decodes compressed responses by default.
+    Must be called from within a running event loop.
+    :param pool_maxsize: the maximum amount of connections kept open in total
+    :param per_host: the maximum amount of connections kept open per host
+    :param timeout: the total timeout of a single request in seconds
+    :return: the session
+    """
+    connector = aiohttp.TCPConnector(
+        limit=pool_maxsize, limit_per_host=per_host, ttl_dns_cache=300
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        # Times the DNS lookups and new connections, next to the fetch time of every request
+        trace_configs=[metrics.aiohttp_trace_config()],
+    )
+
+
+def backoff_delay(
+    attempt: int,
+    backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+    backoff_jitter: float = DEFAULT_BACKOFF_JITTER,
+    retry_after: Optional[str] = None,
+) -> float:
+    """
+    Computes how long to wait before retrying a request.
+    :param attempt: the number of the retry (starting at 1)
+    :param backoff_factor: the base of the exponential backoff in seconds
+    :param backoff_jitter: the maximum random jitter in seconds added to the backoff
+    :param retry_after: the value of the Retry-After header of the failed response, if any
+    :return: the delay in seconds
+    """
+    delay = backoff_factor * (2 ** (attempt - 1))
+    if retry_after is not None and retry_after.isdigit():
+        delay = max(delay, float(retry_after))
+    return delay + random.uniform(0, backoff_jitter)
+
+
+async def async_get_text(
+    session: aiohttp.ClientSession,
+    url: str,
+    retries: int = DEFAULT_RETRIES,
+    backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+    backoff_jitter: float = DEFAULT_BACKOFF_JITTER,
+    rate_limiter: Optional[RateLimiter] = None,
+    headers: Optional[Mapping[str, str]] = None,
+    max_size: Optional[int] = None,
+    raw: bool = False,
+) -> Tuple[int, Optional[Union[str, bytes]], Mapping[str, str]]:
+    """
+    Sends a GET request through an asynchronous session, retrying it the same way as the shared session does.
+    With raw, the body is read in chunks (see read_content) and returned as bytes, which also raises
+    BinaryResponse for a binary body and ResponseTooLarge as soon as the decoded body grows beyond max_size.
+    :param session: the session to use
+    :param url: the url to fetch
+    :param retries: the amount of times a request is retried
+    :param backoff_factor: the base of the exponential backoff in seconds
+    :param backoff_jitter: the maximum random jitter in seconds added to every backoff
+    :param rate_limiter: the rate limiter every attempt has to pass (it is not held while waiting to retry)
+    :param headers: extra headers to send with the request
+    :param max_size: if given, a response with a larger Content-Length raises ResponseTooLarge before its body
+        is downloaded
+    :param raw: toggle whether to return the body as bytes instead of decoding it as text
+    :return: the status code, the body (None if the request did not succeed) and the headers of the response
+    """
+    target = _redirect(url) if _redirects else url
+    attempt = 0
+    while True:
+        retry_after = None
+        status, response_headers = None, None
+        try:
+            if rate_limiter is not None:
+                with metrics.timer(metrics.WAIT_STAGE):
+                    await rate_limiter.acquire_async(url)
+            metrics.count(metrics.REQUESTS_COUNTER)
+            try:
+                with metrics.timer(metrics.FETCH_STAGE):
+                    async with session.get(target, headers=headers) as response:
+                        status, response_headers = response.status, response.headers
+                        if response.status < 400:
+                            _check_size(url, response.content_length, max_size)
+                            if raw:
+                                body = await _async_read_content(
+                                    response.content.iter_chunked(CHUNK_SIZE), url, max_size
+                                )
+                                if _recorder is not None:
+                                    _recorder(url, response.status, response.headers, body)
+                                return response.status, body, response.headers
+                            text = await response.text()
+                            if _recorder is not None:
+                                _recorder(url, response.status, response.headers, text.encode())
+                            return response.status, text, response.headers
+                        if response.status not in RETRY_STATUS_CODES or attempt >= retries:
+                            if _recorder is not None:
+                                _recorder(url, response.status, response.headers, b"")
+                            return response.status, None, response.headers
+                        retry_after = response.headers.get("Retry-After")
+            finally:
+                if rate_limiter is not None:
+                    rate_limiter.release(url, status, response_headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt >= retries:
+                raise
+
+        attempt += 1
+        await asyncio.sleep(
+            backoff_delay(attempt, backoff_factor, backoff_jitter, retry_after)
+        )
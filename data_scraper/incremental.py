@@ -0,0 +1,161 @@
+import sqlite3
+from typing import Mapping, Optional
+
+from db_writer import DatabaseWriter
+
+
+def setup_incremental_tables(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the tables used by incremental scraping if they do not exist yet.
+    :param cursor: a cursor on the scraper database
+    :return: None
+    """
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS FILE_STATE("
+        "Repo_Name      TEXT    NOT NULL,"
+        "Branch         TEXT    NOT NULL,"
+        "Path           TEXT    NOT NULL,"
+        "ETag           TEXT,"
+        "Last_Modified  TEXT,"
+        "Commit_ID      TEXT,"
+        "Updated        TIMESTAMP DEFAULT CURRENT_TIMESTAMP,"
+        "PRIMARY KEY (Repo_Name, Branch, Path)"
+        ");"
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS REPO_STATE("
+        "Repo_Name      TEXT    PRIMARY KEY NOT NULL,"
+        "Branch         TEXT,"
+        "Commit_ID      TEXT,"
+        "Updated        TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+        ");"
+    )
+
+
+class IncrementalState:
+    """
+    Class used to only fetch what changed since the last time a repository was scraped.
+    For every repository we store the commit its branch pointed at, and for every raw file the ETag and
+    Last-Modified headers it was served with. A repository whose branch still points at the same commit is
+    skipped entirely, otherwise every raw file is fetched with a conditional GET, which the server answers with
+    a bodiless 304 if the file did not change. GitHub's tree pages do not tell which folders changed, so within a
+    repository that changed, only the file downloads are saved, not the folder pages.
+    """
+
+    def __init__(self, db_path: str, writer: DatabaseWriter):
+        """
+        Constructor for the IncrementalState class.
+        :param db_path: the path to the scraper database (its tables should already be set up)
+        :param writer: the writer used for all updates to the stored state
+        """
+        self.db_path = db_path
+        self.writer = writer
+        self._commits = {}
+        self._validators = {}
+
+    def start_repository(
+        self, repo_path: str, branch_name: str, commit_id: Optional[str]
+    ) -> bool:
+        """
+        Loads what we know about a repository before it is scraped.
+        :param repo_path: the path to the repository
+        :param branch_name: the name of its branch
+        :param commit_id: the commit the branch currently points at (None if unknown)
+        :return: whether the repository changed since it was last scraped (i.e. whether it needs to be scraped)
+        """
+        connection = sqlite3.connect(self.db_path)
+        try:
+            previous = connection.execute(
+                "SELECT Branch, Commit_ID FROM REPO_STATE WHERE Repo_Name = ?;",
+                (repo_path,),
+            ).fetchone()
+            if (
+                commit_id is not None
+                and previous is not None
+                and previous == (branch_name, commit_id)
+            ):
+                return False
+
+            rows = connection.execute(
+                "SELECT Path, ETag, Last_Modified FROM FILE_STATE WHERE Repo_Name = ? AND Branch = ?;",
+                (repo_path, branch_name),
+            ).fetchall()
+        finally:
+            connection.close()
+
+        self._commits[repo_path] = commit_id
+        self._validators[repo_path] = {
+            path: (etag, last_modified) for path, etag, last_modified in rows
+        }
+        return True
+
+    def conditional_headers(self, repo_path: str, file_path: str) -> dict:
+        """
+        :param repo_path: the path to the repository
+        :param file_path: the path of the file within the repository
+        :return: the headers that make the request for the raw file conditional
+        """
+        etag, last_modified = self._validators.get(repo_path, {}).get(
+            file_path, (None, None)
+        )
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def record_file(
+        self,
+        repo_path: str,
+        branch_name: str,
+        file_path: str,
+        response_headers: Mapping[str, str],
+    ) -> None:
+        """
+        Stores the validators of a raw file that was just written to the database.
+        Its older copy is replaced by the write itself, see page_schema.INSERT_PAGE.
+        :param repo_path: the path to the repository
+        :param branch_name: the name of its branch
+        :param file_path: the path of the file within the repository
+        :param response_headers: the headers the raw file was served with
+        :return: None
+        """
+        self.writer.execute(
+            "INSERT OR REPLACE INTO FILE_STATE (Repo_Name, Branch, Path, ETag, Last_Modified, Commit_ID) "
+            "VALUES (?, ?, ?, ?, ?, ?);",
+            (
+                repo_path,
+                branch_name,
+                file_path,
+                response_headers.get("ETag"),
+                response_headers.get("Last-Modified"),
+                self._commits.get(repo_path),
+            ),
+        )
+
+    def finish_repository(
+        self, repo_path: str, branch_name: Optional[str], succeeded: bool = True
+    ) -> None:
+        """
+        Stores the commit a repository was scraped at, once all of its files were handled.
+        If any of its pages or files failed, the stored commit is dropped instead, so the next run does not skip the
+        repository and fetches the failed files again (the files that did arrive are still only fetched if they
+        changed, through their validators).
+        :param repo_path: the path to the repository
+        :param branch_name: the name of its branch
+        :param succeeded: whether all pages and files of the repository were scraped without failures
+        :return: None
+        """
+        commit_id = self._commits.pop(repo_path, None)
+        self._validators.pop(repo_path, None)
+        if not succeeded:
+            self.writer.execute("DELETE FROM REPO_STATE WHERE Repo_Name = ?;", (repo_path,))
+            return
+        if commit_id is None:
+            return
+
+        self.writer.execute(
+            "INSERT OR REPLACE INTO REPO_STATE (Repo_Name, Branch, Commit_ID) VALUES (?, ?, ?);",
+            (repo_path, branch_name, commit_id),
+        )
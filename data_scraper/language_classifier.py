@@ -0,0 +1,155 @@
+from enum import Enum
+from typing import Iterable, List, Mapping, Optional, Tuple
+
+import metrics
+
+
+class Language(Enum):
+    """
+    Enum class used to represent the programming languages that are supported.
+    The ID of a language is its position in the enum, which is stored with every scraped page,
+    so new languages are always added at the end.
+    """
+
+    Java = "Java"  # 0
+    Python = "Python"  # 1
+    Ruby = "Ruby"  # 2
+    Go = "Go"  # 3
+    C = "C"  # 4
+    CPP = "C++"  # 5
+    Scala = "Scala"  # 6
+    JavaScript = "JavaScript"  # 7
+    CSharp = "C#"  # 8
+    Readme = "Readme"  # The most useful of programming languages
+    Other = "Other"  # 10, languages added after this one keep the IDs of the ones above stable
+    TypeScript = "TypeScript"  # 11
+    Kotlin = "Kotlin"  # 12
+    Rust = "Rust"  # 13
+
+    def as_string(self):
+        return self.value
+
+
+# Precomputed once, so looking up the ID of a language is a single dictionary access
+LANGUAGE_IDS = {lan: pos for pos, lan in enumerate(Language)}
+
+# The extensions that are always scraped
+EXTENSION_LANGUAGES = {
+    ".cpp": Language.CPP,
+    ".hpp": Language.CPP,
+    ".c": Language.C,
+    ".h": Language.C,
+    ".java": Language.Java,
+    ".py": Language.Python,
+    ".scala": Language.Scala,
+    ".go": Language.Go,
+    ".js": Language.JavaScript,
+    ".cs": Language.CSharp,
+    ".rb": Language.Ruby,
+}
+
+# The extensions that are only scraped when they are enabled (see configure_languages)
+EXTRA_EXTENSION_LANGUAGES = {
+    ".tsx": Language.TypeScript,
+    ".kt": Language.Kotlin,
+    ".rs": Language.Rust,
+    ".cc": Language.CPP,
+    ".hh": Language.CPP,
+    ".pyi": Language.Python,
+}
+
+# The lookup tables in use, file names (i.e. 'Makefile') are matched before extensions
+_extensions = dict(EXTENSION_LANGUAGES)
+_filenames = {}
+
+
+def configure_languages(
+    extra_extensions: Iterable[str] = (),
+    extra_languages: Optional[Mapping[str, Language]] = None,
+) -> None:
+    """
+    Rebuilds the lookup tables used to classify files, starting from the extensions that are always scraped.
+    :param extra_extensions: extensions from EXTRA_EXTENSION_LANGUAGES to scrape as well (i.e. '.tsx')
+    :param extra_languages: any other extensions (starting with a '.') or file names to scrape, with their language
+    :return: None
+    """
+    global _extensions, _filenames
+
+    extensions = dict(EXTENSION_LANGUAGES)
+    filenames = {}
+    for extension in extra_extensions:
+        if extension not in EXTRA_EXTENSION_LANGUAGES:
+            raise ValueError(f"Unknown extra extension: {extension}")
+        extensions[extension] = EXTRA_EXTENSION_LANGUAGES[extension]
+
+    for name, language in (extra_languages or {}).items():
+        if name.startswith("."):
+            extensions[name] = language
+        else:
+            filenames[name] = language
+
+    _extensions, _filenames = extensions, filenames
+
+
+def language_table() -> dict:
+    """
+    :return: every extension and file name that is scraped with its language, which can be passed to
+        configure_languages as extra_languages to use the same configuration in another process
+    """
+    return {**_extensions, **_filenames}
+
+
+def get_lan_id(incoming_language: Language) -> int:
+    """
+    Function to get the position of the language in the Language enum.
+    :param incoming_language: The language to get the position of.
+    :return: The position of the language in the Language enum.
+    """
+    # This will give the 'other' language by default
+    return LANGUAGE_IDS.get(incoming_language, LANGUAGE_IDS[Language.Other])
+
+
+def classify_path(file_path: str) -> Optional[Language]:
+    """
+    :param file_path: The path of the file.
+    :return: The language of the file, or None if it should not be scraped.
+    """
+    name = file_path.rpartition("/")[2]
+    language = _filenames.get(name)
+    if language is None:
+        dot = name.rfind(".")
+        if dot >= 0:
+            language = _extensions.get(name[dot:])
+    return language
+
+
+@metrics.timed(metrics.CLASSIFY_STAGE)
+def classify(paths: Iterable[str]) -> List[Optional[Language]]:
+    """
+    Finds the languages of a batch of files, i.e. all files of a folder.
+    :param paths: The paths of the files.
+    :return: The language of every file, or None for files that should not be scraped.
+    """
+    # Without file names to match, only the extensions have to be looked up
+    if len(_filenames) == 0:
+        extensions = _extensions
+        return [
+            extensions.get(path[path.rfind(".") :])
+            if "." in path.rpartition("/")[2]
+            else None
+            for path in paths
+        ]
+    return [classify_path(path) for path in paths]
+
+
+# Not timed, a lookup per file is cheaper than the metrics of its own (classify times whole batches)
+def find_file_type(file_path: str) -> Tuple[bool, Language]:
+    """
+    Function to find the type of file based on the file extension.
+    :param file_path: The path of the file.
+    :return: A tuple containing a boolean value indicating if the file type was found and the language of the file.
+    """
+    language = classify_path(file_path)
+    if language is None:
+        return False, -1
+    return True, language
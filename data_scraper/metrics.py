@@ -0,0 +1,396 @@
+import functools
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPORT_INTERVAL = 30.0
+DEFAULT_METRICS_FILE = "scrape_metrics.json"
+
+# Durations are counted in buckets that grow by a factor of 2^(1/4) from 10 microseconds up to ~3 minutes,
+# so a percentile is off by at most ~19%, while recording stays O(1) and the memory constant
+HISTOGRAM_MIN = 1e-5
+HISTOGRAM_FACTOR = 2 ** 0.25
+HISTOGRAM_BUCKETS = 96
+
+# The stages of the scraper that are timed
+FETCH_STAGE = "fetch"
+WAIT_STAGE = "wait"  # waiting for the rate limiter before a request may be sent
+DNS_STAGE = "dns"
+CONNECT_STAGE = "connect"
+PARSE_STAGE = "parse"
+CLASSIFY_STAGE = "classify"
+WRITE_STAGE = "write"
+
+# The counters of the scraper
+FILES_COUNTER = "files"
+BYTES_COUNTER = "bytes"
+REQUESTS_COUNTER = "requests"
+FAILURES_COUNTER = "failures"
+SKIPPED_COUNTER = "skipped"  # files that were not downloaded (see file_prefilter.py)
+
+
+class Histogram:
+    """
+    Class used to aggregate durations into fixed logarithmic buckets, from which percentiles can be estimated.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        if seconds <= HISTOGRAM_MIN:
+            index = 0
+        else:
+            index = min(
+                math.ceil(math.log(seconds / HISTOGRAM_MIN, HISTOGRAM_FACTOR)),
+                HISTOGRAM_BUCKETS - 1,
+            )
+        with self._lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        """
+        :param fraction: the percentile as a fraction (i.e. 0.99)
+        :return: the upper bound of the bucket the percentile falls in, in seconds (0 if nothing was observed)
+        """
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            rank = fraction * self.count
+            seen = 0
+            for index, bucket in enumerate(self.buckets):
+                seen += bucket
+                if seen >= rank:
+                    return min(HISTOGRAM_MIN * HISTOGRAM_FACTOR**index, self.max)
+            return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "total_s": round(self.total, 3),
+            "mean_ms": round(1000 * self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(1000 * self.percentile(0.5), 3),
+            "p99_ms": round(1000 * self.percentile(0.99), 3),
+            "max_ms": round(1000 * self.max, 3),
+        }
+
+
+class Metrics:
+    """
+    Class used to collect the timings of every stage of the scraper and its throughput counters.
+    The same instance is shared by all threads (and coroutines) of a process.
+    """
+
+    def __init__(self):
+        self.start_time = time.monotonic()
+        self._stages = {}
+        self._counters = {}
+        self._last_snapshot = (self.start_time, {})
+        self._lock = threading.Lock()
+
+    def histogram(self, stage: str) -> Histogram:
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(stage, Histogram())
+        return histogram
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        Records how long a stage took.
+        :param stage: the name of the stage (i.e. FETCH_STAGE)
+        :param seconds: the duration in seconds
+        :return: None
+        """
+        self.histogram(stage).observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Times the code in the with block as the given stage.
+        :param stage: the name of the stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        """
+        Adds to a counter.
+        :param counter: the name of the counter (i.e. FILES_COUNTER)
+        :param amount: the amount to add
+        :return: None
+        """
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def snapshot(self) -> dict:
+        """
+        :return: the summary of every stage, and the total and rates of every counter, since the start and
+            since the previous snapshot
+        """
+        now = time.monotonic()
+        with self._lock:
+            counters = dict(self._counters)
+            stages = dict(self._stages)
+            last_time, last_counters = self._last_snapshot
+            self._last_snapshot = (now, counters)
+
+        elapsed = max(now - self.start_time, 1e-9)
+        interval = max(now - last_time, 1e-9)
+        return {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "pid": os.getpid(),
+            "elapsed_s": round(elapsed, 3),
+            "stages": {stage: stages[stage].summary() for stage in sorted(stages)},
+            "counters": {
+                counter: {
+                    "total": total,
+                    "per_second": round(total / elapsed, 3),
+                    "recent_per_second": round(
+                        (total - last_counters.get(counter, 0)) / interval, 3
+                    ),
+                }
+                for counter, total in sorted(counters.items())
+            },
+        }
+
+
+def format_snapshot(snapshot: dict) -> str:
+    """
+    :param snapshot: a snapshot returned by Metrics.snapshot
+    :return: the snapshot as a single log line
+    """
+    parts = []
+    for counter, values in snapshot["counters"].items():
+        parts.append(
+            f"{counter} {values['total']} ({values['recent_per_second']:.1f}/s)"
+        )
+    for stage, summary in snapshot["stages"].items():
+        parts.append(
+            f"{stage} p50 {summary['p50_ms']:.1f}ms p99 {summary['p99_ms']:.1f}ms (n={summary['count']})"
+        )
+    return f"[{snapshot['elapsed_s']:.0f}s] " + " | ".join(parts)
+
+
+class MetricsReporter:
+    """
+    Class used to periodically log a snapshot of the metrics and write it to a JSON file.
+    """
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        interval: float = DEFAULT_REPORT_INTERVAL,
+        json_path: Optional[str] = DEFAULT_METRICS_FILE,
+    ):
+        """
+        Constructor for the MetricsReporter class.
+        :param metrics: the metrics to report
+        :param interval: the amount of seconds between two snapshots
+        :param json_path: the file the latest snapshot is written to (None to only log it)
+        """
+        self.metrics = metrics
+        self.interval = interval
+        self.json_path = json_path
+        self._stop = threading.Event()
+        self._thread = None
+
+    def report(self) -> dict:
+        """
+        Logs a snapshot of the metrics and writes it to the JSON file.
+        :return: the snapshot
+        """
+        snapshot = self.metrics.snapshot()
+        logger.info(format_snapshot(snapshot))
+        if self.json_path is not None:
+            # Written next to the file first, so readers never see half a snapshot
+            temp_path = self.json_path + ".tmp"
+            with open(temp_path, "w", encoding="utf8") as f:
+                json.dump(snapshot, f, indent=2)
+            os.replace(temp_path, self.json_path)
+        return snapshot
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="MetricsReporter", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> dict:
+        """
+        Stops the periodic reports and reports one last time.
+        :return: the last snapshot
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.report()
+
+
+_metrics = Metrics()
+_reporter = None
+
+
+def get_metrics() -> Metrics:
+    """
+    :return: the metrics shared by every part of the scraper in this process
+    """
+    return _metrics
+
+
+def reset_metrics() -> Metrics:
+    """
+    Starts collecting from scratch, i.e. at the start of a scraping run.
+    :return: the new metrics
+    """
+    global _metrics
+    _metrics = Metrics()
+    return _metrics
+
+
+def start_reporter(
+    interval: float = DEFAULT_REPORT_INTERVAL,
+    json_path: Optional[str] = DEFAULT_METRICS_FILE,
+    per_process: bool = False,
+) -> Optional[MetricsReporter]:
+    """
+    Starts periodically reporting the shared metrics, replacing the reporter that was running before.
+    :param interval: the amount of seconds between two reports (0 to not report at all)
+    :param json_path: the file the latest snapshot is written to (None to only log it)
+    :param per_process: toggle whether to add the process id to the name of the file, i.e. for worker processes
+    :return: the reporter, or None if reporting is disabled
+    """
+    global _reporter
+
+    stop_reporter()
+    if interval <= 0:
+        return None
+    if json_path is not None and per_process:
+        root, extension = os.path.splitext(json_path)
+        json_path = f"{root}.{os.getpid()}{extension}"
+    _reporter = MetricsReporter(_metrics, interval, json_path)
+    _reporter.start()
+    return _reporter
+
+
+def stop_reporter() -> Optional[dict]:
+    """
+    Stops the reporter started with start_reporter, after it reported one last time.
+    :return: the last snapshot, or None if no reporter was running
+    """
+    global _reporter
+
+    if _reporter is None:
+        return None
+    reporter, _reporter = _reporter, None
+    return reporter.stop()
+
+
+def get_reporter_settings() -> dict:
+    """
+    :return: the settings of the running reporter, i.e. to let the reporter of another process match it
+    """
+    if _reporter is None:
+        return {"interval": 0, "json_path": None}
+    return {"interval": _reporter.interval, "json_path": _reporter.json_path}
+
+
+def timer(stage: str):
+    """
+    Times the code in the with block as the given stage of the shared metrics.
+    :param stage: the name of the stage
+    """
+    return _metrics.timer(stage)
+
+
+def count(counter: str, amount: int = 1) -> None:
+    """
+    Adds to a counter of the shared metrics.
+    :param counter: the name of the counter
+    :param amount: the amount to add
+    :return: None
+    """
+    _metrics.count(counter, amount)
+
+
+def timed(stage: str):
+    """
+    Decorator that times every call of the function as the given stage of the shared metrics.
+    :param stage: the name of the stage
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _metrics.observe(stage, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def aiohttp_trace_config():
+    """
+    :return: an aiohttp TraceConfig that times the DNS lookups and new connections of an asynchronous session
+    """
+
+    def start(trace_config_ctx, stage):
+        trace_config_ctx.starts[stage] = time.perf_counter()
+
+    def end(trace_config_ctx, stage):
+        started = trace_config_ctx.starts.pop(stage, None)
+        if started is not None:
+            _metrics.observe(stage, time.perf_counter() - started)
+
+    async def on_dns_start(session, ctx, params):
+        start(ctx, DNS_STAGE)
+
+    async def on_dns_end(session, ctx, params):
+        end(ctx, DNS_STAGE)
+
+    async def on_connect_start(session, ctx, params):
+        start(ctx, CONNECT_STAGE)
+
+    async def on_connect_end(session, ctx, params):
+        end(ctx, CONNECT_STAGE)
+
+    trace_config = aiohttp.TraceConfig(trace_config_ctx_factory=_TraceContext)
+    trace_config.on_dns_resolvehost_start.append(on_dns_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_end)
+    trace_config.on_connection_create_start.append(on_connect_start)
+    trace_config.on_connection_create_end.append(on_connect_end)
+    return trace_config
+
+
+class _TraceContext:
+    def __init__(self, trace_request_ctx=None):
+        self.trace_request_ctx = trace_request_ctx
+        self.starts = {}
@@ -0,0 +1,113 @@
+import argparse
+import logging
+import os
+import sqlite3
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(filename)s:%(lineno)d]:  %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Stored in PRAGMA user_version, every migration below moves a database one version up
+SCHEMA_VERSION = 1
+
+# Every file is stored once per repository and branch. A file that is scraped again replaces its older row,
+# and gets a new ID, so an incremental export (see upload_db.py) picks up the new version
+INSERT_PAGE = (
+    "INSERT OR REPLACE INTO SCRAPED_PAGE (Repo_Name, Branch, Path, Date_Scraped, Language_ID, Blob_Hash) "
+    "VALUES (?, ?, ?, ?, ?, ?);"
+)
+
+PAGE_INDEXES = (
+    # The key of a file, which also serves every lookup by repository (i.e. the pages of one repository)
+    "CREATE UNIQUE INDEX IF NOT EXISTS SCRAPED_PAGE_KEY ON SCRAPED_PAGE (Repo_Name, Branch, Path);",
+    # Counting or selecting the pages of a language without reading the rows themselves
+    "CREATE INDEX IF NOT EXISTS SCRAPED_PAGE_LANGUAGE ON SCRAPED_PAGE (Language_ID, Repo_Name);",
+    # Finding the blobs no page refers to anymore
+    "CREATE INDEX IF NOT EXISTS SCRAPED_PAGE_BLOB ON SCRAPED_PAGE (Blob_Hash);",
+)
+
+
+def get_schema_version(cursor: sqlite3.Cursor) -> int:
+    """
+    :param cursor: a cursor on the scraper database
+    :return: the version of the schema of the database (0 for databases from before it was versioned)
+    """
+    return cursor.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def _migrate_to_unique_pages(cursor: sqlite3.Cursor) -> None:
+    # Re-scrapes used to append a new row for every file, only the latest one is kept
+    cursor.execute(
+        "DELETE FROM SCRAPED_PAGE WHERE ID NOT IN "
+        "(SELECT MAX(ID) FROM SCRAPED_PAGE GROUP BY Repo_Name, Branch, Path);"
+    )
+    if cursor.rowcount > 0:
+        logger.info(f"Removed {cursor.rowcount} duplicate pages")
+
+    for index in PAGE_INDEXES:
+        cursor.execute(index)
+
+    cursor.execute(
+        "DELETE FROM PAGE_BLOB WHERE Hash NOT IN "
+        "(SELECT Blob_Hash FROM SCRAPED_PAGE WHERE Blob_Hash IS NOT NULL);"
+    )
+    if cursor.rowcount > 0:
+        logger.info(f"Removed {cursor.rowcount} blobs that were no longer used")
+
+
+# The migration that brings a database from version i to version i + 1
+MIGRATIONS = (_migrate_to_unique_pages,)
+
+
+def migrate_schema(cursor: sqlite3.Cursor) -> None:
+    """
+    Brings the SCRAPED_PAGE table of a database up to the current schema version, one migration at a time.
+    Every migration is committed together with its new version, so an interrupted migration is simply run again.
+    The page and blob tables should already exist.
+    :param cursor: a cursor on the scraper database
+    :return: None
+    """
+    version = get_schema_version(cursor)
+    if version > SCHEMA_VERSION:
+        raise ValueError(
+            f"The database has schema version {version}, this scraper only knows up to {SCHEMA_VERSION}"
+        )
+
+    for migration in MIGRATIONS[version:]:
+        logger.info(f"Migrating the database from schema version {version} to {version + 1}")
+        migration(cursor)
+        version += 1
+        # PRAGMA does not take parameters, the version is always one of our own integers
+        cursor.execute(f"PRAGMA user_version = {version};")
+        cursor.connection.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Migrate a scraper database to the current schema version."
+    )
+
+    parser.add_argument(
+        "--dataset",
+        "-d",
+        type=str,
+        required=False,
+        default="scraped_repos.db",
+        help="The path to the scraper database.",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Input Validation
+    if not os.path.exists(args.dataset):
+        raise ValueError("The dataset path provided does not exist.")
+
+    # Setting up the database creates any missing table and runs the migrations
+    from scraper import setup_database
+
+    setup_database(args.dataset)
@@ -0,0 +1,330 @@
+import logging
+import multiprocessing
+import queue
+import signal
+import sys
+import threading
+import time
+from typing import Callable, List, Optional
+
+from db_writer import DatabaseWriter, set_writer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+# Amount of batches that may wait for the parent before the workers block, so memory stays bounded
+DEFAULT_QUEUE_SIZE = 1000
+# How often the parent checks whether a worker died without saying goodbye
+POLL_INTERVAL = 0.5
+
+# Messages from the workers to the parent
+WRITE_MESSAGE = "write"
+START_MESSAGE = "start"
+FINISH_MESSAGE = "finish"
+EXIT_MESSAGE = "exit"
+
+
+class QueueWriter:
+    """
+    Class used by a worker process in place of the DatabaseWriter.
+    It sends the statements in batches to the parent process, where the single DatabaseWriter executes them.
+    Every message of a worker arrives in the order it was sent, so statements always arrive before the message
+    that their repository is finished.
+    """
+
+    def __init__(self, results: multiprocessing.Queue, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        Constructor for the QueueWriter class.
+        :param results: the queue the parent process reads from
+        :param batch_size: the amount of statements sent to the parent at a time
+        """
+        self.results = results
+        self.batch_size = batch_size
+        self._batch = []
+
+    def execute(self, statement: str, params: tuple = ()) -> None:
+        """
+        Queues a statement to be executed by the writer of the parent process.
+        :param statement: the sql statement
+        :param params: the parameters of the statement
+        :return: None
+        """
+        self._batch.append((statement, params))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Sends the statements that are still buffered to the parent process.
+        Unlike DatabaseWriter.flush, this does not wait for them to be committed.
+        :return: None
+        """
+        if self._batch:
+            self.results.put((WRITE_MESSAGE, self._batch))
+            self._batch = []
+
+    def send(self, message: tuple) -> None:
+        """
+        Sends a message to the parent process, after the statements buffered before it.
+        :param message: the message
+        :return: None
+        """
+        self.flush()
+        self.results.put(message)
+
+    def close(self) -> None:
+        self.flush()
+
+
+def _exit_on_terminate(signum, frame):
+    # Unwinds the worker through its finally block, which hands the buffered statements to the parent
+    sys.exit(0)
+
+
+def _worker_main(
+    worker_id: int,
+    repo_paths: list,
+    next_index,
+    stop,
+    results: multiprocessing.Queue,
+    scrape: Callable[[str], bool],
+    setup: Optional[Callable],
+    setup_args: tuple,
+) -> None:
+    # Ctrl-C is handled by the parent, which then stops the workers with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _exit_on_terminate)
+
+    writer = QueueWriter(results)
+    set_writer(writer)
+    try:
+        if setup is not None:
+            setup(*setup_args)
+
+        while not stop.is_set():
+            # The repositories are handed out one at a time, so a worker with small repositories takes on more
+            with next_index.get_lock():
+                index = next_index.value
+                next_index.value += 1
+            if index >= len(repo_paths):
+                break
+
+            repo_path = repo_paths[index]
+            writer.send((START_MESSAGE, worker_id, repo_path))
+            error = None
+            try:
+                # The scrape functions report their own failures, they only tell whether the repository is complete
+                if not scrape(repo_path):
+                    error = "some of its pages or files failed"
+            except Exception as e:
+                logger.exception(f"Worker {worker_id} failed to scrape {repo_path}")
+                error = f"{type(e).__name__}: {e}"
+            writer.send((FINISH_MESSAGE, worker_id, repo_path, error))
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        writer.send((EXIT_MESSAGE, worker_id))
+
+
+class _Worker:
+    def __init__(self, process: multiprocessing.Process):
+        self.process = process
+        self.current = None
+
+
+class ProcessScraper:
+    """
+    Class used to scrape a list of repositories with a pool of worker processes, so parsing is not bound to a
+    single core. Every worker runs its own (sequential) fetch loop over the repositories it takes from the
+    shared list. The workers do not write to the database themselves, their statements are sent to the parent
+    process, which executes them with its single DatabaseWriter.
+
+    A worker that raises an exception only fails the repository it was scraping, and a worker process that dies
+    is replaced by a new one (the repository it was scraping is counted as failed). When the parent is
+    interrupted (Ctrl-C), the workers are stopped, and every statement they buffered is still written before
+    the parent returns.
+    """
+
+    def __init__(
+        self,
+        writer: DatabaseWriter,
+        scrape: Callable[[str], bool],
+        setup: Optional[Callable] = None,
+        setup_args: tuple = (),
+        processes: Optional[int] = None,
+        on_finish: Optional[Callable[[str], None]] = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+    ):
+        """
+        Constructor for the ProcessScraper class.
+        :param writer: the writer that executes the statements of all workers
+        :param scrape: function that scrapes a single repository in a worker and returns whether it was scraped
+            completely, it has to be picklable (i.e. a module level function), as the workers are spawned
+        :param setup: function called once in every worker before it starts scraping (picklable as well)
+        :param setup_args: the arguments of the setup function
+        :param processes: the amount of worker processes (defaults to the amount of cores)
+        :param on_finish: called in the parent with every repository that was scraped completely, after all of its
+            statements were handed to the writer (repositories for which scrape returned False count as failed)
+        :param queue_size: the maximum amount of statement batches waiting for the parent
+        """
+        self.writer = writer
+        self.scrape = scrape
+        self.setup = setup
+        self.setup_args = setup_args
+        self.processes = processes or multiprocessing.cpu_count()
+        self.on_finish = on_finish
+        self.queue_size = queue_size
+
+        self.finished = 0
+        self.failed = []
+        self._workers = {}
+        self._next_worker_id = 0
+
+    def _spawn(self) -> None:
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+        process = self._context.Process(
+            target=_worker_main,
+            name=f"ScrapeWorker-{worker_id}",
+            args=(
+                worker_id,
+                self._repo_paths,
+                self._next_index,
+                self._stop,
+                self._results,
+                self.scrape,
+                self.setup,
+                self.setup_args,
+            ),
+        )
+        process.start()
+        self._workers[worker_id] = _Worker(process)
+
+    def _report(self, repo_path: str, error: Optional[str]) -> None:
+        if error is None:
+            self.finished += 1
+            if self.on_finish is not None:
+                self.on_finish(repo_path)
+        else:
+            self.failed.append(repo_path)
+            logger.error(f"Failed to scrape {repo_path}: {error}")
+
+        done = self.finished + len(self.failed)
+        elapsed = time.monotonic() - self._start_time
+        logger.info(
+            f"finished {done} out of {len(self._repo_paths)} ({len(self.failed)} failed, "
+            f"{done / elapsed:.2f} repositories per second, {len(self._workers)} workers)"
+        )
+
+    def _handle(self, message: tuple) -> None:
+        kind = message[0]
+        if kind == WRITE_MESSAGE:
+            for statement, params in message[1]:
+                self.writer.execute(statement, params)
+        elif kind == START_MESSAGE:
+            _, worker_id, repo_path = message
+            self._workers[worker_id].current = repo_path
+        elif kind == FINISH_MESSAGE:
+            _, worker_id, repo_path, error = message
+            self._workers[worker_id].current = None
+            self._report(repo_path, error)
+        elif kind == EXIT_MESSAGE:
+            worker = self._workers.pop(message[1])
+            worker.process.join()
+
+    def _check_workers(self) -> None:
+        """
+        Replaces the workers that died without an exit message.
+        This is only called when the queue is empty, so every message the dead worker sent has been handled.
+        """
+        for worker_id, worker in list(self._workers.items()):
+            if worker.process.is_alive():
+                continue
+            del self._workers[worker_id]
+            if self._stop.is_set() and worker.current is None:
+                # Stopped before it got to scraping, there is nothing to report
+                continue
+            logger.error(
+                f"Worker {worker_id} died with exit code {worker.process.exitcode}"
+            )
+            if worker.current is None:
+                # It did not even get to a repository (i.e. its setup failed), a new one would fail just as well
+                continue
+
+            self._report(worker.current, "the worker process died")
+            if not self._stop.is_set() and self._next_index.value < len(self._repo_paths):
+                self._spawn()
+
+    def _interrupt(self, signum, frame) -> None:
+        # Handling the interrupt here, instead of with a KeyboardInterrupt, makes sure it never lands halfway
+        # through handing a batch of statements to the writer
+        if self._stop.is_set():
+            return
+        logger.warning("Interrupted, stopping the workers and writing what they scraped so far")
+        self._stop.set()
+        for worker in self._workers.values():
+            worker.process.terminate()
+
+    def _run(self) -> None:
+        last_check = time.monotonic()
+        while self._workers:
+            try:
+                message = self._results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                message = None
+            if message is not None:
+                self._handle(message)
+
+            if time.monotonic() - last_check >= POLL_INTERVAL and self._results.empty():
+                self._check_workers()
+                last_check = time.monotonic()
+
+    def scrape_repositories(self, repo_paths: list) -> List[str]:
+        """
+        Scrapes the repositories with the pool of worker processes, and returns once all of them are done.
+        :param repo_paths: the paths to the repositories
+        :return: the paths of the repositories that failed
+        """
+        self._context = multiprocessing.get_context("spawn")
+        self._repo_paths = list(repo_paths)
+        self._results = self._context.Queue(maxsize=self.queue_size)
+        self._next_index = self._context.Value("i", 0)
+        self._stop = self._context.Event()
+        self._start_time = time.monotonic()
+
+        # Signal handlers can only be installed from the main thread
+        handle_interrupt = threading.current_thread() is threading.main_thread()
+        if handle_interrupt:
+            previous_handler = signal.signal(signal.SIGINT, self._interrupt)
+        try:
+            for _ in range(min(self.processes, len(self._repo_paths))):
+                self._spawn()
+            self._run()
+        finally:
+            if handle_interrupt:
+                signal.signal(signal.SIGINT, previous_handler)
+
+        not_scraped = len(self._repo_paths) - self.finished - len(self.failed)
+        if not_scraped > 0:
+            logger.warning(f"{not_scraped} repositories were not scraped")
+        if self._stop.is_set():
+            # Everything the workers sent is with the writer now, the caller can stop as usual
+            raise KeyboardInterrupt
+        return self.failed
+
+
+def scrape_repositories_multiprocess(
+    repo_paths: list,
+    writer: DatabaseWriter,
+    scrape: Callable[[str], bool],
+    **kwargs,
+) -> List[str]:
+    """
+    Scrapes the repositories with a pool of worker processes, see ProcessScraper.
+    :param repo_paths: the paths to the repositories
+    :param writer: the writer that executes the statements of all workers
+    :param scrape: module level function that scrapes a single repository in a worker, returning whether it was
+        scraped completely
+    :param kwargs: any other settings of ProcessScraper (setup, processes, on_finish, ...)
+    :return: the paths of the repositories that failed
+    """
+    return ProcessScraper(writer, scrape, **kwargs).scrape_repositories(repo_paths)
@@ -0,0 +1,197 @@
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+from urllib.parse import urlsplit
+
+DEFAULT_RATE = 10.0  # requests per second per host we start out with
+DEFAULT_MIN_RATE = 0.5
+DEFAULT_MAX_RATE = 100.0
+DEFAULT_MAX_CONCURRENCY = 8
+# Every successful response raises the rate by increase_step / rate, i.e. by about increase_step per second
+DEFAULT_INCREASE_STEP = 1.0
+DEFAULT_DECREASE_FACTOR = 0.5
+# A burst of throttled responses to requests that were all sent at the old rate should only count once
+DECREASE_COOLDOWN = 1.0
+# How often a request waiting for a free concurrency slot checks again
+SLOT_POLL_INTERVAL = 0.05
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    :param value: the value of a Retry-After header, either in seconds or as an http date
+    :return: the amount of seconds to wait, or None if there is no (valid) header
+    """
+    if value is None:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttled(status: int, headers: Mapping[str, str]) -> bool:
+    """
+    GitHub answers too many requests with a 429, or with a 403 that carries rate limit headers (abuse detection).
+    :param status: the status code of the response
+    :param headers: the headers of the response
+    :return: whether the response tells us to slow down
+    """
+    if status in THROTTLE_STATUS_CODES:
+        return True
+    return status == 403 and (
+        "Retry-After" in headers or headers.get("X-RateLimit-Remaining") == "0"
+    )
+
+
+class HostThrottle:
+    """
+    Class used to throttle the requests to a single host.
+    It combines a token bucket, which limits the amount of requests per second, with a limit on the amount of
+    requests in flight. Both limits adapt to the responses of the host (AIMD): they grow slowly while requests
+    succeed, and are halved as soon as the host tells us to slow down, so the throughput settles just under
+    the limit of the host instead of alternating between bursts and bans.
+    """
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE,
+        min_rate: float = DEFAULT_MIN_RATE,
+        max_rate: float = DEFAULT_MAX_RATE,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        increase_step: float = DEFAULT_INCREASE_STEP,
+        decrease_factor: float = DEFAULT_DECREASE_FACTOR,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = float(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._tokens = max(rate, 1.0)
+        self._last_refill = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        # The bucket holds at most one second worth of requests, so bursts stay small
+        capacity = max(self.rate, 1.0)
+        self._tokens = min(capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def try_acquire(self) -> float:
+        """
+        Tries to take a token and a concurrency slot for a request.
+        :return: 0 if the request may be sent now, otherwise the amount of seconds to wait before trying again
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.in_flight >= max(int(self.concurrency), 1):
+                return SLOT_POLL_INTERVAL
+
+            self._refill(now)
+            if self._tokens < 1.0:
+                return (1.0 - self._tokens) / self.rate
+
+            self._tokens -= 1.0
+            self.in_flight += 1
+            return 0.0
+
+    def release(self, status: Optional[int], headers: Mapping[str, str]) -> None:
+        """
+        Gives back the concurrency slot of a finished request and adapts the limits to its response.
+        :param status: the status code of the response (None if no response was received)
+        :param headers: the headers of the response
+        :return: None
+        """
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+
+            if status is not None and is_throttled(status, headers):
+                retry_after = _parse_retry_after(headers.get("Retry-After"))
+                if retry_after is not None:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                if now - self._last_decrease >= DECREASE_COOLDOWN:
+                    self._last_decrease = now
+                    self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                    self.concurrency = max(1.0, self.concurrency * self.decrease_factor)
+            elif status is not None and status < 400:
+                self.rate = min(self.max_rate, self.rate + self.increase_step / self.rate)
+                self.concurrency = min(
+                    float(self.max_concurrency), self.concurrency + 1 / self.concurrency
+                )
+
+            # GitHub tells us how many requests we have left before we get blocked until the reset time
+            if headers.get("X-RateLimit-Remaining") == "0":
+                reset = headers.get("X-RateLimit-Reset", "")
+                if reset.isdigit():
+                    self.paused_until = max(
+                        self.paused_until, now + max(float(reset) - time.time(), 0)
+                    )
+
+
+class RateLimiter:
+    """
+    Class used to keep a HostThrottle for every host the scraper talks to.
+    It can be used from both the sequential scraper (acquire) and the asynchronous crawl engine (acquire_async).
+    """
+
+    def __init__(self, **throttle_settings):
+        """
+        Constructor for the RateLimiter class.
+        :param throttle_settings: the settings of every HostThrottle (rate, max_rate, max_concurrency, ...)
+        """
+        self.throttle_settings = throttle_settings
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def throttle(self, url: str) -> HostThrottle:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = HostThrottle(**self.throttle_settings)
+            return self._hosts[host]
+
+    def acquire(self, url: str) -> None:
+        """
+        Blocks until a request to the url may be sent.
+        :param url: the url that is about to be requested
+        :return: None
+        """
+        throttle = self.throttle(url)
+        while (delay := throttle.try_acquire()) > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, url: str) -> None:
+        """
+        Waits until a request to the url may be sent, without blocking the event loop.
+        :param url: the url that is about to be requested
+        :return: None
+        """
+        throttle = self.throttle(url)
+        while (delay := throttle.try_acquire()) > 0:
+            await asyncio.sleep(delay)
+
+    def release(
+        self, url: str, status: Optional[int], headers: Optional[Mapping[str, str]] = None
+    ) -> None:
+        """
+        Reports the response of a request that was acquired before.
+        :param url: the url that was requested
+        :param status: the status code of the response (None if no response was received)
+        :param headers: the headers of the response
+        :return: None
+        """
+        self.throttle(url).release(status, headers or {})
@@ -0,0 +1,310 @@
+import argparse
+import http.server
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from typing import Dict, List, Mapping, Optional
+from urllib.parse import unquote, urlsplit
+
+import file_prefilter
+import http_session
+import scraper
+from db_writer import DatabaseWriter, set_writer
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(filename)s:%(lineno)d]:  %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+FIXTURE_VERSION = 1
+INDEX_NAME = "index.json"
+# Only the headers the scraper looks at are kept
+RECORDED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+# Responses that only tell something about the moment they were recorded at, errors are injected by the server instead
+UNRECORDED_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def _fixture_key(url: str) -> str:
+    """
+    :param url: the url that was requested
+    :return: the key its response is stored under, the url without its scheme (i.e. 'github.com/{user}/{repo}')
+    """
+    parts = urlsplit(url)
+    return unquote(parts.netloc + parts.path)
+
+
+class FixtureRecorder:
+    """
+    Class used to record the responses the scraper receives into a fixture archive, which a ReplayServer can
+    serve again later. The archive is a zip file with the (compressed) body of every response and an index of
+    the urls, status codes and headers.
+    """
+
+    def __init__(self, archive_path: str):
+        """
+        Constructor for the FixtureRecorder class, which creates the archive.
+        :param archive_path: the path of the fixture archive
+        """
+        self.archive_path = archive_path
+        self.repositories = []
+        self._archive = zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_DEFLATED)
+        self._responses = {}
+        self._lock = threading.Lock()
+
+    def record(self, url: str, status: int, headers: Mapping[str, str], body: bytes) -> None:
+        """
+        Adds a response to the archive (see http_session.set_recorder), the first response for every url is kept.
+        :param url: the url that was requested
+        :param status: the status code of the response
+        :param headers: the headers of the response
+        :param body: the (decoded) body of the response
+        :return: None
+        """
+        if status in UNRECORDED_STATUS_CODES:
+            return
+        key = _fixture_key(url)
+        with self._lock:
+            if key in self._responses:
+                return
+            member = f"bodies/{len(self._responses)}"
+            self._archive.writestr(member, body)
+            self._responses[key] = {
+                "status": status,
+                "headers": {name: headers[name] for name in RECORDED_HEADERS if name in headers},
+                "body": member,
+            }
+
+    def __len__(self):
+        return len(self._responses)
+
+    def close(self) -> None:
+        """
+        Writes the index and closes the archive.
+        :return: None
+        """
+        index = {
+            "version": FIXTURE_VERSION,
+            "repositories": self.repositories,
+            "responses": self._responses,
+        }
+        self._archive.writestr(INDEX_NAME, json.dumps(index))
+        self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def record_fixtures(archive_path: str, repositories: List[str]) -> None:
+    """
+    Scrapes the repositories with the sequential scraper, and records every response into a fixture archive.
+    Files of every size are recorded, so the archive can be replayed with any --max-file-size.
+    :param archive_path: the path of the fixture archive
+    :param repositories: the paths to the repositories (i.e. {user}/{repository})
+    :return: None
+    """
+    prefilter_settings = file_prefilter.get_prefilter_settings()
+    file_prefilter.configure_prefilter(max_file_size=0, repo_byte_budget=0)
+    with tempfile.TemporaryDirectory() as temp_dir, FixtureRecorder(archive_path) as recorder:
+        recorder.repositories = list(repositories)
+        db_path = os.path.join(temp_dir, "record.db")
+        scraper.setup_database(db_path)
+        writer = DatabaseWriter(db_path)
+        set_writer(writer)
+        http_session.set_recorder(recorder.record)
+        try:
+            scraper.scrape_repositories(repositories)
+        finally:
+            http_session.set_recorder(None)
+            file_prefilter.configure_prefilter(**prefilter_settings)
+            writer.close()
+            set_writer(None)
+        logger.info(f"Recorded {len(recorder)} responses to {archive_path}")
+
+
+class _ReplayHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # The headers and body are written separately, which would otherwise stall on delayed acks
+    disable_nagle_algorithm = True
+    server: "_ReplayHTTPServer"
+
+    def do_GET(self):
+        replay = self.server.replay
+        status, headers, body = replay.respond(self.path, self.headers)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ReplayHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, replay: "ReplayServer"):
+        super().__init__(address, _ReplayHandler)
+        self.replay = replay
+
+    def handle_error(self, request, client_address):
+        # Clients close their connections early all the time (the size limit, cancelled requests, a finished run)
+        error = sys.exc_info()[1]
+        if isinstance(error, (ConnectionResetError, BrokenPipeError)):
+            return
+        logger.error(f"Error while serving a request from {client_address[0]}:{client_address[1]}", exc_info=True)
+
+
+class ReplayServer:
+    """
+    Class used to serve a fixture archive over http on the local machine, so the scraper can be run (and
+    benchmarked) without GitHub. Every response can be delayed, and a fraction of the requests can be answered
+    with an error instead, to see how the scraper copes with a slow or flaky server.
+    A request for http://host:port/{original host}/{path} is answered with the recorded response for
+    https://{original host}/{path}, see redirects().
+    """
+
+    def __init__(
+        self,
+        archive_path: str,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        error_rate: float = 0,
+        error_status: int = 503,
+        seed: Optional[int] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        Constructor for the ReplayServer class, which loads the archive.
+        :param archive_path: the path of the fixture archive
+        :param latency_ms: the delay of every response in milliseconds
+        :param jitter_ms: the maximum random delay in milliseconds added to every response
+        :param error_rate: the fraction of the requests that is answered with error_status
+        :param error_status: the status code of the injected errors
+        :param seed: the seed of the random generator used for the jitter and errors
+        :param host: the address to listen on
+        :param port: the port to listen on (0 to pick a free one)
+        """
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+
+        with zipfile.ZipFile(archive_path) as archive:
+            index = json.loads(archive.read(INDEX_NAME))
+            if index.get("version") != FIXTURE_VERSION:
+                raise ValueError(f"Unsupported fixture version: {index.get('version')}")
+            self.repositories = index["repositories"]
+            self._responses = {
+                key: (response["status"], response["headers"], archive.read(response["body"]))
+                for key, response in index["responses"].items()
+            }
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _ReplayHTTPServer((host, port), self)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def redirects(self) -> Dict[str, str]:
+        """
+        :return: the redirects that send the requests of the scraper to this server (see http_session.set_redirects)
+        """
+        hosts = sorted({key.split("/", 1)[0] for key in self._responses})
+        return {f"https://{host}/": f"{self.url}{host}/" for host in hosts}
+
+    def respond(self, path: str, request_headers: Mapping[str, str]):
+        """
+        :param path: the path that was requested from this server
+        :param request_headers: the headers of the request
+        :return: the status code, headers and body to answer with
+        """
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            return self.error_status, {}, b""
+
+        response = self._responses.get(unquote(urlsplit(path).path.lstrip("/")))
+        if response is None:
+            return 404, {}, b""
+        status, headers, body = response
+        # Conditional requests of incremental runs are answered like GitHub does
+        etag = headers.get("ETag")
+        if etag is not None and request_headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return status, headers, body
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="ReplayServer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Record the responses of GitHub for a set of repositories into a fixture archive."
+    )
+
+    parser.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        required=False,
+        default="fixtures.zip",
+        help="The path of the fixture archive.",
+    )
+
+    parser.add_argument(
+        "--repos",
+        "-r",
+        type=str,
+        nargs="+",
+        required=True,
+        help="The repositories to record (i.e. ManimCommunity/manim).",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    record_fixtures(args.output, args.repos)
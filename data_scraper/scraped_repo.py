@@ -1,75 +1,91 @@
+import sys
+from array import array
 from datetime import datetime
-from enum import Enum
+from typing import Optional, Union
 
+# The language classification used to live here, it is imported for the code that still expects it here
+from language_classifier import Language, find_file_type, get_lan_id
 
-class Language(Enum):
-    """
-    Enum class used to represent the programming languages that are supported.
-    """
-
-    Java = "Java"  # 0
-    Python = "Python"  # 1
-    Ruby = "Ruby"  # 2
-    Go = "Go"  # 3
-    C = "C"  # 4
-    CPP = "C++"  # 5
-    Scala = "Scala"  # 6
-    JavaScript = "JavaScript"  # 7
-    CSharp = "C#"  # 8
-    Readme = "Readme"  # The most useful of programming languages
-    Other = "Other"  # 10, always keep this one last
-
-    def as_string(self):
-        return self.value
+# File bodies are appended to chunks of this size, a file that does not fit in one gets a chunk of its own
+DEFAULT_ARENA_CHUNK_SIZE = 1024 * 1024
 
 
-def get_lan_id(incoming_language: Language) -> int:
+class ContentArena:
     """
-    Function to get the position of the language in the Language enum.
-    :param incoming_language: The language to get the position of.
-    :return: The position of the language in the Language enum.
+    Class used to store the bodies of many files in a few large buffers instead of one string object per file.
+    The bodies are appended as utf-8 to fixed size chunks, which are never resized, so memoryviews into them stay
+    valid. Where every body starts is kept in flat arrays, so a stored body costs a few bytes of bookkeeping
+    instead of a full object.
     """
 
-    pos = 0
-    other_pos = 0
-    for lan in list(Language):
-        if lan == incoming_language:
-            return pos
+    __slots__ = ("chunk_size", "_chunks", "_open", "_used", "_chunk_ids", "_offsets", "_lengths")
 
-        if lan.value == "Other":
-            other_pos = pos
-        pos += 1
-
-    return other_pos  # This will give the 'other' language by default
+    def __init__(self, chunk_size: int = DEFAULT_ARENA_CHUNK_SIZE):
+        """
+        Constructor for the ContentArena class.
+        :param chunk_size: The size of the buffers the bodies are appended to, in bytes.
+        """
+        self.chunk_size = chunk_size
+        self._chunks = []
+        # The chunk bodies are currently appended to, and how much of it is used
+        self._open = -1
+        self._used = 0
+        self._chunk_ids = array("I")
+        self._offsets = array("Q")
+        self._lengths = array("Q")
+
+    def store(self, content: Union[str, bytes]) -> int:
+        """
+        Appends the body of a file to the arena.
+        :param content: The body of the file, strings are stored as utf-8.
+        :return: The handle the body can be read back with.
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8", errors="surrogatepass")
+        length = len(content)
+
+        if length > self.chunk_size:
+            # Too big to share a chunk, it gets one of exactly its size (and the open chunk stays open)
+            chunk_id, offset = len(self._chunks), 0
+            self._chunks.append(bytearray(content))
+        else:
+            if self._open < 0 or self._used + length > self.chunk_size:
+                self._open = len(self._chunks)
+                self._chunks.append(bytearray(self.chunk_size))
+                self._used = 0
+            chunk_id, offset = self._open, self._used
+            self._chunks[chunk_id][offset : offset + length] = content
+            self._used += length
+
+        self._chunk_ids.append(chunk_id)
+        self._offsets.append(offset)
+        self._lengths.append(length)
+        return len(self._lengths) - 1
+
+    def view(self, handle: int) -> memoryview:
+        """
+        :param handle: The handle returned when the body was stored.
+        :return: A read-only view of the utf-8 body, without copying it.
+        """
+        offset = self._offsets[handle]
+        chunk = memoryview(self._chunks[self._chunk_ids[handle]]).toreadonly()
+        return chunk[offset : offset + self._lengths[handle]]
 
+    def text(self, handle: int) -> str:
+        """
+        :param handle: The handle returned when the body was stored.
+        :return: The body decoded to a string.
+        """
+        return str(self.view(handle), "utf-8", "surrogatepass")
 
-def find_file_type(file_path: str) -> (bool, int):
-    """
-    Function to find the type of file based on the file extension.
-    :param file_path: The path of the file.
-    :return: A tuple containing a boolean value indicating if the file type was found and the language of the file.
-    """
+    def __len__(self) -> int:
+        return len(self._lengths)
 
-    if file_path[-4:] == ".cpp" or file_path[-4:] == ".hpp":
-        return True, Language.CPP
-    elif file_path[-2:] == ".c" or file_path[-2:] == ".h":
-        return True, Language.C
-    elif file_path[-5:] == ".java":
-        return True, Language.Java
-    elif file_path[-3:] == ".py":
-        return True, Language.Python
-    elif file_path[-6:] == ".scala":
-        return True, Language.Scala
-    elif file_path[-3:] == ".go":
-        return True, Language.Go
-    elif file_path[-3:] == ".js":
-        return True, Language.JavaScript
-    elif file_path[-3:] == ".cs":
-        return True, Language.CSharp
-    elif file_path[-3:] == ".rb":
-        return True, Language.Ruby
-
-    return False, -1
+    def nbytes(self) -> int:
+        """
+        :return: The amount of memory reserved for bodies, in bytes.
+        """
+        return sum(len(chunk) for chunk in self._chunks)
 
 
 class RepoFile:
@@ -79,12 +95,17 @@ class RepoFile:
 
     Attributes:
     path -> str: The path of the file in the repository.
-    branch -> str: The branch of the repository where the file was found.
+    branch -> str: The branch of the repository where the file was found (interned, as all files share it).
     raw_content -> str: The raw content of the file.
     last_commit_date -> datetime: The date of the last commit that modified the file.
     language -> Language: The language of the file (i.e. Java, C++, Python, etc).
+
+    Once the file is added to a ScrapedRepo, its content is moved into the arena of the repository, and
+    raw_content decodes it from there on access (content_view gives it without copying).
     """
 
+    __slots__ = ("path", "branch", "_content", "_arena", "last_commit_date", "language")
+
     def __init__(
         self,
         path: str,
@@ -94,26 +115,65 @@ class RepoFile:
         language: Language,
     ):
         self.path = path
-        self.branch = branch
-        self.raw_content = raw_content
+        self.branch = sys.intern(branch)
+        self._content = raw_content
+        self._arena = None
         self.last_commit_date = last_commit_date
         self.language = language
 
+    @property
+    def raw_content(self) -> str:
+        if self._arena is None:
+            return self._content
+        return self._arena.text(self._content)
+
+    @raw_content.setter
+    def raw_content(self, raw_content: str) -> None:
+        self._content = raw_content
+        self._arena = None
+
+    @property
+    def content_view(self) -> memoryview:
+        if self._arena is None:
+            return memoryview(self._content.encode("utf-8", errors="surrogatepass"))
+        return self._arena.view(self._content)
+
+    def move_to_arena(self, arena: ContentArena) -> None:
+        """
+        Stores the content of the file in the arena, after which only its handle is kept.
+        :param arena: The arena to store the content in.
+        :return: None
+        """
+        if self._arena is not arena:
+            self._content = arena.store(self.raw_content)
+            self._arena = arena
+
 
 class ScrapedRepo:
     """
     Class used to represent a GitHub repository that was scraped.
     This is used to capture the following information:
     repository name, last commit date, path, size and files within it.
+    The contents of all files are kept together in one ContentArena.
     """
 
-    def __init__(self, name: str, last_commit_date: datetime, path: str, size: int):
+    __slots__ = ("name", "lastCommitDate", "path", "copies", "size", "files", "arena")
+
+    def __init__(
+        self,
+        name: str,
+        last_commit_date: datetime,
+        path: str,
+        size: int,
+        arena: Optional[ContentArena] = None,
+    ):
         """
         Constructor for the ScrapedRepo class.
         :param name: The name of the repository.
         :param last_commit_date:  The date of the last commit that modified the repository.
         :param path: The path of the repository.
         :param size: The size of the repository in bytes.
+        :param arena: The arena the contents of the files are stored in (a new one if not given).
         """
         self.name = name
         self.lastCommitDate = last_commit_date
@@ -121,14 +181,17 @@ class ScrapedRepo:
         self.copies = 1
         self.size = size
         self.files = {}
+        self.arena = ContentArena() if arena is None else arena
 
     def add_file(self, file: RepoFile, path: str) -> None:
         """
         Adds a file to the repository, which is stored in a dictionary.
+        Its content is moved into the arena of the repository.
         :param file: The file to be added.
         :param path: The path of the file, which is used as the key in the dictionary.
         :return: None
         """
+        file.move_to_arena(self.arena)
         self.files[path] = file
 
     def num_files(self) -> int:
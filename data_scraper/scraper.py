@@ -1,15 +1,66 @@
 import argparse
+import atexit
+import functools
 import logging
 import sqlite3
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
-from math import floor
+from typing import Optional
 
-import requests
 from bs4 import BeautifulSoup
 
+import file_prefilter
+import http_session
+import metrics
+from archive_fetch import (
+    ARCHIVE_FORMATS,
+    GITHUB_ARCHIVE_URL,
+    TAR_FORMAT,
+    archive_url,
+    iter_archive_files,
+)
+from blob_store import INSERT_BLOB, hash_content, setup_blob_tables
+from content_decode import decode_content, is_binary
+from crawl_frontier import CrawlFrontier, setup_frontier_tables
+from db_writer import DatabaseWriter, get_writer, set_writer
+from failure_journal import (
+    FailureJournal,
+    load_failures,
+    resolve_failures,
+    setup_failure_tables,
+)
+from file_prefilter import is_excluded_folder
+from git_fetch import GITHUB_GIT_URL, clone_url, default_branch, iter_git_files
+from incremental import IncrementalState, setup_incremental_tables
+from language_classifier import (
+    EXTRA_EXTENSION_LANGUAGES,
+    configure_languages,
+    language_table,
+)
+from page_schema import INSERT_PAGE, migrate_schema
+from process_scraper import scrape_repositories_multiprocess
+from rate_limiter import DEFAULT_MAX_RATE, DEFAULT_RATE
+
+from async_scraper import (
+    FILE_JOB,
+    REPOSITORY_JOB,
+    TREE_JOB,
+    scrape_repositories_async,
+)
+from github_pages import (
+    GITHUB_BASE_URL,
+    GITHUB_RAW_CONNECTOR,
+    GITHUB_RAW_URL,
+    IGNORED_ROOT_FOLDERS,
+    PARSER_BACKENDS,
+    parse_latest_commit,
+    parse_repository_root,
+    get_parser_backend,
+    parse_tree_listing,
+    set_parser_backend,
+)
 from scraped_repo import *
-from upload_db import save_to_hf
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -19,9 +70,16 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
-GITHUB_BASE_URL = "https://github.com/"
-GITHUB_RAW_URL = "https://raw.githubusercontent.com/"
-GITHUB_RAW_CONNECTOR = "/refs/heads/"
+# Fetch modes: walking the folder pages (html), downloading the whole repository as a tarball or zipball,
+# or fetching it with git
+HTML_FETCH_MODE = "html"
+GIT_FETCH_MODE = "git"
+FETCH_MODES = (HTML_FETCH_MODE,) + ARCHIVE_FORMATS + (GIT_FETCH_MODE,)
+
+# Set by start_scraping when only the files that changed since the last run should be fetched
+incremental_state: IncrementalState = None
+# Set by start_scraping, failures are written to the default database through its writer otherwise
+failure_journal: FailureJournal = None
 
 """
     Layout for github's navigation url's: 
@@ -46,65 +104,43 @@ def scrape_repository(repo_path: str):
     https://brightdata.com/blog/how-tos/how-to-scrape-github-repositories-in-python
     Default test repo: 'https://github.com/luminati-io/luminati-proxy'
     :param repo_path: the path to the repository
+    :return: whether the repository was scraped completely (False if any of its pages or files failed)
     """
     full_url = GITHUB_BASE_URL + repo_path
     try:
-        failed_searches = []
-
-        page_data = requests.get(full_url)
+        page_data = http_session.get(full_url)
 
         if not page_data.ok:
-            add_failed_search(full_url)
-            return page_data.status_code, failed_searches
-
-        soup = BeautifulSoup(page_data.text, "html.parser")
-
-        # This is used to get the name of the main branch
-        git_branch_icon_html_element = soup.select(".octicon-git-branch")
-
-        count = 0
-        main_branch = None
-        for branch_elem in git_branch_icon_html_element:
-            count += 1
-            parent = branch_elem.parent.find_next_sibling("div")
-            if parent:
-                main_branch_html_element2 = parent.find("span")
-                if main_branch_html_element2:
-                    main_branch = main_branch_html_element2.get_text().strip()
-                    # print(main_branch, count)
-                    break
-
-        # relative_time_html_element = soup.select_one('relative-time')
-        # print("soop", soup.find('div', attrs={'data-testid': 'latest-commit-details'}), soup.find('relative-time'))
-        # tree_element = soup.select('script')
-        # print("tree", type(tree_element[-2]), tree_element[-2].text)
-
-        # folder_directories = soup.findAll('svg', attrs={'class': 'icon-directory'})
-        file_directories = soup.findAll(
-            "div", attrs={"class": "react-directory-truncate"}
-        )
+            add_failed_search(
+                full_url, page_data.status_code, job=(REPOSITORY_JOB, repo_path, None, None)
+            )
+            return False
+
+        main_branch, entries = parse_repository_root(page_data.text)
+
+        if incremental_state is not None:
+            commit_id = parse_latest_commit(page_data.text)
+            if not incremental_state.start_repository(repo_path, main_branch, commit_id):
+                logger.info(f"{repo_path} did not change since it was last scraped")
+                return True
 
-        for i in range(0, floor(len(file_directories) / 2)):
+        # Every folder and file is still scraped after one of them failed, the repository just is not complete
+        succeeded = True
+        for repo_entry_name, is_folder in entries:
             # If the icon is icon-directory that means it is a folder system and we deal with it like a tree.
-            if (
-                file_directories[i * 2].parent.parent.previous_sibling["class"][0]
-                == "icon-directory"
-            ):
-                repo_folder_name = file_directories[2 * i].text
-                # We can just ignore the builds, git and all those standard files
-                if (
-                    repo_folder_name != ".builds"
-                    and repo_folder_name != ".git"
-                    and repo_folder_name != ".github"
-                    and repo_folder_name != ".vscode"
+            if is_folder:
+                # We can just ignore the builds, git and all those standard files, and vendored code
+                if repo_entry_name not in IGNORED_ROOT_FOLDERS and not is_excluded_folder(
+                    repo_entry_name
                 ):
-                    scrape_repository_tree_navigation(
-                        repo_path, main_branch, repo_folder_name
-                    )
+                    if not scrape_repository_tree_navigation(
+                        repo_path, main_branch, repo_entry_name
+                    ):
+                        succeeded = False
             else:
                 # If the icon is not icon-directory, it is an individual file
-                repo_file_name = file_directories[2 * i].text
-                scrape_repository_file_handling(repo_path, main_branch, repo_file_name)
+                if not scrape_repository_file_handling(repo_path, main_branch, repo_entry_name):
+                    succeeded = False
 
         # We probably don't want to save a readme do we, if not we just get rid of this following section entirey
 
@@ -125,24 +161,46 @@ def scrape_repository(repo_path: str):
         # # final_repo = ScrapedRepo(name, latest_commit, repo_path, 0)
         # # final_repo.add_file(repo_file, "README")
 
+        if incremental_state is not None:
+            incremental_state.finish_repository(repo_path, main_branch, succeeded)
+
+        if not succeeded:
+            logger.warning(f"{repo_path} incomplete, some of its pages or files failed")
+            return False
+
         logger.info(f"{repo_path} complete")
-        return
+        return True
         # return repo
-    except Exception:
-        add_failed_search(full_url)
+    except Exception as e:
+        add_failed_search(
+            full_url, exception=e, job=(REPOSITORY_JOB, repo_path, None, None)
+        )
         logger.warning(f"{repo_path} failed search")
-        return
-
-
-def add_failed_search(full_url: str) -> None:
+        if incremental_state is not None:
+            incremental_state.finish_repository(repo_path, None, succeeded=False)
+        return False
+    finally:
+        file_prefilter.finish_repository(repo_path)
+
+
+def add_failed_search(
+    full_url: str,
+    status: int = None,
+    exception: BaseException = None,
+    job: tuple = None,
+) -> None:
     """
-    This function adds the URL to the list of failed searches in the failed_scrape_attempts.txt file
+    This function adds the URL to the failure journal (the FAILED_SCRAPE table), from which it can be retried
     :param full_url: the URL that failed to be scraped
+    :param status: the status code of the response (None if no response was received)
+    :param exception: the exception that was raised (if any)
+    :param job: the (kind, repo_path, branch_name, path) tuple needed to retry it (see async_scraper.py)
     :return: None
     """
-    f = open("failed_scrape_attempts.txt", "w", encoding="utf8")
-    f.write(f"{full_url}\n")
-    f.close()
+    journal = failure_journal
+    if journal is None:
+        journal = FailureJournal(get_writer())
+    journal.record(full_url, status, exception, job)
     return
 
 
@@ -155,42 +213,45 @@ def scrape_repository_tree_navigation(repo_path: str, branch_name: str, tree_pat
     :param repo_path: the path to the repository
     :param branch_name: the name of its branch
     :param tree_path: the tree path
+    :return: whether the tree and everything in it was scraped without failures
     """
     full_url = GITHUB_BASE_URL + repo_path + "/tree/" + branch_name + "/" + tree_path
     try:
-        page_data = requests.get(full_url)
+        page_data = http_session.get(full_url)
 
         if not page_data.ok:
-            add_failed_search(full_url)
-            return page_data.status_code
+            add_failed_search(
+                full_url,
+                page_data.status_code,
+                job=(TREE_JOB, repo_path, branch_name, tree_path),
+            )
+            return False
 
         # Scraper stuff
-        soup = BeautifulSoup(page_data.text, "html.parser")
-        file_directories = soup.findAll(
-            "div", attrs={"class", "react-directory-filename-column"}
-        )
-        # print(len(file_directories))
-        for i in range(0, floor(len(file_directories) / 2)):
-            # print(file_directories[2 * i].text)
+        succeeded = True
+        for repo_entry_name, is_folder in parse_tree_listing(page_data.text):
             # If the icon is icon-directory that means it is a folder system and we deal with it like a tree.
-            if file_directories[i * 2].svg["class"][0] == "icon-directory":
-                repo_folder_name = file_directories[2 * i].text
-                scrape_repository_tree_navigation(
-                    repo_path, branch_name, tree_path + "/" + repo_folder_name
-                )
+            if is_folder:
+                if not is_excluded_folder(repo_entry_name):
+                    if not scrape_repository_tree_navigation(
+                        repo_path, branch_name, tree_path + "/" + repo_entry_name
+                    ):
+                        succeeded = False
             else:
                 # If the icon is not icon-directory, it is an individual file
-                repo_file_name = file_directories[2 * i].text
-                scrape_repository_file_handling(
-                    repo_path, branch_name, tree_path + "/" + repo_file_name
-                )
+                if not scrape_repository_file_handling(
+                    repo_path, branch_name, tree_path + "/" + repo_entry_name
+                ):
+                    succeeded = False
 
-        return
+        return succeeded
 
     except Exception as e:
         print(f"exception caught: {e}")
-        add_failed_search(full_url)
-        return
+        add_failed_search(
+            full_url, exception=e, job=(TREE_JOB, repo_path, branch_name, tree_path)
+        )
+        return False
 
 
 def scrape_repository_file_handling(repo_path: str, branch_name: str, file_path: str):
@@ -199,11 +260,13 @@ def scrape_repository_file_handling(repo_path: str, branch_name: str, file_path:
     :param repo_path: the path to the repository
     :param branch_name: the name of its branch
     :param file_path: the file path
+    :return: False if the file could not be fetched, True otherwise (also when it was skipped on purpose)
     """
     valid_file_type, file_type = find_file_type(file_path)
 
-    if not valid_file_type:
-        return
+    # Generated and vendored files, and files that are too large to be kept, are never downloaded
+    if not valid_file_type or not file_prefilter.should_fetch(file_path, repo_path):
+        return True
 
     full_url = (
         GITHUB_RAW_URL
@@ -213,46 +276,215 @@ def scrape_repository_file_handling(repo_path: str, branch_name: str, file_path:
         + "/"
         + file_path
     )
-    page_data = requests.get(full_url)
+    headers = None
+    if incremental_state is not None:
+        headers = incremental_state.conditional_headers(repo_path, file_path)
 
-    if not page_data.ok:
-        add_failed_search(full_url)
-        return page_data.status_code
+    max_size = file_prefilter.fetch_limit(repo_path)
+    try:
+        page_data = http_session.get(full_url, max_size=max_size, headers=headers)
+        with page_data:
+            if not page_data.ok:
+                add_failed_search(
+                    full_url,
+                    page_data.status_code,
+                    job=(FILE_JOB, repo_path, branch_name, file_path),
+                )
+                return False
+
+            # A 304 means the file did not change since we last fetched it
+            if page_data.status_code == 304:
+                return True
+            # The body was read in chunks by get, so a file that is too large or binary was dropped before it was all read
+            content = page_data.content
+    except (http_session.ResponseTooLarge, http_session.BinaryResponse) as e:
+        logger.debug(f"Skipping {e}")
+        metrics.count(metrics.SKIPPED_COUNTER)
+        return True
+
+    if not file_prefilter.accept_content(repo_path, len(content)):
+        return True
+
+    data, encoded = decode_content(content)
+    write_to_db(repo_path, branch_name, file_path, file_type, data, encoded)
+
+    if incremental_state is not None:
+        incremental_state.record_file(
+            repo_path, branch_name, file_path, page_data.headers
+        )
 
-    write_to_db(repo_path, branch_name, file_path, file_type, page_data.text)
+    return True
 
-    return
+
+def scrape_repository_archive(repo_path: str, archive_format: str = TAR_FORMAT):
+    """
+    This function scrapes the repository by downloading its archive (tarball or zipball) in a single request,
+    instead of fetching every folder page and raw file. The files are read straight from the response stream
+    and saved to the database, the archive is never unpacked to disk.
+    :param repo_path: the path to the repository
+    :param archive_format: either 'tar' or 'zip'
+    :return: whether the repository was scraped completely
+    """
+    full_url = GITHUB_BASE_URL + repo_path
+    try:
+        # The landing page is still needed to find out the name of the main branch
+        page_data = http_session.get(full_url)
+
+        # Failures of the archive are retried as a whole repository as well
+        job = (REPOSITORY_JOB, repo_path, None, None)
+        if not page_data.ok:
+            add_failed_search(full_url, page_data.status_code, job=job)
+            return False
+
+        main_branch, _ = parse_repository_root(page_data.text)
+
+        if incremental_state is not None:
+            commit_id = parse_latest_commit(page_data.text)
+            if not incremental_state.start_repository(repo_path, main_branch, commit_id):
+                logger.info(f"{repo_path} did not change since it was last scraped")
+                return True
+
+        full_url = archive_url(repo_path, main_branch, archive_format, GITHUB_ARCHIVE_URL)
+        with http_session.get(full_url, stream=True) as archive_data:
+            if not archive_data.ok:
+                add_failed_search(full_url, archive_data.status_code, job=job)
+                if incremental_state is not None:
+                    incremental_state.finish_repository(repo_path, main_branch, succeeded=False)
+                return False
+
+            # Undo any transfer compression, the gzip of the tarball itself is handled by tarfile
+            archive_data.raw.decode_content = True
+            archive_files = iter_archive_files(
+                archive_data.raw,
+                archive_format,
+                keep=lambda path, size: find_file_type(path)[0]
+                and file_prefilter.should_fetch(path, repo_path, size),
+            )
+            for file_path, content in archive_files:
+                if is_binary(content):
+                    metrics.count(metrics.SKIPPED_COUNTER)
+                    continue
+                if not file_prefilter.accept_content(repo_path, len(content)):
+                    continue
+                _, file_type = find_file_type(file_path)
+                data, encoded = decode_content(content)
+                write_to_db(repo_path, main_branch, file_path, file_type, data, encoded)
+
+                if incremental_state is not None:
+                    incremental_state.record_file(repo_path, main_branch, file_path, {})
+
+        if incremental_state is not None:
+            incremental_state.finish_repository(repo_path, main_branch)
+
+        logger.info(f"{repo_path} complete")
+        return True
+    except Exception as e:
+        add_failed_search(
+            full_url, exception=e, job=(REPOSITORY_JOB, repo_path, None, None)
+        )
+        logger.warning(f"{repo_path} failed search")
+        if incremental_state is not None:
+            incremental_state.finish_repository(repo_path, None, succeeded=False)
+        return False
+    finally:
+        file_prefilter.finish_repository(repo_path)
+
+
+def scrape_repository_git(repo_path: str):
+    """
+    This function scrapes the repository with a shallow partial git fetch of its default branch, instead of
+    fetching every folder page and raw file. Only the blobs of the files we keep are downloaded, in a single
+    compressed pack, and they are read straight from it without checking anything out (see git_fetch.py).
+    :param repo_path: the path to the repository
+    :return: whether the repository was scraped completely
+    """
+    full_url = clone_url(repo_path, GITHUB_GIT_URL)
+    try:
+        # The remote tells us its default branch and latest commit, so the landing page is not needed
+        main_branch, commit_id = default_branch(full_url)
+
+        if incremental_state is not None:
+            if not incremental_state.start_repository(repo_path, main_branch, commit_id):
+                logger.info(f"{repo_path} did not change since it was last scraped")
+                return True
+
+        git_files = iter_git_files(
+            full_url,
+            main_branch,
+            keep=lambda path: find_file_type(path)[0]
+            and file_prefilter.should_fetch(path, repo_path),
+        )
+        for file_path, content in git_files:
+            if is_binary(content):
+                metrics.count(metrics.SKIPPED_COUNTER)
+                continue
+            if not file_prefilter.accept_content(repo_path, len(content)):
+                continue
+            _, file_type = find_file_type(file_path)
+            data, encoded = decode_content(content)
+            write_to_db(repo_path, main_branch, file_path, file_type, data, encoded)
+
+            if incremental_state is not None:
+                incremental_state.record_file(repo_path, main_branch, file_path, {})
+
+        if incremental_state is not None:
+            incremental_state.finish_repository(repo_path, main_branch)
+
+        logger.info(f"{repo_path} complete")
+        return True
+    except Exception as e:
+        add_failed_search(
+            full_url, exception=e, job=(REPOSITORY_JOB, repo_path, None, None)
+        )
+        logger.warning(f"{repo_path} failed search")
+        if incremental_state is not None:
+            incremental_state.finish_repository(repo_path, None, succeeded=False)
+        return False
+    finally:
+        file_prefilter.finish_repository(repo_path)
 
 
-def save_page(path: str):
+def save_page(
+    path: str,
+    output_path: str = "env/raw_page_data/page_data_konfig_generator_tree.txt",
+):
     """
-    This function saves the page data to a text file.
+    This function saves the page data to a text file, e.g. to use it as a fixture for benchmark_parser.py.
     :param path: the path to the page
+    :param output_path: the path of the text file
     """
-    page_data = requests.get(path)
+    page_data = http_session.get(path)
 
     print(page_data.status_code)
     if not page_data.ok:
         logger.error(f"Failed to get page data from {path}")
         return page_data.status_code
 
-    soup = BeautifulSoup(page_data.text, "html.parser")
-
-    f = open(
-        "env/raw_page_data/page_data_konfig_generator_tree.txt", "w", encoding="utf8"
-    )
+    f = open(output_path, "w", encoding="utf8")
     f.write(page_data.text)
     f.close()
     return
 
 
 def write_to_db(
-    repo_path: str, branch_name: str, file_path: str, language: Language, data: str
+    repo_path: str,
+    branch_name: str,
+    file_path: str,
+    language: Language,
+    data: str,
+    encoded: Optional[bytes] = None,
 ):
-    sqlite_connection = sqlite3.connect(".\scraped_repos.db")
-
-    cursor = sqlite_connection.cursor()
-
+    """
+    This function queues a scraped file to be written to the database by the database writer.
+    The content itself is stored in the blob table under its hash, so files that are vendored or copied
+    across repositories are only stored once.
+    :param repo_path: the path to the repository
+    :param branch_name: the name of its branch
+    :param file_path: the file path
+    :param language: the language of the file
+    :param data: the content of the file
+    :param encoded: the content encoded as utf-8, if the caller already has it (see content_decode.decode_content)
+    """
     lan_id = get_lan_id(language)
     today = date.today()
 
@@ -260,18 +492,15 @@ def write_to_db(
     # insert_into = (f"""INSERT INTO SCRAPED_PAGE (Repo_Name, Branch, Path, Date_Scraped, Language_ID, Data)
     #                VALUES ({repo_path}, '{branch_name}', '{file_path}', {today}, {lan_id}, "{data}");""")
 
-    insert_into = (
-        "INSERT INTO SCRAPED_PAGE (Repo_Name, Branch, Path, Date_Scraped, Language_ID, Data) "
-        "VALUES (?, ?, ?, ?, ?, ?);"
-    )
-
-    inputs = (repo_path, branch_name, file_path, today, lan_id, data)
+    blob_hash, encoded = hash_content(data, encoded)
+    inputs = (repo_path, branch_name, file_path, today, lan_id, blob_hash)
 
-    cursor.execute(insert_into, inputs)
-    sqlite_connection.commit()
-
-    # Close the cursor
-    cursor.close()
+    # The writer commits in batches on its own thread, so we never wait for the disk here
+    writer = get_writer()
+    writer.execute(INSERT_BLOB, (blob_hash, len(encoded), data))
+    writer.execute(INSERT_PAGE, inputs)
+    metrics.count(metrics.FILES_COUNTER)
+    metrics.count(metrics.BYTES_COUNTER, len(encoded))
 
 
 def setup_database(db_path: str) -> None:
@@ -281,8 +510,7 @@ def setup_database(db_path: str) -> None:
     :return: None
     """
     logger.info(f"Setting up database at {db_path}...")
-    db_connection_path = ".\\" + db_path
-    sqlite_connection = sqlite3.connect(db_connection_path)
+    sqlite_connection = sqlite3.connect(db_path)
 
     cursor = sqlite_connection.cursor()
 
@@ -304,15 +532,6 @@ def setup_database(db_path: str) -> None:
         )
         cursor.execute(language_table)
 
-        for lang in list(Language):
-            # Might be unnecessary, but it's useful for consistency, and it only happens once anyway
-            lan_id = get_lan_id(lang)
-            insert_into = (
-                "INSERT INTO PAGE_LANGUAGE (ID, Language) "
-                f"VALUES ({lan_id}, '{lang.value}')"
-            )
-            cursor.execute(insert_into)
-
         # Create the main table after setting up the languages table
         create_table = (
             "CREATE TABLE IF NOT EXISTS SCRAPED_PAGE("
@@ -322,7 +541,8 @@ def setup_database(db_path: str) -> None:
             "Path           TEXT    NOT NULL,"
             "Date_Scraped   DATE    NOT NULL,"
             "Language_ID    Integer NOT NULL,"
-            "Data         LONGTEXT,"
+            "Data         LONGTEXT,"  # Only used by rows from before the blob table, see Blob_Hash
+            "Blob_Hash      TEXT,"
             "FOREIGN KEY (Language_ID)  REFERENCES PAGE_LANGUAGE(ID)"  # I'm not really sure about this one, its just like an enum with python/c++ or whatever but will just store it like this for now
             ");"
         )
@@ -331,43 +551,278 @@ def setup_database(db_path: str) -> None:
         sqlite_connection.commit()
         logger.info("db setup complete")
 
-    # Close the cursor
+    # Languages are only ever added at the end of the enum, so older databases just need the new ones
+    for lang in list(Language):
+        lan_id = get_lan_id(lang)
+        cursor.execute(
+            "INSERT OR IGNORE INTO PAGE_LANGUAGE (ID, Language) VALUES (?, ?);",
+            (lan_id, lang.value),
+        )
+
+    # The crawl frontier, incremental state, failure journal and blob table were added later on,
+    # so older databases may still need their tables
+    setup_blob_tables(cursor)
+    setup_failure_tables(cursor)
+    setup_frontier_tables(cursor)
+    setup_incremental_tables(cursor)
+    sqlite_connection.commit()
+
+    # Older databases may hold several copies of a file, and lack the page key and indexes
+    migrate_schema(cursor)
+
+    # Close the cursor and connection
     cursor.close()
+    sqlite_connection.close()
 
 
-def scrape_top_repos(num_to_scrape: int, pos_to_begin=0):
+def get_top_repos(num_to_scrape: int, pos_to_begin=0) -> list:
+    """
+    This function collects the paths of the top rated repositories from the thousandstars list.
+    :param num_to_scrape: the amount of repositories to collect
+    :param pos_to_begin: the offset position in the list to start at
+    :return: a list of repository paths (i.e. {user}/{repository})
+    """
     path = "https://anthonygarvan.github.io/thousandstars/"
 
-    page_data = requests.get(path)
+    page_data = http_session.get(path)
 
     if not page_data.ok:
         logger.error(f"Failed to get page data from {path}")
-        return page_data.status_code
+        return []
 
     soup = BeautifulSoup(page_data.text, "html.parser")
 
     file_directories = soup.find("table")
     fb2 = file_directories.find("tbody")
     child_list = list(fb2.children)
-    # print(fb2.children)
-    count = 1
+
+    repo_names = []
     for child in child_list[pos_to_begin : pos_to_begin + num_to_scrape]:
         try:
             link = child.find("a")
 
             repo_split = link["href"].split("/")[-2:]
-            repo_name = repo_split[0] + "/" + repo_split[1]
-            scrape_repository(repo_name)
-            print(f"finished {count} out of {num_to_scrape}")
-            count += 1
+            repo_names.append(repo_split[0] + "/" + repo_split[1])
         except Exception as e:
             print(e)
-            count += 1
             continue
 
+    return repo_names
+
+
+def scrape_repository_in_process(repo_name: str, fetch_mode: str = HTML_FETCH_MODE) -> bool:
+    """
+    This function scrapes a single repository in a worker process of the multiprocess scraper.
+    :param repo_name: the path to the repository
+    :param fetch_mode: 'html' to walk the folder pages, 'tar' or 'zip' to download the repository archive,
+        'git' to fetch the repository with git
+    :return: whether the repository was scraped completely
+    """
+    if fetch_mode == HTML_FETCH_MODE:
+        return scrape_repository(repo_name)
+    elif fetch_mode == GIT_FETCH_MODE:
+        return scrape_repository_git(repo_name)
+    return scrape_repository_archive(repo_name, fetch_mode)
+
+
+def setup_process_worker(dataset_path: str, incremental: bool, settings: dict) -> None:
+    """
+    This function configures a worker process of the multiprocess scraper like the process that started it.
+    Its database writes are already forwarded to the writer of the parent process.
+    :param dataset_path: the path to the database
+    :param incremental: toggle whether to only fetch the repositories and files that changed since the last run
+    :param settings: the configuration of the parent process (see scrape_repositories)
+    :return: None
+    """
+    global incremental_state, failure_journal
+
+    failure_journal = FailureJournal(get_writer())
+    set_parser_backend(settings["parser"])
+    configure_languages(extra_languages=settings["languages"])
+    file_prefilter.configure_prefilter(**settings["prefilter"])
+    http_session.configure_session(**settings["session"])
+    http_session.configure_rate_limiter(**settings["rate_limiter"])
+    http_session.set_redirects(settings["redirects"])
+    if incremental:
+        incremental_state = IncrementalState(dataset_path, get_writer())
+    # Every worker reports its own metrics, the process exits through sys.exit so the last report is written too
+    if metrics.start_reporter(per_process=True, **settings["metrics"]) is not None:
+        atexit.register(metrics.stop_reporter)
+
+
+def scrape_repositories(
+    repo_paths: list,
+    concurrent=False,
+    frontier: CrawlFrontier = None,
+    fetch_mode: str = HTML_FETCH_MODE,
+    processes: int = 0,
+    **async_settings,
+) -> None:
+    """
+    This function scrapes a list of repositories, either one after another, with the asynchronous crawl engine,
+    or with a pool of worker processes.
+    With a crawl frontier, repositories that were completed in an earlier run are skipped. The asynchronous crawl
+    engine also resumes unfinished repositories at the folders and files where it stopped.
+    :param repo_paths: the paths to the repositories
+    :param concurrent: toggle whether to use the asynchronous crawl engine (or, when downloading archives,
+        whether to download several archives at once)
+    :param frontier: the crawl frontier used to persist the progress of the crawl (optional)
+    :param fetch_mode: 'html' to walk the folder pages, 'tar' or 'zip' to download repository archives,
+        'git' to fetch repositories with git
+    :param processes: the number of worker processes that scrape repositories side by side (0 or 1 to scrape
+        them in this process)
+    :param async_settings: settings passed on to the asynchronous crawl engine (workers, per_host, ...)
+    :return: None
+    """
+    if concurrent and fetch_mode == HTML_FETCH_MODE:
+        scrape_repositories_async(
+            repo_paths,
+            write=write_to_db,
+            on_failure=add_failed_search,
+            frontier=frontier,
+            incremental=incremental_state,
+            **async_settings,
+        )
+        return
+
+    completed = set() if frontier is None else frontier.completed_repositories()
+
+    if processes > 1:
+        # Every worker has its own rate limiter, so they share the allowed rate per host
+        max_rate = async_settings.get("max_rate", DEFAULT_MAX_RATE) / processes
+        worker_settings = {
+            "parser": get_parser_backend(),
+            "languages": language_table(),
+            "prefilter": file_prefilter.get_prefilter_settings(),
+            "session": http_session.get_session_settings(),
+            "rate_limiter": {
+                "rate": min(async_settings.get("rate", DEFAULT_RATE), max_rate),
+                "max_rate": max_rate,
+            },
+            "redirects": http_session.get_redirects(),
+            "metrics": metrics.get_reporter_settings(),
+        }
+        writer = get_writer()
+        scrape_repositories_multiprocess(
+            [repo_name for repo_name in repo_paths if repo_name not in completed],
+            writer,
+            functools.partial(scrape_repository_in_process, fetch_mode=fetch_mode),
+            setup=setup_process_worker,
+            setup_args=(writer.db_path, incremental_state is not None, worker_settings),
+            processes=processes,
+            on_finish=None if frontier is None else frontier.finish_repository,
+        )
+        return
+
+    def scrape_one(repo_name: str) -> None:
+        if repo_name in completed:
+            logger.info(f"Skipping {repo_name}, it was already scraped")
+            return
+        try:
+            if fetch_mode == HTML_FETCH_MODE:
+                succeeded = scrape_repository(repo_name)
+            elif fetch_mode == GIT_FETCH_MODE:
+                succeeded = scrape_repository_git(repo_name)
+            else:
+                succeeded = scrape_repository_archive(repo_name, fetch_mode)
+            # A repository that failed (partly) is not marked as done, so the next run scrapes it again
+            if succeeded and frontier is not None:
+                frontier.finish_repository(repo_name)
+        except Exception as e:
+            print(e)
+
+    if concurrent:
+        # Every archive (or git fetch) is a single long download, so a few threads are enough to keep several of them going
+        with ThreadPoolExecutor(max_workers=async_settings.get("workers", 8)) as pool:
+            for count, _ in enumerate(pool.map(scrape_one, repo_paths), start=1):
+                print(f"finished {count} out of {len(repo_paths)}")
+        return
+
+    count = 1
+    for repo_name in repo_paths:
+        scrape_one(repo_name)
+        print(f"finished {count} out of {len(repo_paths)}")
+        count += 1
+
+
+def scrape_top_repos(
+    num_to_scrape: int,
+    pos_to_begin=0,
+    concurrent=False,
+    frontier: CrawlFrontier = None,
+    fetch_mode: str = HTML_FETCH_MODE,
+    processes: int = 0,
+    **async_settings,
+):
+    """
+    This function scrapes a series of repositories from the top ~7700 highest rated repos.
+    :param num_to_scrape: the amount of repositories to scrape
+    :param pos_to_begin: the offset position in the list to start at
+    :param concurrent: toggle whether to use the asynchronous crawl engine
+    :param frontier: the crawl frontier used to skip repositories that were already scraped (optional)
+    :param fetch_mode: 'html' to walk the folder pages, 'tar' or 'zip' to download repository archives,
+        'git' to fetch repositories with git
+    :param processes: the number of worker processes that scrape repositories side by side
+    :param async_settings: settings passed on to the asynchronous crawl engine (workers, per_host, ...)
+    """
+    repo_names = get_top_repos(num_to_scrape, pos_to_begin)
+    scrape_repositories(
+        repo_names, concurrent, frontier, fetch_mode, processes, **async_settings
+    )
+
+
+def retry_failed(dataset_path: str, frontier: CrawlFrontier = None, **async_settings) -> None:
+    """
+    This function re-drives only the pages and raw files in the failure journal that were not resolved yet,
+    concurrently with the asynchronous crawl engine. A failed repository landing page (or archive, or git fetch)
+    is retried as the whole repository, by walking its folder pages. Afterwards the retried failures are marked as
+    resolved, and the ones that failed again are added to the journal with a higher attempt.
+    With a crawl frontier, the retried jobs are marked as done in it, and so are the repositories that were
+    retried as a whole, so the next run does not scrape them again.
+    :param dataset_path: the path to the database
+    :param frontier: the crawl frontier used to persist the progress of the crawl (optional)
+    :param async_settings: settings passed on to the asynchronous crawl engine (workers, per_host, ...)
+    :return: None
+    """
+    global failure_journal
+
+    jobs, attempts, last_id = load_failures(dataset_path)
+    if len(jobs) == 0:
+        logger.info("There are no failed scrapes to retry")
+        return
+
+    logger.info(f"Retrying {len(jobs)} failed pages and files")
+    writer = get_writer()
+    failure_journal = FailureJournal(writer, attempts)
+    scrape_repositories_async(
+        [],
+        write=write_to_db,
+        jobs=jobs,
+        on_failure=add_failed_search,
+        incremental=incremental_state,
+        frontier=frontier,
+        **async_settings,
+    )
+    resolve_failures(writer, last_id)
+
 
 def start_scraping(
-    hf_repository: str, dataset_path: str, hf_token: str, upload_flag: bool
+    hf_repository: str,
+    dataset_path: str,
+    hf_token: str,
+    upload_flag: bool,
+    concurrent: bool = False,
+    workers: int = 32,
+    per_host: int = 8,
+    retries: int = http_session.DEFAULT_RETRIES,
+    max_rate: float = DEFAULT_MAX_RATE,
+    resume: bool = True,
+    incremental: bool = False,
+    fetch_mode: str = HTML_FETCH_MODE,
+    processes: int = 0,
+    retry_failed_scrapes: bool = False,
+    metrics_interval: float = metrics.DEFAULT_REPORT_INTERVAL,
+    metrics_file: Optional[str] = metrics.DEFAULT_METRICS_FILE,
 ) -> None:
     """
     This function starts the scraping process.
@@ -375,35 +830,96 @@ def start_scraping(
     :param dataset_path: the path for the dataset to upload to HuggingFace
     :param hf_token: the HuggingFace API token
     :param upload_flag: toggle whether to upload the scraped data to HuggingFace
+    :param concurrent: toggle whether to use the asynchronous crawl engine
+    :param workers: the number of concurrent workers of the asynchronous crawl engine
+    :param per_host: the maximum number of concurrent requests per host of the asynchronous crawl engine
+    :param retries: the number of times a failed request is retried by the asynchronous crawl engine
+    :param max_rate: the maximum number of requests per second per host of the asynchronous crawl engine
+    :param resume: toggle whether to continue from the progress of earlier runs on the same database
+    :param incremental: toggle whether to only fetch the repositories and files that changed since the last run
+    :param fetch_mode: 'html' to walk the folder pages, 'tar' or 'zip' to download repository archives,
+        'git' to fetch repositories with git
+    :param processes: the number of worker processes that scrape repositories side by side
+    :param retry_failed_scrapes: toggle whether to only retry the failures of earlier runs
+    :param metrics_interval: the amount of seconds between two reports of the scraper metrics (0 to disable them)
+    :param metrics_file: the JSON file the latest metrics are written to (None to only log them)
     :return: None
     """
+    global incremental_state, failure_journal
+
     start_time = time.time()
-    logger.info(f"Starting scrapping process with upload flag: {upload_flag}")
+    logger.info(
+        f"Starting scrapping process with upload flag: {upload_flag}, concurrent: {concurrent}"
+    )
 
     # We always set up the database as a sanity-check.
     # There is a check where if the db is already up we just skip it anyway
-    setup_database(db_path)
+    setup_database(dataset_path)
+
+    # A single writer owns the connection to the database for the whole run
+    writer = DatabaseWriter(dataset_path)
+    set_writer(writer)
+    failure_journal = FailureJournal(writer)
+
+    # The progress of the crawl is kept in the same database, so an interrupted run can pick up where it stopped
+    frontier = CrawlFrontier(dataset_path, writer)
+    if (not resume or incremental) and not retry_failed_scrapes:
+        # An incremental run has to revisit the repositories that were completed before,
+        # it skips what did not change through the stored commit ids and file validators instead
+        frontier.reset()
+
+    if incremental:
+        incremental_state = IncrementalState(dataset_path, writer)
+
+    # Throughput and the latency of every stage are logged periodically, so a slow stage shows up during the run
+    metrics.reset_metrics()
+    metrics.start_reporter(metrics_interval, metrics_file)
 
     # Just scraping the 10 top repositories on the 'trending' page of GitHub as of 22:57 30/10/2024 CEST
     # scrape_repository('EbookFoundation/free-programming-books')
     # The one above is apparently just html so let's ignore this one
 
     # Scrape the following repositories
-    scrape_repository("WerWolv/ImHex")
-    scrape_repository("DrewThomasson/ebook2audiobook")
-    scrape_repository("kovidgoyal/kitty")
-    scrape_repository("Stirling-Tools/Stirling-PDF")
-    scrape_repository("imputnet/cobalt")
-    scrape_repository("fish-shell/fish-shell")
-    scrape_repository("pathwaycom/pathway")
-    scrape_repository("public-apis/public-apis")
-    scrape_repository("MervinPraison/PraisonAI")
-    scrape_repository("ManimCommunity/manim")
-
-    # scrape_top_repos(500, 4270)
+    repositories = [
+        "WerWolv/ImHex",
+        "DrewThomasson/ebook2audiobook",
+        "kovidgoyal/kitty",
+        "Stirling-Tools/Stirling-PDF",
+        "imputnet/cobalt",
+        "fish-shell/fish-shell",
+        "pathwaycom/pathway",
+        "public-apis/public-apis",
+        "MervinPraison/PraisonAI",
+        "ManimCommunity/manim",
+    ]
+    async_settings = {
+        "workers": workers,
+        "per_host": per_host,
+        "retries": retries,
+        "max_rate": max_rate,
+    }
+    try:
+        if retry_failed_scrapes:
+            retry_failed(dataset_path, frontier, **async_settings)
+        else:
+            scrape_repositories(
+                repositories, concurrent, frontier, fetch_mode, processes, **async_settings
+            )
+
+            # scrape_top_repos(500, 4270, concurrent, frontier, fetch_mode, processes, **async_settings)
+    finally:
+        # Flush whatever is still buffered, also when the scraping is interrupted
+        writer.close()
+        metrics.stop_reporter()
+        set_writer(None)
+        incremental_state = None
+        failure_journal = None
 
     # Save the scraped data to the huggingface repo if enabled
     if upload_flag:
+        # Imported here, as loading datasets takes a few seconds, which every worker process would pay for
+        from upload_db import save_to_hf
+
         save_to_hf(hf_repository, dataset_path, hf_token)
 
     end_time = time.time()
@@ -446,6 +962,150 @@ if __name__ == "__main__":
         "--token", "-t", type=str, required=False, help="The HuggingFace API token."
     )
 
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        required=False,
+        default=http_session.DEFAULT_POOL_MAXSIZE,
+        help="The maximum number of keep-alive connections kept open per host.",
+    )
+
+    parser.add_argument(
+        "--retries",
+        type=int,
+        required=False,
+        default=http_session.DEFAULT_RETRIES,
+        help="The number of times a failed request is retried with jittered backoff.",
+    )
+
+    parser.add_argument(
+        "--concurrent",
+        "-c",
+        action="store_true",
+        required=False,
+        help="Toggle whether to use the asynchronous crawl engine instead of scraping page by page.",
+    )
+
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        required=False,
+        default=32,
+        help="The number of concurrent workers of the asynchronous crawl engine.",
+    )
+
+    parser.add_argument(
+        "--per-host",
+        type=int,
+        required=False,
+        default=8,
+        help="The maximum number of concurrent requests per host of the asynchronous crawl engine.",
+    )
+
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        required=False,
+        default=DEFAULT_MAX_RATE,
+        help="The maximum number of requests per second per host (the actual rate adapts to throttling).",
+    )
+
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        required=False,
+        help="Toggle whether to ignore the progress of earlier runs and scrape everything again.",
+    )
+
+    parser.add_argument(
+        "--incremental",
+        "-i",
+        action="store_true",
+        required=False,
+        help="Toggle whether to only fetch the repositories and files that changed since the last run.",
+    )
+
+    parser.add_argument(
+        "--fetch-mode",
+        "-f",
+        type=str,
+        required=False,
+        default=HTML_FETCH_MODE,
+        choices=FETCH_MODES,
+        help="Whether to walk the folder pages (html), download every repository as a single archive (tar/zip) "
+        "or fetch it with git (git).",
+    )
+
+    parser.add_argument(
+        "--parser",
+        "-p",
+        type=str,
+        required=False,
+        default="auto",
+        choices=PARSER_BACKENDS,
+        help="The backend used to extract the directory listings from the pages.",
+    )
+
+    parser.add_argument(
+        "--extra-extensions",
+        "-e",
+        type=str,
+        nargs="*",
+        required=False,
+        default=None,
+        choices=list(EXTRA_EXTENSION_LANGUAGES),
+        help="Also scrape files with these extensions (all of them if none are given).",
+    )
+
+    parser.add_argument(
+        "--processes",
+        "-P",
+        type=int,
+        required=False,
+        default=0,
+        help="The number of worker processes that scrape repositories side by side.",
+    )
+
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Toggle whether to only retry the pages and files that failed in earlier runs (concurrently).",
+    )
+
+    parser.add_argument(
+        "--max-file-size",
+        type=int,
+        required=False,
+        default=file_prefilter.DEFAULT_MAX_FILE_SIZE,
+        help=f"Files of this many bytes or more are not downloaded, {file_prefilter.DEDUP_MAX_FILE_SIZE} matches the "
+        "cutoff of the dedup scripts (0 for no limit, the default).",
+    )
+
+    parser.add_argument(
+        "--repo-byte-budget",
+        type=int,
+        required=False,
+        default=file_prefilter.DEFAULT_REPO_BYTE_BUDGET,
+        help="The maximum number of bytes scraped per repository (0 for no limit).",
+    )
+
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        required=False,
+        default=metrics.DEFAULT_REPORT_INTERVAL,
+        help="The number of seconds between two reports of the throughput and stage latencies (0 to disable them).",
+    )
+
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        required=False,
+        default=metrics.DEFAULT_METRICS_FILE,
+        help="The JSON file the latest throughput and stage latencies are written to.",
+    )
+
     # Parse the arguments
     args = parser.parse_args()
     upload_flag = args.upload
@@ -453,11 +1113,24 @@ if __name__ == "__main__":
     hf_api_token = args.token
     db_path = args.dataset
 
+    set_parser_backend(args.parser)
+    if args.extra_extensions is not None:
+        configure_languages(args.extra_extensions or EXTRA_EXTENSION_LANGUAGES)
+    file_prefilter.configure_prefilter(
+        max_file_size=args.max_file_size, repo_byte_budget=args.repo_byte_budget
+    )
+
+    # All scrape functions share one pooled session
+    http_session.configure_session(pool_maxsize=args.pool_size, retries=args.retries)
+    http_session.configure_rate_limiter(max_rate=args.max_rate)
+
     # Input Validation
     if upload_flag and not hf_api_token:
         raise ValueError(
             "Please specify the HuggingFace API token to upload the dataset."
         )
+    if args.processes > 1 and args.concurrent:
+        raise ValueError("Please use either multiple processes or the concurrent mode.")
 
     # Start scraping
     start_scraping(
@@ -465,4 +1138,16 @@ if __name__ == "__main__":
         dataset_path=db_path,
         hf_token=hf_api_token,
         upload_flag=upload_flag,
+        concurrent=args.concurrent,
+        workers=args.workers,
+        per_host=args.per_host,
+        retries=args.retries,
+        max_rate=args.max_rate,
+        resume=not args.no_resume,
+        incremental=args.incremental,
+        fetch_mode=args.fetch_mode,
+        processes=args.processes,
+        retry_failed_scrapes=args.retry_failed,
+        metrics_interval=args.metrics_interval,
+        metrics_file=args.metrics_file,
     )
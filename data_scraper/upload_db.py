@@ -1,10 +1,18 @@
 import argparse
+import glob
 import logging
 import os
+import sqlite3
+from datetime import date
+from typing import Iterator, List, Optional, Tuple
 
-from datasets import Dataset, Features, Value
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datasets import Features, Value
 from huggingface_hub import HfApi
 
+from blob_store import PAGES_WITH_DATA_QUERY
+
 # Set up logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -13,13 +21,332 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
+DEFAULT_EXPORT_DIR = "hf_export"
+DEFAULT_SHARD_SIZE_MB = 256
+DEFAULT_CHUNK_SIZE = 1000
+# The files export_shards writes to the output folder, nothing else in it is touched
+SHARD_PATTERN = "train-*.parquet"
+TEMP_SHARD_NAME = "shard.parquet.tmp"
+
+# Features for the db table that was set up by default
+context_feat = Features(
+    {
+        "ID": Value(dtype="uint32"),
+        "Repo_Name": Value(dtype="string", id=None),
+        "Branch": Value(dtype="string", id=None),
+        "Path": Value(dtype="string", id=None),
+        "Date_Scraped": Value(dtype="date32", id=None),
+        "Language_ID": Value(dtype="string", id=None),
+        "Blob_Hash": Value(dtype="string", id=None),
+        "Data": Value(dtype="large_string", id=None),
+    }
+)
+
+# Pages are read in order of their ID, continuing after the last ID of the previous chunk (keyset pagination),
+# so every chunk is an index lookup instead of an OFFSET that scans all rows before it
+PAGE_CHUNK_QUERY = PAGES_WITH_DATA_QUERY + " WHERE p.ID > ? AND p.ID <= ? ORDER BY p.ID LIMIT ?;"
+# The largest ID sqlite hands out, used when all pages after an ID are read
+MAX_PAGE_ID = 2**63 - 1
+
+# An exported shard whose ID range holds fewer pages than it was exported with has pages that were scraped again
+# since (they were replaced by a row with a new ID, see page_schema.INSERT_PAGE)
+STALE_SHARDS_QUERY = (
+    "SELECT s.Name, s.First_ID, s.Last_ID FROM EXPORTED_SHARD s WHERE s.HF_Repo = ? AND s.Pages != "
+    "(SELECT COUNT(*) FROM SCRAPED_PAGE p WHERE p.ID BETWEEN s.First_ID AND s.Last_ID);"
+)
+
+
+def setup_export_table(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the table that remembers up to which page every HuggingFace repo was exported, if it does not exist yet.
+    :param cursor: a cursor on the scraper database
+    :return: None
+    """
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS EXPORT_STATE("
+        "HF_Repo        TEXT    PRIMARY KEY NOT NULL,"
+        "Last_ID        INTEGER NOT NULL,"
+        "Updated        TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+        ");"
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS EXPORTED_SHARD("
+        "HF_Repo        TEXT    NOT NULL,"
+        "Name           TEXT    NOT NULL,"
+        "First_ID       INTEGER NOT NULL,"
+        "Last_ID        INTEGER NOT NULL,"
+        "Pages          INTEGER NOT NULL,"
+        "PRIMARY KEY (HF_Repo, Name)"
+        ");"
+    )
+
+
+def get_last_exported_id(dataset_path: str, hf_repo: str) -> int:
+    """
+    :param dataset_path: the path to the scraper database
+    :param hf_repo: the HuggingFace repo the pages were exported to
+    :return: the ID of the last page exported to the repo, or 0 if it was never exported to
+    """
+    connection = sqlite3.connect(dataset_path)
+    try:
+        setup_export_table(connection.cursor())
+        row = connection.execute(
+            "SELECT Last_ID FROM EXPORT_STATE WHERE HF_Repo = ?;", (hf_repo,)
+        ).fetchone()
+    finally:
+        connection.close()
+    return 0 if row is None else row[0]
+
+
+def find_stale_shards(dataset_path: str, hf_repo: str) -> Optional[List[Tuple[str, int, int]]]:
+    """
+    :param dataset_path: the path to the scraper database
+    :param hf_repo: the HuggingFace repo the pages were exported to
+    :return: the name, first and last ID of every shard in the repo that holds pages which were scraped again
+        since, or None if the shards in the repo are not known (it was exported to before they were recorded)
+    """
+    connection = sqlite3.connect(dataset_path)
+    try:
+        setup_export_table(connection.cursor())
+        shards = connection.execute(
+            "SELECT COUNT(*) FROM EXPORTED_SHARD WHERE HF_Repo = ?;", (hf_repo,)
+        ).fetchone()[0]
+        if shards == 0:
+            return None
+        return connection.execute(STALE_SHARDS_QUERY, (hf_repo,)).fetchall()
+    finally:
+        connection.close()
+
+
+def record_export(
+    dataset_path: str,
+    hf_repo: str,
+    last_id: int,
+    shards: List[Tuple[str, int, int, int]],
+    removed_shards: List[str] = (),
+    full_export: bool = False,
+) -> None:
+    """
+    Remembers what was uploaded to a repo, so the next export can continue after it.
+    :param dataset_path: the path to the scraper database
+    :param hf_repo: the HuggingFace repo the pages were exported to
+    :param last_id: the ID of the last page that was exported to the repo
+    :param shards: the (path, first ID, last ID, pages) of every shard that was uploaded (see export_shards)
+    :param removed_shards: the names of the shards that were deleted from the repo
+    :param full_export: toggle whether the uploaded shards replaced all shards in the repo
+    :return: None
+    """
+    connection = sqlite3.connect(dataset_path)
+    try:
+        setup_export_table(connection.cursor())
+        if full_export:
+            connection.execute("DELETE FROM EXPORTED_SHARD WHERE HF_Repo = ?;", (hf_repo,))
+        connection.executemany(
+            "DELETE FROM EXPORTED_SHARD WHERE HF_Repo = ? AND Name = ?;",
+            [(hf_repo, name) for name in removed_shards],
+        )
+        connection.executemany(
+            "INSERT OR REPLACE INTO EXPORTED_SHARD (HF_Repo, Name, First_ID, Last_ID, Pages) "
+            "VALUES (?, ?, ?, ?, ?);",
+            [
+                (hf_repo, os.path.basename(path), first_id, shard_last_id, pages)
+                for path, first_id, shard_last_id, pages in shards
+            ],
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO EXPORT_STATE (HF_Repo, Last_ID) VALUES (?, ?);",
+            (hf_repo, last_id),
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def iter_page_chunks(
+    dataset_path: str,
+    after_id: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    up_to_id: int = MAX_PAGE_ID,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Reads the scraped pages with their content in chunks, so only one chunk is held in memory at a time.
+    :param dataset_path: the path to the scraper database
+    :param after_id: only pages with a higher ID are read
+    :param chunk_size: the amount of pages per chunk
+    :param up_to_id: only pages with this ID or a lower one are read
+    :return: an iterator of record batches, in order of ID
+    """
+    schema = context_feat.arrow_schema
+    connection = sqlite3.connect(dataset_path)
+    try:
+        while True:
+            rows = connection.execute(
+                PAGE_CHUNK_QUERY, (after_id, up_to_id, chunk_size)
+            ).fetchall()
+            if len(rows) == 0:
+                break
+            after_id = rows[-1][0]
+
+            ids, repos, branches, paths, dates, languages, hashes, data = zip(*rows)
+            yield pa.RecordBatch.from_arrays(
+                [
+                    pa.array(ids, pa.uint32()),
+                    pa.array(repos, pa.string()),
+                    pa.array(branches, pa.string()),
+                    pa.array(paths, pa.string()),
+                    # sqlite hands back dates as the 'YYYY-MM-DD' text they were stored as
+                    pa.array(
+                        [None if d is None else date.fromisoformat(d[:10]) for d in dates],
+                        pa.date32(),
+                    ),
+                    pa.array(
+                        [None if lan is None else str(lan) for lan in languages], pa.string()
+                    ),
+                    pa.array(hashes, pa.string()),
+                    pa.array(data, pa.large_string()),
+                ],
+                schema=schema,
+            )
+    finally:
+        connection.close()
+
+
+def export_shards(
+    dataset_path: str,
+    output_dir: str = DEFAULT_EXPORT_DIR,
+    after_id: int = 0,
+    shard_size_mb: int = DEFAULT_SHARD_SIZE_MB,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Tuple[List[Tuple[str, int, int, int]], Optional[int]]:
+    """
+    Writes the scraped pages to Parquet shards, streaming them from the database with constant memory.
+    A shard is closed once the (uncompressed) pages written to it exceed the shard size, and is named after the
+    first and last ID it holds, so shards of later exports never overwrite earlier ones.
+    :param dataset_path: the path to the scraper database
+    :param output_dir: the folder the shards are written to
+    :param after_id: only pages with a higher ID are exported
+    :param shard_size_mb: the amount of (uncompressed) data per shard, in MB
+    :param chunk_size: the amount of pages read from the database at a time
+    :return: the path, first ID, last ID and amount of pages of every written shard, and the ID of the last
+        exported page (None if there were no new pages)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    shard_size = shard_size_mb * 1024 * 1024
+    shards = []
+
+    writer = None
+    temp_path = os.path.join(output_dir, TEMP_SHARD_NAME)
+    first_id = last_id = None
+    written = pages = 0
+
+    def close_shard():
+        writer.close()
+        shard_path = os.path.join(output_dir, shard_name(first_id, last_id))
+        os.replace(temp_path, shard_path)
+        shards.append((shard_path, first_id, last_id, pages))
+        logger.info(f"Wrote shard {shard_path} ({written / (1024 * 1024):.1f} MB uncompressed)")
+
+    for batch in iter_page_chunks(dataset_path, after_id, chunk_size):
+        ids = batch.column(0)
+        if writer is None:
+            writer = pq.ParquetWriter(temp_path, batch.schema)
+            first_id = ids[0].as_py()
+            written = pages = 0
+
+        writer.write_batch(batch)
+        last_id = ids[len(ids) - 1].as_py()
+        written += batch.nbytes
+        pages += batch.num_rows
 
-def save_to_hf(hf_repo: str, dataset_path: str, hf_token: str):
+        if written >= shard_size:
+            close_shard()
+            writer = None
+
+    if writer is not None:
+        close_shard()
+    return shards, last_id
+
+
+def rewrite_shard(
+    dataset_path: str,
+    output_dir: str,
+    first_id: int,
+    last_id: int,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Optional[Tuple[str, int, int, int]]:
+    """
+    Writes an exported shard again with the pages that are still in its ID range, under the same name, so uploading
+    it replaces the shard in the repo. Pages that were scraped again since are left out, their new version has a
+    higher ID and is exported with the new pages.
+    :param dataset_path: the path to the scraper database
+    :param output_dir: the folder the shard is written to
+    :param first_id: the first ID of the shard as it was exported
+    :param last_id: the last ID of the shard as it was exported
+    :param chunk_size: the amount of pages read from the database at a time
+    :return: the path, first ID, last ID and amount of pages of the shard, or None if none of its pages are left
+    """
+    writer = None
+    temp_path = os.path.join(output_dir, TEMP_SHARD_NAME)
+    pages = 0
+    for batch in iter_page_chunks(dataset_path, first_id - 1, chunk_size, up_to_id=last_id):
+        if writer is None:
+            writer = pq.ParquetWriter(temp_path, batch.schema)
+        writer.write_batch(batch)
+        pages += batch.num_rows
+
+    if writer is None:
+        return None
+    writer.close()
+    shard_path = os.path.join(output_dir, shard_name(first_id, last_id))
+    os.replace(temp_path, shard_path)
+    logger.info(f"Rewrote shard {shard_path} with the {pages} pages that were not scraped again")
+    return shard_path, first_id, last_id, pages
+
+
+def shard_name(first_id: int, last_id: int) -> str:
+    """
+    :param first_id: the first ID of the pages in the shard
+    :param last_id: the last ID of the pages in the shard
+    :return: the file name of the shard
+    """
+    return f"train-{first_id:010d}-{last_id:010d}.parquet"
+
+
+def remove_shards(output_dir: str) -> None:
+    """
+    Removes the shards (and the unfinished shard) of an earlier export from the output folder. Only the files
+    export_shards writes are removed, as the folder is given by the user and may hold other files.
+    :param output_dir: the folder the shards are written to
+    :return: None
+    """
+    paths = glob.glob(os.path.join(output_dir, SHARD_PATTERN))
+    paths.append(os.path.join(output_dir, TEMP_SHARD_NAME))
+    for path in paths:
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def save_to_hf(
+    hf_repo: str,
+    dataset_path: str,
+    hf_token: str,
+    since_last_export: bool = False,
+    output_dir: str = DEFAULT_EXPORT_DIR,
+    shard_size_mb: int = DEFAULT_SHARD_SIZE_MB,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+):
     """
     Save the scraped repos to HuggingFace.
+    The pages are exported to Parquet shards on disk first, which are then uploaded to the data folder of the repo.
     :param hf_repo: The HuggingFace repo to upload the dataset to.
     :param dataset_path: The path for the dataset to upload to HuggingFace.
     :param hf_token: The HuggingFace API token.
+    :param since_last_export: Only upload the pages that were added since the last export to the repo, next to
+        the shards already in it. Shards in the repo holding pages that were scraped again since are uploaded again
+        without them. Otherwise, all pages are uploaded and replace the shards in the repo.
+    :param output_dir: The folder the shards are written to before they are uploaded.
+    :param shard_size_mb: The amount of (uncompressed) data per shard, in MB.
+    :param chunk_size: The amount of pages read from the database at a time.
     :return: None
     """
 
@@ -28,29 +355,70 @@ def save_to_hf(hf_repo: str, dataset_path: str, hf_token: str):
     # Set up the HuggingFace API (If token was not provided correctly, this will raise an error)
     api = HfApi(token=hf_token)
 
-    # URI to connect to the created scraped_repos db we set up in the scraper
-    uri = f"sqlite:///{dataset_path}"
-
-    # Features for the db table that was set up by default
-    context_feat = Features(
-        {
-            "ID": Value(dtype="uint32"),
-            "Repo_Name": Value(dtype="string", id=None),
-            "Branch": Value(dtype="string", id=None),
-            "Path": Value(dtype="string", id=None),
-            "Date_Scraped": Value(dtype="date32", id=None),
-            "Language_ID": Value(dtype="string", id=None),
-            "Data": Value(dtype="large_string", id=None),
-        }
+    full_export = not since_last_export
+    after_id = 0
+    stale_shards = []
+    if since_last_export:
+        after_id = get_last_exported_id(dataset_path, hf_repo)
+        stale_shards = find_stale_shards(dataset_path, hf_repo)
+        if stale_shards is None and after_id > 0:
+            # Without the shards of the earlier exports, pages that were scraped again can not be taken out of them
+            logger.warning("The shards in the repo were not recorded, exporting all pages again")
+            full_export = True
+            after_id = 0
+        stale_shards = stale_shards or []
+    logger.info(f"Exporting pages with an ID above {after_id}")
+
+    # Shards of an earlier (failed) export should not be uploaded again
+    remove_shards(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # A page that is scraped again gets a new ID (see page_schema.INSERT_PAGE), so its new version is exported with
+    # the new pages, and the shards holding its old version are replaced without it
+    rewritten_shards, removed_shards = [], []
+    for name, first_id, shard_last_id in stale_shards:
+        shard = rewrite_shard(dataset_path, output_dir, first_id, shard_last_id, chunk_size)
+        if shard is None:
+            removed_shards.append(name)
+        else:
+            rewritten_shards.append(shard)
+
+    # Export the scraped pages with their content from the blob table and then push them to the huggingface repo.
+    # Blob_Hash is exported as well, pages with the same hash are exact duplicates of each other.
+    shards, last_id = export_shards(
+        dataset_path, output_dir, after_id, shard_size_mb, chunk_size
     )
+    if last_id is None and not stale_shards:
+        logger.info("No new pages to save to HuggingFace")
+        return
 
-    # Simply load the scraped pages table from database and then push it to the huggingface repo.
-    ds = Dataset.from_sql(
-        "SCRAPED_PAGE", con=uri, cache_dir="hugCache", features=context_feat
+    api.create_repo(hf_repo, repo_type="dataset", exist_ok=True)
+    api.upload_folder(
+        repo_id=hf_repo,
+        repo_type="dataset",
+        folder_path=output_dir,
+        path_in_repo="data",
+        allow_patterns=SHARD_PATTERN,
+        delete_patterns="*.parquet" if full_export else removed_shards or None,
+        commit_message=(
+            f"Add scraped pages {after_id + 1} to {last_id}"
+            if last_id is not None
+            else f"Replace {len(stale_shards)} shards with pages that were scraped again"
+        ),
     )
 
-    ds.push_to_hub(hf_repo, token=api.token)
-    logger.info("Successfully saved dataset to HuggingFace")
+    # Only remember the export once it is uploaded, so a failed upload is retried by the next export
+    record_export(
+        dataset_path,
+        hf_repo,
+        after_id if last_id is None else last_id,
+        rewritten_shards + shards,
+        removed_shards,
+        full_export,
+    )
+    logger.info(
+        f"Successfully saved {len(shards)} new and {len(stale_shards)} replaced shards to HuggingFace"
+    )
 
 
 if __name__ == "__main__":
@@ -80,6 +448,38 @@ if __name__ == "__main__":
         "--token", "-t", type=str, required=True, help="The HuggingFace API token."
     )
 
+    parser.add_argument(
+        "--since-last-export",
+        "-s",
+        action="store_true",
+        help="Only upload the pages that were added since the last export to the HuggingFace repo.",
+    )
+
+    parser.add_argument(
+        "--output-dir",
+        "-o",
+        type=str,
+        required=False,
+        default=DEFAULT_EXPORT_DIR,
+        help="The folder the Parquet shards are written to before they are uploaded.",
+    )
+
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        required=False,
+        default=DEFAULT_SHARD_SIZE_MB,
+        help="The amount of (uncompressed) data per Parquet shard, in MB.",
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        required=False,
+        default=DEFAULT_CHUNK_SIZE,
+        help="The number of pages read from the database at a time.",
+    )
+
     # Parse the arguments
     args = parser.parse_args()
     hf_repository = args.repo
@@ -92,4 +492,12 @@ if __name__ == "__main__":
     if not os.path.exists(db_path):
         raise ValueError("The dataset path provided does not exist.")
 
-    save_to_hf(hf_repository, db_path, hf_api_token)
+    save_to_hf(
+        hf_repository,
+        db_path,
+        hf_api_token,
+        since_last_export=args.since_last_export,
+        output_dir=args.output_dir,
+        shard_size_mb=args.shard_size,
+        chunk_size=args.chunk_size,
+    )
@@ -0,0 +1,160 @@
+import argparse
+import logging
+import os
+import time
+from typing import Callable, List
+
+import pyarrow as pa
+
+from hashing import HASH_ALGORITHMS, HASHERS, hash_arrow, hash_contents
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(filename)s:%(lineno)d]:  %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+SOURCE_EXTENSIONS = (".py", ".c", ".h", ".cpp", ".hpp", ".java", ".js", ".ts", ".go", ".rs", ".rb", ".cs", ".kt")
+
+
+def read_source_files(path: str, limit: int = 0) -> List[str]:
+    """
+    Reads the source files in a folder and all of its subfolders.
+    :param path: the folder
+    :param limit: the maximum number of files to read (0 for no limit)
+    :return: the content of every source file that is valid utf-8
+    """
+    contents = []
+    for folder, folders, files in os.walk(path):
+        folders[:] = [name for name in folders if not name.startswith(".")]
+        for name in sorted(files):
+            if not name.endswith(SOURCE_EXTENSIONS):
+                continue
+            try:
+                with open(os.path.join(folder, name), encoding="utf-8") as source_file:
+                    contents.append(source_file.read())
+            except (OSError, UnicodeDecodeError):
+                continue
+            if 0 < limit <= len(contents):
+                return contents
+    return contents
+
+
+def read_dataset_files(dataset_name: str, column: str = "content", limit: int = 10000) -> List[str]:
+    """
+    :param dataset_name: the name of a dataset on Hugging Face, which is streamed so only the files used are downloaded
+    :param column: the column holding the content of the files
+    :param limit: the number of files to read
+    :return: the content of the first files of the dataset
+    """
+    from datasets import load_dataset
+
+    dataset = load_dataset(dataset_name, split="train", streaming=True)
+    return [row[column] for row in dataset.take(limit)]
+
+
+def _best_time(function: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_hashers(contents: List[str], repeat: int = 5) -> List[dict]:
+    """
+    Measures how fast every available hash algorithm hashes a set of files, both from Python strings (which are
+    encoded first) and straight from an Arrow column.
+    :param contents: the content of the files
+    :param repeat: the number of runs, of which the fastest one counts
+    :return: the results per algorithm
+    """
+    column = pa.chunked_array([pa.array(contents, type=pa.string())])
+    size = column.chunk(0).buffers()[2].size if len(contents) else 0
+    megabytes = size / (1024 * 1024)
+
+    results = []
+    for algorithm in HASH_ALGORITHMS:
+        if algorithm not in HASHERS:
+            logger.info(f"Skipping {algorithm}, it is not installed")
+            continue
+        strings = _best_time(lambda: hash_contents(contents, algorithm=algorithm), repeat)
+        arrow = _best_time(lambda: hash_arrow(column, algorithm), repeat)
+        results.append(
+            {
+                "algorithm": algorithm,
+                "files": len(contents),
+                "bytes": size,
+                "strings_mb_per_second": megabytes / strings,
+                "arrow_mb_per_second": megabytes / arrow,
+            }
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the speed of the hash algorithms of the exact dedup on real source files."
+    )
+
+    parser.add_argument(
+        "--path",
+        "-p",
+        type=str,
+        required=False,
+        default="..",
+        help="A folder of source files to hash.",
+    )
+
+    parser.add_argument(
+        "--dataset",
+        "-d",
+        type=str,
+        required=False,
+        default=None,
+        help="A dataset on Hugging Face to take the files from instead (i.e. codeparrot/codeparrot-clean).",
+    )
+
+    parser.add_argument(
+        "--limit",
+        "-l",
+        type=int,
+        required=False,
+        default=10000,
+        help="The maximum number of files to hash.",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        "-r",
+        type=int,
+        required=False,
+        default=5,
+        help="The number of runs per algorithm, the fastest one counts.",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Input Validation
+    if args.dataset is None and not os.path.isdir(args.path):
+        raise ValueError("The path provided is not a folder.")
+    if args.repeat < 1:
+        raise ValueError("The number of runs should be at least 1.")
+
+    if args.dataset is not None:
+        files = read_dataset_files(args.dataset, limit=args.limit)
+    else:
+        files = read_source_files(args.path, args.limit)
+    if not files:
+        raise ValueError("No source files were found.")
+
+    for result in benchmark_hashers(files, args.repeat):
+        logger.info(
+            f"{result['algorithm']}: {result['files']} files ({result['bytes'] / (1024 * 1024):.1f} MB), "
+            f"{result['strings_mb_per_second']:.0f} MB/s from strings, "
+            f"{result['arrow_mb_per_second']:.0f} MB/s from Arrow"
+        )
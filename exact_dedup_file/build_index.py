@@ -0,0 +1,250 @@
+import argparse
+import logging
+import os
+import sys
+from typing import Dict, List, Optional
+
+from datasets import Dataset, load_dataset
+from huggingface_hub import HfApi
+
+from digest_index import FUNCTIONS_COLUMN, DigestIndex
+from hashing import (
+    DIGEST_COLUMN,
+    DEFAULT_HASH_ALGORITHM,
+    HASH_ALGORITHMS,
+    NO_NORMALIZATION,
+    NORMALIZATIONS,
+    DEFAULT_BATCH_SIZE,
+    get_hasher,
+    hash_contents,
+    hash_dataset,
+)
+
+# The functions are extracted the same way as by the function level dedup, so their digests match
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "exact_dedup_function"))
+import extract
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(filename)s:%(lineno)d]:  %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+DEFAULT_INDEX_PATH = "codeparrot-clean.digests"
+
+
+def resolve_revision(dataset_name: str, revision: Optional[str] = None) -> Optional[str]:
+    """
+    Looks up the commit a revision of a dataset on Hugging Face points at, so the index is tied to the exact
+    version of the dataset it was built from.
+    :param dataset_name: the name of the dataset on Hugging Face
+    :param revision: a branch, tag or commit (None for the default branch)
+    :return: the commit, or the revision as it was given if the dataset is not on Hugging Face (i.e. a local path)
+    """
+    if os.path.exists(dataset_name):
+        return revision
+    return HfApi().dataset_info(dataset_name, revision=revision).sha
+
+
+def _hash_functions_batch(contents: List[str], normalization: str, algorithm: str) -> Dict[str, List[bytes]]:
+    # The same functions exact_dedup_function/util.py looks up in the index
+    sources = [source for content in contents for source in extract.extract_function_sources(content or "")]
+    return {DIGEST_COLUMN: hash_contents(sources, normalization, algorithm)}
+
+
+def hash_functions(
+    dataset: Dataset,
+    column: str = "content",
+    num_proc: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    normalization: str = NO_NORMALIZATION,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> Dataset:
+    """
+    Extracts the functions from the files of a dataset and hashes each of them, like hashing.hash_dataset does
+    for whole files.
+    :param dataset: the dataset to hash
+    :param column: the column holding the content of the files
+    :param num_proc: the number of processes hashing side by side (None to hash in this process)
+    :param batch_size: the number of files hashed at a time
+    :param normalization: one of hashing.NORMALIZATIONS
+    :param algorithm: one of hashing.HASH_ALGORITHMS
+    :return: a dataset with only the digest column, one row per function
+    """
+    get_hasher(algorithm)
+    return dataset.map(
+        _hash_functions_batch,
+        batched=True,
+        batch_size=batch_size,
+        input_columns=column,
+        fn_kwargs={"normalization": normalization, "algorithm": algorithm},
+        remove_columns=dataset.column_names,
+        num_proc=num_proc,
+        desc="Hashing functions",
+    )
+
+
+def build_index(
+    dataset_name: str,
+    output_path: str,
+    revision: Optional[str] = None,
+    split: str = "train",
+    column: str = "content",
+    normalization: str = NO_NORMALIZATION,
+    num_proc: Optional[int] = None,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+    functions: bool = False,
+) -> DigestIndex:
+    """
+    Hashes a reference dataset once and writes its digests to an index file, which the dedup scripts can open
+    instead of hashing the reference dataset again on every run.
+    :param dataset_name: the name of the dataset on Hugging Face (or a local path)
+    :param output_path: the path of the index file
+    :param revision: the revision of the dataset (a branch, tag or commit, None for the latest one)
+    :param split: the split of the dataset
+    :param column: the column to hash (i.e. 'content' for files, 'repo_name' for repositories)
+    :param normalization: what is done to every value before it is hashed, one of hashing.NORMALIZATIONS
+    :param num_proc: the number of processes hashing side by side
+    :param algorithm: the hash algorithm, one of hashing.HASH_ALGORITHMS
+    :param functions: toggle whether to hash every function in the files of the column instead of the files
+        themselves, for exact_dedup_function/util.py (the index is tagged with the 'functions' column)
+    :return: the index
+    """
+    revision = resolve_revision(dataset_name, revision)
+    dataset = load_dataset(dataset_name, split=split, revision=revision)
+    if functions:
+        logger.info(f"Hashing the functions in the {column} column of {len(dataset)} rows of {dataset_name}")
+        digests = hash_functions(
+            dataset, column, num_proc=num_proc, normalization=normalization, algorithm=algorithm
+        )
+    else:
+        logger.info(f"Hashing the {column} column of {len(dataset)} rows of {dataset_name}")
+        digests = hash_dataset(
+            dataset, column, num_proc=num_proc, normalization=normalization, algorithm=algorithm
+        )
+
+    index = DigestIndex.from_column(
+        digests.data.column(DIGEST_COLUMN), get_hasher(algorithm).digest_size
+    )
+    # Everything a run needs to know to hash its own dataset the same way
+    index.metadata = {
+        "dataset": dataset_name,
+        "revision": revision,
+        "split": split,
+        "column": FUNCTIONS_COLUMN if functions else column,
+        "source_column": column,
+        "rows": len(dataset),
+        "algorithm": algorithm,
+        "normalization": normalization,
+    }
+    index.save(output_path)
+    logger.info(f"Wrote {len(index)} unique digests to {output_path}")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Hash a reference dataset into a digest index file that the dedup scripts can reuse."
+    )
+
+    parser.add_argument(
+        "--dataset",
+        "-d",
+        type=str,
+        required=False,
+        default="codeparrot/codeparrot-clean",
+        help="The reference dataset on Hugging Face.",
+    )
+
+    parser.add_argument(
+        "--revision",
+        type=str,
+        required=False,
+        default=None,
+        help="The revision (branch, tag or commit) of the reference dataset.",
+    )
+
+    parser.add_argument(
+        "--split",
+        type=str,
+        required=False,
+        default="train",
+        help="The split of the reference dataset.",
+    )
+
+    parser.add_argument(
+        "--column",
+        "-c",
+        type=str,
+        required=False,
+        default="content",
+        help="The column to hash (i.e. content, or repo_name for repo_dedup).",
+    )
+
+    parser.add_argument(
+        "--functions",
+        "-f",
+        action="store_true",
+        help="Hash every function in the files of the column instead of the files, for exact_dedup_function.",
+    )
+
+    parser.add_argument(
+        "--normalization",
+        type=str,
+        required=False,
+        default=NO_NORMALIZATION,
+        choices=NORMALIZATIONS,
+        help="What is done to every value before it is hashed.",
+    )
+
+    parser.add_argument(
+        "--algorithm",
+        "-a",
+        type=str,
+        required=False,
+        default=DEFAULT_HASH_ALGORITHM,
+        choices=HASH_ALGORITHMS,
+        help="The hash algorithm (blake3 needs the blake3 package).",
+    )
+
+    parser.add_argument(
+        "--num-proc",
+        "-n",
+        type=int,
+        required=False,
+        default=os.cpu_count(),
+        help="The number of processes hashing the dataset side by side.",
+    )
+
+    parser.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        required=False,
+        default=DEFAULT_INDEX_PATH,
+        help="The path of the index file.",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Input Validation
+    if args.num_proc < 1:
+        raise ValueError("The number of processes should be at least 1.")
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    if not os.path.isdir(output_dir):
+        raise ValueError("The folder of the output path does not exist.")
+
+    build_index(
+        args.dataset,
+        args.output,
+        revision=args.revision,
+        split=args.split,
+        column=args.column,
+        normalization=args.normalization,
+        num_proc=args.num_proc,
+        algorithm=args.algorithm,
+        functions=args.functions,
+    )
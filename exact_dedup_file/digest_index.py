@@ -0,0 +1,211 @@
+import json
+import struct
+from typing import Iterable, Optional, Union
+
+import numpy as np
+import pyarrow as pa
+
+from hashing import DIGEST_SIZE, get_hasher
+
+# An index file starts with the magic bytes, its format version and the length of its metadata, followed by the
+# metadata as json. The digests themselves start at the next multiple of DATA_ALIGNMENT bytes
+INDEX_MAGIC = b"DIGESTIX"
+INDEX_VERSION = 1
+_HEADER = struct.Struct("<8sII")
+DATA_ALIGNMENT = 64
+# The column an index of the functions in the files of a dataset is tagged with (see build_index.py --functions),
+# so it is never mistaken for an index of whole files
+FUNCTIONS_COLUMN = "functions"
+
+
+def digest_array(
+    column: Union[pa.Array, pa.ChunkedArray], digest_size: int = DIGEST_SIZE
+) -> np.ndarray:
+    """
+    Turns an Arrow column of digests (i.e. dataset.data.column(DIGEST_COLUMN)) into a NumPy array of fixed-width
+    byte strings. Every digest has the same size, so the data buffer of each chunk is viewed as it is, without
+    copying a digest into a Python object.
+    :param column: the binary column of digests, without nulls
+    :param digest_size: the size of every digest in bytes
+    :return: an array of dtype S{digest_size}
+    """
+    chunks = column.chunks if isinstance(column, pa.ChunkedArray) else [column]
+    parts = []
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        if chunk.null_count > 0:
+            raise ValueError("The digest column contains nulls")
+
+        if pa.types.is_fixed_size_binary(chunk.type):
+            if chunk.type.byte_width != digest_size:
+                raise ValueError(f"The digests are {chunk.type.byte_width} bytes, not {digest_size}")
+            start = chunk.offset * digest_size
+            data = chunk.buffers()[1]
+        else:
+            offset_type = np.int64 if pa.types.is_large_binary(chunk.type) else np.int32
+            offsets = np.frombuffer(chunk.buffers()[1], dtype=offset_type)
+            start, end = offsets[chunk.offset], offsets[chunk.offset + len(chunk)]
+            if end - start != len(chunk) * digest_size:
+                raise ValueError(f"Not every digest in the column is {digest_size} bytes")
+            data = chunk.buffers()[2]
+
+        parts.append(
+            np.frombuffer(data, dtype=f"S{digest_size}", count=len(chunk), offset=int(start))
+        )
+
+    if not parts:
+        return np.empty(0, dtype=f"S{digest_size}")
+    return np.concatenate(parts)
+
+
+class DigestIndex:
+    """
+    Class used to look up whether files occur in a reference dataset, by the digest of their content.
+    The digests are kept as a sorted array of fixed-width byte strings, which takes digest_size bytes per file
+    (instead of well over 100 bytes for a hex string in a Python set), and a whole batch is looked up at once.
+    """
+
+    def __init__(self, digests: np.ndarray, metadata: Optional[dict] = None):
+        """
+        Constructor for the DigestIndex class.
+        :param digests: an array of dtype S{digest_size}, which has to be sorted and without duplicates (see
+            from_digests to build one from any array)
+        :param metadata: what the digests were computed from (i.e. the dataset, its revision and the
+            normalization), stored along with them in the index file
+        """
+        self.digests = digests
+        self.metadata = dict(metadata or {})
+
+    @classmethod
+    def from_digests(
+        cls, digests: Union[np.ndarray, Iterable[bytes]], digest_size: int = DIGEST_SIZE
+    ) -> "DigestIndex":
+        """
+        :param digests: the digests of the reference files, in any order and with duplicates
+        :param digest_size: the size of every digest in bytes
+        :return: the index of the digests
+        """
+        if not isinstance(digests, np.ndarray):
+            digests = np.fromiter(digests, dtype=f"S{digest_size}")
+        return cls(np.unique(digests))
+
+    @classmethod
+    def from_column(
+        cls, column: Union[pa.Array, pa.ChunkedArray], digest_size: int = DIGEST_SIZE
+    ) -> "DigestIndex":
+        """
+        :param column: the Arrow column of digests of the reference files (see digest_array)
+        :param digest_size: the size of every digest in bytes
+        :return: the index of the digests
+        """
+        return cls.from_digests(digest_array(column, digest_size))
+
+    @property
+    def digest_size(self) -> int:
+        return self.digests.dtype.itemsize
+
+    def __len__(self):
+        return len(self.digests)
+
+    def contains(self, digests: np.ndarray) -> np.ndarray:
+        """
+        Looks up a batch of digests with a binary search each.
+        :param digests: an array of dtype S{digest_size}
+        :return: a boolean array, which is True for every digest that is in the index
+        """
+        if len(self.digests) == 0:
+            return np.zeros(len(digests), dtype=bool)
+        positions = np.searchsorted(self.digests, digests)
+        # Digests larger than every digest in the index end up past its end
+        positions[positions == len(self.digests)] = 0
+        return self.digests[positions] == digests
+
+    def contains_column(self, column: Union[pa.Array, pa.ChunkedArray]) -> np.ndarray:
+        """
+        :param column: an Arrow column of digests (see digest_array)
+        :return: a boolean array, which is True for every digest that is in the index
+        """
+        return self.contains(digest_array(column, self.digest_size))
+
+    def __contains__(self, digest: bytes) -> bool:
+        return bool(self.contains(np.array([digest], dtype=self.digests.dtype))[0])
+
+    def save(self, path: str) -> None:
+        """
+        Writes the index and its metadata to a file.
+        :param path: the path of the file
+        :return: None
+        """
+        metadata = dict(self.metadata, digest_size=self.digest_size, count=len(self))
+        encoded = json.dumps(metadata, sort_keys=True).encode()
+        header = _HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(encoded)) + encoded
+        padding = -len(header) % DATA_ALIGNMENT
+
+        with open(path, "wb") as index_file:
+            index_file.write(header + b"\0" * padding)
+            index_file.write(np.ascontiguousarray(self.digests).data)
+
+    @staticmethod
+    def read_metadata(path: str) -> dict:
+        """
+        :param path: the path of an index file
+        :return: the metadata of the index, without reading its digests
+        """
+        return _read_header(path)[0]
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "DigestIndex":
+        """
+        Opens an index written by save.
+        :param path: the path of the file
+        :param mmap: toggle whether to map the file into memory instead of reading it, so opening it takes no time
+            and only the pages that lookups touch are read
+        :return: the index
+        """
+        metadata, data_offset = _read_header(path)
+        dtype = np.dtype(f"S{metadata['digest_size']}")
+        count = metadata["count"]
+        if count == 0:
+            digests = np.empty(0, dtype=dtype)
+        elif mmap:
+            digests = np.memmap(path, dtype=dtype, mode="r", offset=data_offset, shape=(count,))
+        else:
+            digests = np.fromfile(path, dtype=dtype, count=count, offset=data_offset)
+        return cls(digests, metadata)
+
+
+def open_index(path: str, column: Optional[str] = None) -> DigestIndex:
+    """
+    Maps an index file (see build_index.py) into memory for a dedup run, after checking that it was built the way
+    the run hashes its own dataset. The values of the run should be hashed with the algorithm and normalization in
+    its metadata.
+    :param path: the path of the index file
+    :param column: the kind of column the run hashes (i.e. 'content' or 'repo_name'), None to not check it
+    :return: the index
+    """
+    index = DigestIndex.load(path)
+    # Fails if the algorithm of the index is not available here (i.e. blake3 is not installed)
+    hasher = get_hasher(index.metadata.get("algorithm"))
+    if hasher.digest_size != index.digest_size:
+        raise ValueError(f"The digests of the index are not {hasher.name} digests")
+    if column is not None and index.metadata.get("column") != column:
+        raise ValueError(f"The index was built from the {index.metadata.get('column')} column, not {column}")
+    return index
+
+
+def _read_header(path: str):
+    """
+    :param path: the path of an index file
+    :return: the metadata of the index, and the offset of its digests in the file
+    """
+    with open(path, "rb") as index_file:
+        magic, version, metadata_size = _HEADER.unpack(index_file.read(_HEADER.size))
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a digest index")
+        if version != INDEX_VERSION:
+            raise ValueError(f"Unsupported digest index version: {version}")
+        metadata = json.loads(index_file.read(metadata_size))
+
+    header_size = _HEADER.size + metadata_size
+    return metadata, header_size + (-header_size % DATA_ALIGNMENT)
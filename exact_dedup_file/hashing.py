@@ -0,0 +1,192 @@
+import hashlib
+import re
+from typing import Callable, List, Optional, Union
+
+import numpy as np
+import pyarrow as pa
+import xxhash
+from datasets import Dataset
+
+try:
+    # pip install blake3 (optional, only needed for the blake3 hasher)
+    import blake3
+except ImportError:
+    blake3 = None
+
+# The column the digest of every file is stored in, the raw bytes of the hash of its content
+DIGEST_COLUMN = "content_digest"
+DEFAULT_BATCH_SIZE = 1000
+
+# What is done to the content of a file before it is hashed, files that only differ in what is left out count as
+# duplicates: nothing, the whitespace around the content, or all whitespace (every run of it becomes one space)
+NO_NORMALIZATION = "none"
+STRIP_NORMALIZATION = "strip"
+WHITESPACE_NORMALIZATION = "whitespace"
+NORMALIZATIONS = (NO_NORMALIZATION, STRIP_NORMALIZATION, WHITESPACE_NORMALIZATION)
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class Hasher:
+    """
+    Class used to hash the content of files, a hash algorithm with the size of its digests.
+    """
+
+    def __init__(self, name: str, digest_size: int, digest: Callable[[Union[bytes, memoryview]], bytes]):
+        """
+        Constructor for the Hasher class.
+        :param name: the name of the algorithm, stored in the metadata of an index
+        :param digest_size: the size of every digest in bytes
+        :param digest: computes the raw digest of a buffer (bytes, or a memoryview of an Arrow buffer)
+        """
+        self.name = name
+        self.digest_size = digest_size
+        self.digest = digest
+
+
+XXH3_128_ALGORITHM = "xxh3_128"
+SHA256_ALGORITHM = "sha256"
+BLAKE3_ALGORITHM = "blake3"
+# Dedup only needs to tell contents apart, not to withstand an attacker, so a fast non-cryptographic hash will do.
+# SHA-256 is kept for indexes that were built with it
+DEFAULT_HASH_ALGORITHM = XXH3_128_ALGORITHM
+
+HASHERS = {
+    XXH3_128_ALGORITHM: Hasher(XXH3_128_ALGORITHM, 16, xxhash.xxh3_128_digest),
+    SHA256_ALGORITHM: Hasher(SHA256_ALGORITHM, 32, lambda data: hashlib.sha256(data).digest()),
+}
+if blake3 is not None:
+    HASHERS[BLAKE3_ALGORITHM] = Hasher(BLAKE3_ALGORITHM, 32, lambda data: blake3.blake3(data).digest())
+HASH_ALGORITHMS = (XXH3_128_ALGORITHM, SHA256_ALGORITHM, BLAKE3_ALGORITHM)
+
+DIGEST_SIZE = HASHERS[DEFAULT_HASH_ALGORITHM].digest_size
+
+
+def get_hasher(algorithm: str = DEFAULT_HASH_ALGORITHM) -> Hasher:
+    """
+    :param algorithm: one of HASH_ALGORITHMS
+    :return: the hasher of the algorithm
+    """
+    if algorithm == BLAKE3_ALGORITHM and blake3 is None:
+        raise ValueError("The blake3 hasher needs the blake3 package (pip install blake3)")
+    if algorithm not in HASHERS:
+        raise ValueError(f"Unknown hash algorithm: {algorithm}")
+    return HASHERS[algorithm]
+
+
+def normalize(content: str, normalization: str = NO_NORMALIZATION) -> str:
+    """
+    :param content: the content of a file
+    :param normalization: one of NORMALIZATIONS
+    :return: the content as it is hashed
+    """
+    if normalization == NO_NORMALIZATION:
+        return content
+    if normalization == STRIP_NORMALIZATION:
+        return content.strip()
+    if normalization == WHITESPACE_NORMALIZATION:
+        return _WHITESPACE_PATTERN.sub(" ", content).strip()
+    raise ValueError(f"Unknown normalization: {normalization}")
+
+
+def hash_contents(
+    contents: List[str],
+    normalization: str = NO_NORMALIZATION,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> List[bytes]:
+    """
+    Hashes the content of a batch of files.
+    :param contents: the content of every file (None is hashed as an empty file, like hash_arrow does)
+    :param normalization: one of NORMALIZATIONS
+    :param algorithm: one of HASH_ALGORITHMS
+    :return: the digest of every file
+    """
+    digest = get_hasher(algorithm).digest
+    contents = ["" if content is None else content for content in contents]
+    if normalization != NO_NORMALIZATION:
+        contents = [normalize(content, normalization) for content in contents]
+    return [digest(content.encode()) for content in contents]
+
+
+def hash_arrow(
+    column: Union[pa.Array, pa.ChunkedArray], algorithm: str = DEFAULT_HASH_ALGORITHM
+) -> List[bytes]:
+    """
+    Hashes the content of a batch of files straight from the data buffer of an Arrow string column. Arrow already
+    stores strings as utf-8, so no Python string is created and nothing is encoded or copied before it is hashed.
+    :param column: a string or binary column holding the content of the files (nulls are hashed as empty files)
+    :param algorithm: one of HASH_ALGORITHMS
+    :return: the digest of every file
+    """
+    digest = get_hasher(algorithm).digest
+    chunks = column.chunks if isinstance(column, pa.ChunkedArray) else [column]
+    digests = []
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        large = pa.types.is_large_string(chunk.type) or pa.types.is_large_binary(chunk.type)
+        offsets = np.frombuffer(chunk.buffers()[1], dtype=np.int64 if large else np.int32)
+        offsets = offsets[chunk.offset : chunk.offset + len(chunk) + 1].tolist()
+        data_buffer = chunk.buffers()[2]
+        # The data buffer is left out when every string is empty
+        data = memoryview(b"" if data_buffer is None else data_buffer)
+        digests.extend(digest(data[start:end]) for start, end in zip(offsets, offsets[1:]))
+    return digests
+
+
+def hash_column(
+    column: Union[pa.Array, pa.ChunkedArray],
+    normalization: str = NO_NORMALIZATION,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> pa.Array:
+    """
+    Hashes an Arrow column holding the content of a batch of files, in place unless it has to be normalized.
+    :param column: a string column holding the content of the files
+    :param normalization: one of NORMALIZATIONS
+    :param algorithm: one of HASH_ALGORITHMS
+    :return: a binary column with the digest of every file
+    """
+    if normalization == NO_NORMALIZATION:
+        digests = hash_arrow(column, algorithm)
+    else:
+        digests = hash_contents(column.to_pylist(), normalization, algorithm)
+    return pa.array(digests, type=pa.binary())
+
+
+def _hash_batch(column: pa.ChunkedArray, normalization: str, algorithm: str) -> pa.Table:
+    return pa.table({DIGEST_COLUMN: hash_column(column, normalization, algorithm)})
+
+
+def hash_dataset(
+    dataset: Dataset,
+    column: str = "content",
+    num_proc: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    normalization: str = NO_NORMALIZATION,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> Dataset:
+    """
+    Hashes a column of a dataset in batches, spread over num_proc processes.
+    The batches are handed over as Arrow columns, so without normalization the content is hashed in place (see
+    hash_arrow). Only the digests are written to the cache of the dataset, the content is not copied along with them.
+    :param dataset: the dataset to hash
+    :param column: the column holding the content of the files
+    :param num_proc: the number of processes hashing side by side (None to hash in this process)
+    :param batch_size: the number of files hashed at a time
+    :param normalization: one of NORMALIZATIONS
+    :param algorithm: one of HASH_ALGORITHMS
+    :return: a dataset with only the digest column, in the same order as the dataset
+    """
+    # An unknown or missing algorithm fails here instead of in every worker process
+    get_hasher(algorithm)
+    digests = dataset.with_format("arrow").map(
+        _hash_batch,
+        batched=True,
+        batch_size=batch_size,
+        input_columns=column,
+        fn_kwargs={"normalization": normalization, "algorithm": algorithm},
+        remove_columns=dataset.column_names,
+        num_proc=num_proc,
+        desc="Hashing",
+    )
+    return digests.with_format(None)
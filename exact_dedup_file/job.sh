@@ -14,6 +14,6 @@ module load 2023r1
 module load openmpi
 module load python/3.9.8
 module load py-pip
-python -m pip install --upgrade --user datasets
+python -m pip install --upgrade --user datasets xxhash
 
-python util.py
\ No newline at end of file
+python util.py --num-proc $SLURM_CPUS_PER_TASK
\ No newline at end of file
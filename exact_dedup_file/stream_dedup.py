@@ -0,0 +1,137 @@
+import glob
+import logging
+import os
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datasets import load_dataset
+
+from digest_index import DigestIndex, digest_array
+from hashing import DEFAULT_BATCH_SIZE, DEFAULT_HASH_ALGORITHM, NO_NORMALIZATION, get_hasher, hash_column
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT_DIR = "deduped_shards"
+DEFAULT_SHARD_SIZE_MB = 256
+
+
+def iter_tables(
+    dataset_name: str,
+    split: str = "train",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    columns: Optional[List[str]] = None,
+) -> Iterator[pa.Table]:
+    """
+    Streams a dataset as Arrow tables, so only one batch of files is held in memory at a time and nothing is
+    downloaded to the cache up front.
+    :param dataset_name: the name of the dataset on Hugging Face (or a local path)
+    :param split: the split of the dataset
+    :param batch_size: the number of files per table
+    :param columns: the columns to read (None for all of them)
+    :return: an iterator over the batches of the dataset
+    """
+    dataset = load_dataset(dataset_name, split=split, streaming=True)
+    if columns is not None:
+        dataset = dataset.select_columns(columns)
+    yield from dataset.with_format("arrow").iter(batch_size)
+
+
+def index_stream(
+    dataset_name: str,
+    split: str = "train",
+    column: str = "content",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    normalization: str = NO_NORMALIZATION,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> DigestIndex:
+    """
+    Hashes a reference dataset batch by batch into an index. Only the digests are kept, so the memory it takes
+    grows with the digest size per file instead of with the content.
+    :param dataset_name: the name of the dataset on Hugging Face (or a local path)
+    :param split: the split of the dataset
+    :param column: the column to hash
+    :param batch_size: the number of files hashed at a time
+    :param normalization: one of hashing.NORMALIZATIONS
+    :param algorithm: one of hashing.HASH_ALGORITHMS
+    :return: the index
+    """
+    digest_size = get_hasher(algorithm).digest_size
+    parts = [
+        digest_array(hash_column(table.column(column), normalization, algorithm), digest_size)
+        for table in iter_tables(dataset_name, split, batch_size, [column])
+    ]
+    if not parts:
+        return DigestIndex(np.empty(0, dtype=f"S{digest_size}"))
+    return DigestIndex.from_digests(np.concatenate(parts))
+
+
+def dedup_stream(
+    dataset_name: str,
+    index: DigestIndex,
+    output_dir: str = DEFAULT_OUTPUT_DIR,
+    split: str = "train",
+    column: str = "content",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    shard_size_mb: int = DEFAULT_SHARD_SIZE_MB,
+    normalization: str = NO_NORMALIZATION,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> Tuple[List[str], int, int]:
+    """
+    Removes the files of a dataset that occur in an index, streaming the dataset batch by batch and writing the
+    files that are kept to Parquet shards as it goes. Besides the index, only the current batch and the open row
+    group of the shard are held in memory, however large the dataset is.
+    A shard is closed once the (uncompressed) files written to it exceed the shard size.
+    :param dataset_name: the name of the dataset to deduplicate on Hugging Face (or a local path)
+    :param index: the index of the reference files (i.e. opened with digest_index.open_index)
+    :param output_dir: the folder the shards are written to
+    :param split: the split of the dataset
+    :param column: the column holding the content of the files
+    :param batch_size: the number of files read and hashed at a time
+    :param shard_size_mb: the amount of (uncompressed) data per shard, in MB
+    :param normalization: one of hashing.NORMALIZATIONS, the one the index was built with
+    :param algorithm: one of hashing.HASH_ALGORITHMS, the one the index was built with
+    :return: the paths of the written shards, the number of files read and the number of files kept
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # Shards of an earlier run would otherwise be mixed in with the ones of this run
+    for stale_path in glob.glob(os.path.join(output_dir, "train-*.parquet")):
+        os.remove(stale_path)
+
+    shard_size = shard_size_mb * 1024 * 1024
+    shard_paths = []
+
+    writer = None
+    temp_path = os.path.join(output_dir, "shard.parquet.tmp")
+    read = kept = written = 0
+
+    def close_shard():
+        writer.close()
+        shard_path = os.path.join(output_dir, f"train-{len(shard_paths):05d}.parquet")
+        os.replace(temp_path, shard_path)
+        shard_paths.append(shard_path)
+        logger.info(f"Wrote shard {shard_path} ({written / (1024 * 1024):.1f} MB uncompressed)")
+
+    for table in iter_tables(dataset_name, split, batch_size):
+        digests = hash_column(table.column(column), normalization, algorithm)
+        unique_files = table.filter(pa.array(~index.contains_column(digests)))
+        read += table.num_rows
+        kept += unique_files.num_rows
+        if unique_files.num_rows == 0:
+            continue
+
+        if writer is None:
+            writer = pq.ParquetWriter(temp_path, unique_files.schema)
+            written = 0
+
+        writer.write_table(unique_files)
+        written += unique_files.nbytes
+
+        if written >= shard_size:
+            close_shard()
+            writer = None
+
+    if writer is not None:
+        close_shard()
+    return shard_paths, read, kept
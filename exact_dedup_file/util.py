@@ -1,41 +1,135 @@
-import gc
+import argparse
 import hashlib
+import os
+import numpy as np
 from datasets import load_dataset
 
+from digest_index import DigestIndex, open_index
+from hashing import DEFAULT_HASH_ALGORITHM, DIGEST_COLUMN, NO_NORMALIZATION, hash_dataset
+from stream_dedup import DEFAULT_OUTPUT_DIR, DEFAULT_SHARD_SIZE_MB, dedup_stream, index_stream
+
+TRAINED_DATASET = "codeparrot/codeparrot-clean"
+DATASET_TO_DEDUP = "bwmfvanveen/repo-dedup_razvan_dataset-codeparrot_clean"
+
 def compute_hash_256(message):
     return hashlib.sha256(message.encode()).hexdigest()
 
 if __name__ == "__main__":
-    # Load and hash the trained dataset
-    print("Loading trained dataset...")
-    trained_dataset = load_dataset("codeparrot/codeparrot-clean", split="train")
-    print("Generating hashes for trained dataset...")
-    file_content_hashes_train = {compute_hash_256(content) for content in trained_dataset["content"]}
+    parser = argparse.ArgumentParser(
+        description="Remove the files of a dataset that also occur in the training dataset."
+    )
+
+    parser.add_argument(
+        "--num-proc",
+        "-n",
+        type=int,
+        required=False,
+        default=os.cpu_count(),
+        help="The number of processes hashing the datasets side by side.",
+    )
+
+    parser.add_argument(
+        "--index",
+        "-i",
+        type=str,
+        required=False,
+        default=None,
+        help="A digest index of the trained dataset built with build_index.py, instead of hashing it again.",
+    )
+
+    parser.add_argument(
+        "--streaming",
+        "-s",
+        action="store_true",
+        help="Stream the datasets batch by batch and write the deduplicated files to Parquet shards in --output-dir, "
+        "instead of loading them whole and pushing the result to HuggingFace.",
+    )
+
+    parser.add_argument(
+        "--output-dir",
+        "-o",
+        type=str,
+        required=False,
+        default=DEFAULT_OUTPUT_DIR,
+        help="The folder the Parquet shards are written to in streaming mode.",
+    )
+
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        required=False,
+        default=DEFAULT_SHARD_SIZE_MB,
+        help="The amount of (uncompressed) data per Parquet shard in streaming mode, in MB.",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Input Validation
+    if args.num_proc < 1:
+        raise ValueError("The number of processes should be at least 1.")
+    if args.index is not None and not os.path.exists(args.index):
+        raise ValueError("The index path provided does not exist.")
+    if args.shard_size < 1:
+        raise ValueError("The shard size should be at least 1 MB.")
 
-    # Free memory
-    del trained_dataset
-    gc.collect()
+    if args.index is not None:
+        print("Opening index of trained dataset...")
+        file_content_hashes_train = open_index(args.index, "content")
+        normalization = file_content_hashes_train.metadata["normalization"]
+        algorithm = file_content_hashes_train.metadata["algorithm"]
+    elif args.streaming:
+        # Only the digests of the trained dataset are kept, its content is streamed past
+        print("Streaming and hashing trained dataset...")
+        file_content_hashes_train = index_stream(TRAINED_DATASET)
+        normalization = NO_NORMALIZATION
+        algorithm = DEFAULT_HASH_ALGORITHM
+    else:
+        # Load and hash the trained dataset
+        print("Loading trained dataset...")
+        trained_dataset = load_dataset(TRAINED_DATASET, split="train")
+        print("Generating hashes for trained dataset...")
+        train_digests = hash_dataset(trained_dataset, num_proc=args.num_proc)
+        file_content_hashes_train = DigestIndex.from_column(train_digests.data.column(DIGEST_COLUMN))
+        normalization = NO_NORMALIZATION
+        algorithm = DEFAULT_HASH_ALGORITHM
+    print(f"Indexed {len(file_content_hashes_train)} unique files of the trained dataset")
 
-    # Load dataset to deduplicate
-    print("Loading dataset to deduplicate...")
-    dataset_to_dedup = load_dataset("bwmfvanveen/repo-dedup_razvan_dataset-codeparrot_clean", split="train")
+    if args.streaming:
+        print("Streaming dataset to deduplicate...")
+        shard_paths, dataset_size, unique_files = dedup_stream(
+            DATASET_TO_DEDUP,
+            file_content_hashes_train,
+            args.output_dir,
+            shard_size_mb=args.shard_size,
+            normalization=normalization,
+            algorithm=algorithm,
+        )
+        print(f"Found {unique_files} unique files out of {dataset_size}.")
+        print(f"Wrote {len(shard_paths)} shards to {args.output_dir}")
+    else:
+        # Load dataset to deduplicate
+        print("Loading dataset to deduplicate...")
+        dataset_to_dedup = load_dataset(DATASET_TO_DEDUP, split="train")
 
-    dataset_size = len(dataset_to_dedup)
-    print(f"Starting with {dataset_size} files to deduplicate")
+        dataset_size = len(dataset_to_dedup)
+        print(f"Starting with {dataset_size} files to deduplicate")
 
-    # Filter unique files
-    files_to_keep = [
-        i for i, content in enumerate(dataset_to_dedup["content"])
-        if compute_hash_256(content) not in file_content_hashes_train
-    ]
+        # Filter unique files
+        digests_to_dedup = hash_dataset(
+            dataset_to_dedup, num_proc=args.num_proc, normalization=normalization, algorithm=algorithm
+        )
+        files_to_keep = np.flatnonzero(
+            ~file_content_hashes_train.contains_column(digests_to_dedup.data.column(DIGEST_COLUMN))
+        )
 
-    print(f"Found {len(files_to_keep)} unique files.")
+        print(f"Found {len(files_to_keep)} unique files.")
 
-    # Select and push deduplicated dataset
-    new_dataset = dataset_to_dedup.select(files_to_keep)
-    print("Pushing deduplicated dataset to HuggingFace...")
+        # Select and push deduplicated dataset
+        new_dataset = dataset_to_dedup.select(files_to_keep)
+        print("Pushing deduplicated dataset to HuggingFace...")
 
-    hf_token = "your_token"
-    new_dataset.push_to_hub("nada-mou/ML4SE-exact-dedup-file-final", token=hf_token, private=False)
+        hf_token = "your_token"
+        new_dataset.push_to_hub("nada-mou/ML4SE-exact-dedup-file-final", token=hf_token, private=False)
 
     print("Deduplication complete!")
@@ -38,3 +38,12 @@ def extract_functions(source_code: str, max_depth=1000) -> List[Tuple[str, str]]
     except:
         return [("<RecursionError>")]
     return extractor.functions
+
+
+def extract_function_sources(source_code: str, max_depth=1000) -> List[str]:
+    # extract_functions reports files it can not parse, and functions it can not unparse, as placeholder entries
+    return [
+        entry[1]
+        for entry in extract_functions(source_code, max_depth)
+        if isinstance(entry, tuple) and not entry[0].startswith("<") and not entry[1].startswith("<Error")
+    ]
@@ -1,9 +1,45 @@
+import argparse
 import hashlib
+import os
+import sys
 import extract
+import numpy as np
 from datasets import Dataset, load_dataset
 from huggingface_hub import HfApi
 
+# The digest index of a reference dataset is shared with the file level dedup (see exact_dedup_file/build_index.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "exact_dedup_file"))
+from digest_index import FUNCTIONS_COLUMN, open_index
+from hashing import hash_contents
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Remove the duplicate functions of a dataset."
+    )
+
+    parser.add_argument(
+        "--index",
+        "-i",
+        type=str,
+        required=False,
+        default=None,
+        help="A digest index of the functions of a reference dataset built with build_index.py --functions, "
+        "functions found in it are removed as well.",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Input Validation
+    if args.index is not None and not os.path.exists(args.index):
+        raise ValueError("The index path provided does not exist.")
+
+    reference_index = None
+    if args.index is not None:
+        # An index of whole files would silently match functions against files, so only a functions index is taken
+        reference_index = open_index(args.index, FUNCTIONS_COLUMN)
+        print(f"Opened index of {len(reference_index)} reference functions")
+
     # Load dataset
     dataset = load_dataset("Razvan27/ML4SE-Python", cache_dir="/scratch/zujizhou/ML4SE-Python")
     
@@ -30,8 +66,26 @@ if __name__ == "__main__":
             if i % 100 == 0:
                 print(f"Progress: {i}/{train_size} ({100 * i / train_size:.2f}%)", flush=True)
 
+            # The same functions build_index.py --functions hashes, without the placeholders of unparsable code
+            func_defs = extract.extract_function_sources(content)
+
+            # Functions that already occur in the reference dataset are dropped in one lookup per file
+            if reference_index is not None and func_defs:
+                digests = np.array(
+                    hash_contents(
+                        func_defs,
+                        reference_index.metadata["normalization"],
+                        reference_index.metadata["algorithm"],
+                    ),
+                    dtype=reference_index.digests.dtype,
+                )
+                func_defs = [
+                    func_def for func_def, known in zip(func_defs, reference_index.contains(digests))
+                    if not known
+                ]
+
             deduped_funcs = [
-                func_def for _, func_def in extract.extract_functions(content)
+                func_def for func_def in func_defs
                 if (hash_digest := hashlib.sha256(func_def.encode()).hexdigest()) not in seen_hashes
                 and not seen_hashes.add(hash_digest)
             ]
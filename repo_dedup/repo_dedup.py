@@ -1,19 +1,41 @@
+import argparse
+import os
+import sys
+
+import numpy as np
 from datasets import load_dataset
 from huggingface_hub import HfApi
 
+# The digest index of a reference dataset is shared with the file level dedup (see exact_dedup_file/build_index.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "exact_dedup_file"))
+from digest_index import open_index
+from hashing import DIGEST_COLUMN, hash_dataset
+
 
-def dedup_from_repo(dedup_dataset, dedup_col_name, trained_dataset, trained_col_name, dedup_dataset_name="", trained_dataset_name=""):
-    """Deduplicates a dataset based on repository names from a trained dataset."""
+def dedup_from_repo(dedup_dataset, dedup_col_name, trained_dataset, trained_col_name, dedup_dataset_name="", trained_dataset_name="", index_path=None):
+    """Deduplicates a dataset based on repository names from a trained dataset, or from a digest index of them."""
     
     # Load datasets
     dataset_to_dedup = load_dataset(dedup_dataset)
-    trained_dataset = load_dataset(trained_dataset)
 
-    # Extract repository names from trained dataset
-    used_repo_set = set(trained_dataset["train"][trained_col_name])
+    if index_path is None:
+        trained_dataset = load_dataset(trained_dataset)
+
+        # Extract repository names from trained dataset
+        used_repo_set = set(trained_dataset["train"][trained_col_name])
 
-    # Filter out duplicates
-    valid_list = [i for i, repo_name in enumerate(dataset_to_dedup["train"][dedup_col_name]) if repo_name not in used_repo_set]
+        # Filter out duplicates
+        valid_list = [i for i, repo_name in enumerate(dataset_to_dedup["train"][dedup_col_name]) if repo_name not in used_repo_set]
+    else:
+        # The repository names of the trained dataset were hashed into the index (build_index.py --column repo_name)
+        used_repo_index = open_index(index_path, trained_col_name)
+        digests = hash_dataset(
+            dataset_to_dedup["train"],
+            dedup_col_name,
+            normalization=used_repo_index.metadata["normalization"],
+            algorithm=used_repo_index.metadata["algorithm"],
+        )
+        valid_list = np.flatnonzero(~used_repo_index.contains_column(digests.data.column(DIGEST_COLUMN)))
 
     # Select deduplicated dataset
     new_dataset = dataset_to_dedup["train"].select(valid_list)
@@ -27,13 +49,34 @@ def dedup_from_repo(dedup_dataset, dedup_col_name, trained_dataset, trained_col_
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Remove the files of a dataset from repositories that also occur in the trained dataset."
+    )
+
+    parser.add_argument(
+        "--index",
+        "-i",
+        type=str,
+        required=False,
+        default=None,
+        help="A digest index of the repository names of the trained dataset, instead of loading it.",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Input Validation
+    if args.index is not None and not os.path.exists(args.index):
+        raise ValueError("The index path provided does not exist.")
+
     dedup_from_repo(
         dedup_dataset="Razvan27/ML4SE-Python",
         dedup_col_name="repo_name",
         trained_dataset="codeparrot/codeparrot-clean",
         trained_col_name="repo_name",
         dedup_dataset_name="razvan_dataset",
-        trained_dataset_name="codeparrot_clean"
+        trained_dataset_name="codeparrot_clean",
+        index_path=args.index,
     )
 
     print("Deduplication completed.")